@@ -0,0 +1,94 @@
+"""
+Script para medir recall e latência do índice aproximado (IVF-PQ)
+
+Compara a busca via ANN + re-rank exato com a busca por força bruta na
+mesma galeria, para vários valores de nprobe. Pode usar os modelos reais de
+um diretório ou uma galeria sintética (para simular 100k+ encodings).
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from faceid.gallery import Gallery
+from faceid.model_format import write_model_file
+from faceid.opencv_trainer import PIXEL_FEATURES
+from faceid.registry import ModelRegistry
+
+def build_synthetic_models(model_dir, persons, per_person, dim, seed=0):
+    """Gera modelos sintéticos: cada pessoa é um centro aleatório com ruído"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 255, size=(persons, dim)).astype(np.float32)
+
+    for p in range(persons):
+        encodings = np.clip(centers[p] + rng.normal(0, 40, size=(per_person, dim)), 0, 255).astype(np.uint8)
+        metadata = [{"image_file": f"{i}.jpg"} for i in range(per_person)]
+        write_model_file(os.path.join(model_dir, f"synthetic{p:06d}_model.pkl"), list(encodings), metadata, model_type="opencv")
+
+    return centers
+
+def make_queries(gallery, n_queries, seed=0):
+    """Queries = encodings da galeria com ruído (simula uma nova foto da pessoa)"""
+    rng = np.random.default_rng(seed)
+    encodings = gallery._current_snapshot().encodings
+    rows = rng.choice(len(encodings), min(n_queries, len(encodings)), replace=False)
+    return [np.asarray(encodings[r], dtype=np.float32) + rng.normal(0, 20, size=encodings.shape[1]).astype(np.float32) for r in rows]
+
+def timed_search(gallery, queries, n_candidates):
+    start = time.perf_counter()
+    results = [gallery.search(q, k=1, n_candidates=n_candidates) for q in queries]
+    latency_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+    return results, latency_ms
+
+def ann_report(gallery, n_queries=200, nprobe_values=(1, 2, 4, 8, 16), n_lists=64, n_candidates=100):
+    """Imprime recall@1 e latência média do ANN contra a força bruta"""
+
+    print("📊 RELATÓRIO DO ÍNDICE APROXIMADO (IVF-PQ)")
+    print("=" * 50)
+    print(f"Galeria: {gallery.get_person_count()} pessoas, {gallery.get_face_count()} encodings")
+
+    queries = make_queries(gallery, n_queries)
+    exact, brute_ms = timed_search(gallery, queries, n_candidates)
+    print(f"\n🐢 Força bruta: {brute_ms:.2f} ms/busca")
+
+    start = time.perf_counter()
+    ann = gallery.build_ann(n_lists=n_lists, n_candidates=n_candidates)
+    print(f"🏗️  Índice treinado em {time.perf_counter() - start:.1f}s")
+
+    report = []
+    for nprobe in nprobe_values:
+        ann.nprobe = nprobe
+        approx, ann_ms = timed_search(gallery, queries, n_candidates)
+
+        hits = sum(1 for e, a in zip(exact, approx) if e and a and e[0][0] == a[0][0])
+        recall = hits / max(len(queries), 1)
+        report.append({"nprobe": nprobe, "recall_at_1": recall, "latency_ms": ann_ms})
+
+        print(f"   nprobe={nprobe:>3}: recall@1 {recall:.1%}, {ann_ms:.2f} ms/busca ({brute_ms / ann_ms:.1f}x)")
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall e latência do ANN contra a força bruta")
+    parser.add_argument("--model-dir", default=ModelRegistry("opencv", PIXEL_FEATURES).path,
+                        help="Diretório com os arquivos *_model.pkl (padrão: namespace de pixels do OpenCV)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Gerar uma galeria sintética com N pessoas")
+    parser.add_argument("--per-person", type=int, default=10, help="Encodings por pessoa na galeria sintética")
+    parser.add_argument("--dim", type=int, default=10000, help="Dimensão dos encodings sintéticos")
+    parser.add_argument("--queries", type=int, default=200, help="Número de buscas")
+    parser.add_argument("--lists", type=int, default=64, help="Número de listas do IVF")
+    parser.add_argument("--candidates", type=int, default=100, help="Entradas aproximadas enviadas ao re-rank")
+    parser.add_argument("--nprobe", default="1,2,4,8,16", help="Valores de nprobe separados por vírgula")
+    args = parser.parse_args()
+
+    nprobe_values = [int(v) for v in args.nprobe.split(",")]
+
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as model_dir:
+            build_synthetic_models(model_dir, args.synthetic, args.per_person, args.dim)
+            gallery = Gallery(model_dir)
+            ann_report(gallery, args.queries, nprobe_values, args.lists, args.candidates)
+    else:
+        gallery = Gallery(args.model_dir)
+        ann_report(gallery, args.queries, nprobe_values, args.lists, args.candidates)
@@ -1,10 +1,130 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+import logging
 import os
+import threading
+import time
 from faceid.opencv_trainer import OpenCVFaceTrainer
+from faceid.retrain_queue import RetrainQueue
+from faceid.encode_pool import EncodePool, EncodePoolBusy, EncodePoolError
+from faceid.image_utils import base64_to_bytes
+from faceid.stream_session import InvalidFrame
+from faceid.log import configure_logging
+from faceid.metrics import REGISTRY, REQUEST_SECONDS
+import numpy as np
+
+# Nível do log por LOG_LEVEL (DEBUG mostra distâncias e a duração de cada etapa)
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 trainer = OpenCVFaceTrainer()
 
+# Pronto para receber tráfego só depois do warm-up (ver /health/ready)
+_ready = threading.Event()
+
+def warm_up():
+    """Exercita detector, encoding e galeria uma vez antes de liberar o tráfego.
+    
+    Sob o gunicorn com preload_app roda no master, antes do fork: o estado
+    carregado aqui é compartilhado copy-on-write pelos workers. Threads
+    (fila de retreino, executor do batch) são criadas sob demanda e por
+    isso só nascem dentro de cada worker.
+    """
+    os.makedirs('dataset', exist_ok=True)
+    
+    dummy_frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    trainer.detect_face(dummy_frame)
+    trainer.gallery.min_distances(np.zeros(trainer.encoding_dim, dtype=np.float32))
+    
+    _ready.set()
+    logger.info("Warm-up complete: %d persons in gallery", trainer.gallery.get_person_count())
+
+# Retreinos após um match rodam em background, fora da latência do /verify
+retrain_queue = RetrainQueue(trainer.train_person, maxsize=int(os.environ.get('RETRAIN_QUEUE_SIZE', '100')))
+
+# Máximo de itens aceitos por chamada do /verify/batch
+VERIFY_BATCH_MAX = int(os.environ.get('VERIFY_BATCH_MAX', '32'))
+
+# Máximo de candidatos retornados pelo /identify
+IDENTIFY_MAX_K = int(os.environ.get('IDENTIFY_MAX_K', '50'))
+
+# Sessões de stream (MediaPipe em modo tracking), criadas sob demanda; no
+# gunicorn com vários workers ficam no servidor de sessões (ver gunicorn.conf.py)
+_stream_manager = None
+_stream_lock = threading.Lock()
+
+# Pool de processos para decode -> detecção -> encoding. Desligado por padrão
+# (0): o gunicorn.conf.py liga dividindo as CPUs entre os workers
+ENCODE_POOL_WORKERS = int(os.environ.get('ENCODE_POOL_WORKERS', '0'))
+ENCODE_POOL_QUEUE = int(os.environ.get('ENCODE_POOL_QUEUE', ENCODE_POOL_WORKERS * 4))
+ENCODE_TIMEOUT = float(os.environ.get('ENCODE_TIMEOUT', '10'))
+_encode_pool_lock = threading.Lock()
+
+def start_encode_pool():
+    """Cria o pool de encoding deste processo (idempotente).
+    
+    Sob o gunicorn é chamado no post_fork: processos e threads do pool não
+    podem ser criados no master antes do fork.
+    """
+    if ENCODE_POOL_WORKERS <= 0:
+        return None
+    
+    with _encode_pool_lock:
+        if trainer.encode_pool is None:
+            trainer.encode_pool = EncodePool(
+                projection=trainer.projection,
+                workers=ENCODE_POOL_WORKERS,
+                queue_size=ENCODE_POOL_QUEUE,
+                timeout=ENCODE_TIMEOUT
+            )
+            logger.info("Encode pool started: %d processes, queue %d, timeout %ss", ENCODE_POOL_WORKERS, ENCODE_POOL_QUEUE, ENCODE_TIMEOUT)
+    
+    return trainer.encode_pool
+
+@app.before_request
+def ensure_encode_pool():
+    if trainer.encode_pool is None and ENCODE_POOL_WORKERS > 0:
+        start_encode_pool()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    """Duração da requisição por rota (o template, não a URL) e status"""
+    start = g.get('request_start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, endpoint, str(response.status_code))
+    
+    # Com FACEID_METRICS_DIR, publica periodicamente o snapshot deste worker para o /metrics dos outros
+    REGISTRY.start_flusher()
+    return response
+
+def encode_pool_error_response(error):
+    """Fila do pool cheia ou pool recriado -> 503 (tente de novo); imagem não processada no tempo -> 504"""
+    status = 503 if isinstance(error, EncodePoolBusy) else 504
+    response = jsonify({'error': str(error)})
+    if status == 503:
+        response.headers['Retry-After'] = '1'
+    return response, status
+
+def get_stream_manager():
+    """Gerenciador de sessões de stream: o do servidor de sessões, se houver, ou um local.
+    
+    O MediaPipe só é importado no primeiro uso.
+    """
+    global _stream_manager
+    
+    with _stream_lock:
+        if _stream_manager is None:
+            from faceid.stream_session import connect_stream_server, create_stream_manager
+            
+            _stream_manager = connect_stream_server() or create_stream_manager()
+    
+    return _stream_manager
+
 @app.route('/', methods=['GET'])
 def health():
     """Endpoint de health check"""
@@ -13,9 +133,40 @@ def health():
         'service': 'Face Recognition API',
         'version': '1.0.0',
         'port': 3000,
-        'endpoints': ['/register', '/verify']
+        'endpoints': ['/register', '/verify', '/verify/batch', '/verify/stream', '/identify', '/cache/stats', '/metrics']
+    })
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness: o processo está de pé e respondendo"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness: modelos carregados e aquecidos; antes disso retorna 503"""
+    if not _ready.is_set():
+        return jsonify({'status': 'warming_up'}), 503
+    
+    return jsonify({
+        'status': 'ready',
+        'persons': trainer.gallery.get_person_count(),
+        'pid': os.getpid(),
+        'encode_pool': trainer.encode_pool.stats() if trainer.encode_pool is not None else None
+    })
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Contadores do cache de imagens deste worker (para ajustar FACEID_IMAGE_CACHE_SIZE / TTL)"""
+    return jsonify({
+        'image_cache': trainer.image_cache.stats() if trainer.image_cache is not None else None,
+        'pid': os.getpid()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Histogramas de latência por etapa e por rota, no formato de texto do Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/register', methods=['POST'])
 def register():
     try:
@@ -42,9 +193,65 @@ def register():
             'images_saved': len(saved_images)
         })
         
+    except EncodePoolError as e:
+        return encode_pool_error_response(e)
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def build_verification_result(person_id, image_base64, is_match, similarity):
+    """Monta a resposta do /verify e, em caso de match, salva a imagem e agenda o retreino"""
+    if is_match:
+        # ✅ MATCH CONFIRMADO - Salvar imagem e agendar retreino
+        logger.debug("Match confirmado para %s - salvando imagem e agendando retreino", person_id)
+        
+        # Salvar a nova imagem na pasta da pessoa (com o pool saturado, o match vale mas a imagem não é salva)
+        try:
+            saved_images = trainer.save_base64_images(person_id, [image_base64])
+        except EncodePoolError as e:
+            logger.warning("Imagem não salva para %s: %s", person_id, e)
+            saved_images = []
+        
+        if saved_images:
+            logger.debug("Imagem salva: %s", saved_images[0])
+            
+            # Retreinar em background (pedidos repetidos da mesma pessoa são agrupados)
+            retrain_status = retrain_queue.submit(person_id)
+            logger.debug("Retreinamento %s", retrain_status)
+        else:
+            logger.warning("Falha ao salvar imagem para %s", person_id)
+            retrain_status = None
+        
+        # Calcular confiança como porcentagem
+        confidence = max(0, (1 - similarity) * 100) if similarity <= 1 else max(0, 100 - (similarity * 0.01))
+        
+        return {
+            'match': True,
+            'similarity': float(similarity),
+            'confidence': float(confidence),
+            'person_id': person_id,
+            'retrained': False,
+            'retrain_queued': retrain_status in (RetrainQueue.QUEUED, RetrainQueue.COALESCED),
+            'retrain_status': retrain_status,
+            'images_saved': len(saved_images) if saved_images else 0,
+            'verification_method': trainer.verification_method
+        }
+    else:
+        # ❌ NO MATCH - Não salvar nem retreinar
+        logger.debug("No match para %s - similaridade: %s", person_id, similarity)
+        
+        confidence = max(0, (1 - similarity) * 100) if similarity <= 1 else max(0, 100 - (similarity * 0.01))
+        
+        return {
+            'match': False,
+            'similarity': float(similarity),
+            'confidence': float(confidence),
+            'person_id': person_id,
+            'retrained': False,
+            'retrain_queued': False,
+            'verification_method': trainer.verification_method
+        }
+
 @app.route('/verify', methods=['POST'])
 def verify():
     try:
@@ -58,56 +265,150 @@ def verify():
         # Verificar com OpenCV Trainer
         is_match, similarity = trainer.verify_face(person_id, image_base64)
         
-        if is_match:
-            # ✅ MATCH CONFIRMADO - Salvar imagem e retreinar
-            print(f"✅ Match confirmado para {person_id} - salvando imagem e retreinando...")
-            
-            # Salvar a nova imagem na pasta da pessoa
-            saved_images = trainer.save_base64_images(person_id, [image_base64])
-            
-            if saved_images:
-                print(f"📁 Imagem salva: {saved_images[0]}")
-                
-                # Retreinar o modelo com a nova imagem
-                retrain_success = trainer.train_person(person_id)
-                print(f"🎯 Retreinamento {'bem-sucedido' if retrain_success else 'falhou'}")
-            else:
-                print(f"⚠️ Falha ao salvar imagem para {person_id}")
-                retrain_success = False
-            
-            # Calcular confiança como porcentagem
-            confidence = max(0, (1 - similarity) * 100) if similarity <= 1 else max(0, 100 - (similarity * 0.01))
-            
-            return jsonify({
-                'match': True,
-                'similarity': float(similarity),
-                'confidence': float(confidence),
-                'person_id': person_id,
-                'retrained': retrain_success,
-                'images_saved': len(saved_images) if saved_images else 0,
-                'verification_method': 'OpenCV LBPH'
-            })
-        else:
-            # ❌ NO MATCH - Não salvar nem retreinar
-            print(f"❌ No match para {person_id} - similaridade: {similarity}")
-            
-            confidence = max(0, (1 - similarity) * 100) if similarity <= 1 else max(0, 100 - (similarity * 0.01))
-            
-            return jsonify({
-                'match': False,
-                'similarity': float(similarity),
-                'confidence': float(confidence),
-                'person_id': person_id,
-                'retrained': False,
-                'verification_method': 'OpenCV LBPH'
-            })
+        return jsonify(build_verification_result(person_id, image_base64, is_match, similarity))
             
     except FileNotFoundError:
         return jsonify({'error': f'Person {person_id} not found. Please register first.'}), 404
         
+    except EncodePoolError as e:
+        return encode_pool_error_response(e)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/verify/batch', methods=['POST'])
+def verify_batch():
+    try:
+        data = request.get_json()
+        items = data.get('items') if data else None
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list of {person_id, image_base64}'}), 400
+        
+        if len(items) > VERIFY_BATCH_MAX:
+            return jsonify({'error': f'At most {VERIFY_BATCH_MAX} items per batch'}), 400
+        
+        # Itens inválidos recebem erro próprio sem derrubar o lote inteiro
+        valid = [
+            i for i, item in enumerate(items)
+            if isinstance(item, dict) and item.get('person_id') and item.get('image_base64')
+        ]
+        
+        # Decodificação/detecção em paralelo e um único produto de matrizes contra a galeria
+        verified = trainer.verify_faces_batch([(items[i]['person_id'], items[i]['image_base64']) for i in valid])
+        verified_by_index = dict(zip(valid, verified))
+        
+        results = []
+        for i, item in enumerate(items):
+            if i not in verified_by_index:
+                person_id = item.get('person_id') if isinstance(item, dict) else None
+                results.append({'person_id': person_id, 'error': 'person_id and image_base64 are required'})
+                continue
+            
+            is_match, similarity = verified_by_index[i]
+            results.append(build_verification_result(item['person_id'], item['image_base64'], is_match, similarity))
+        
+        return jsonify({'results': results})
+        
+    except EncodePoolError as e:
+        return encode_pool_error_response(e)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/verify/stream', methods=['POST'])
+def verify_stream():
+    """Verificação por sessão: envie os frames da câmera em sequência com o mesmo session_id"""
+    try:
+        data = request.get_json()
+        session_id = data.get('session_id')
+        person_id = data.get('person_id')
+        image_base64 = data.get('image_base64')
+        
+        if not image_base64 or not (session_id or person_id):
+            return jsonify({'error': 'image_base64 and person_id (new session) or session_id are required'}), 400
+        
+        # Os bytes comprimidos vão para o servidor de sessões, que decodifica o frame
+        image_data = base64_to_bytes(image_base64)
+        if image_data is None:
+            return jsonify({'error': 'Failed to decode image'}), 400
+        
+        manager = get_stream_manager()
+        
+        if session_id:
+            result = manager.step(session_id, image_data)
+            if result is None:
+                return jsonify({'error': f'Session {session_id} not found or expired'}), 404
+        else:
+            result = manager.start(person_id, image_data)
+            if result is None:
+                return jsonify({'error': 'Too many active stream sessions'}), 503
+        
+        result['verification_method'] = 'MediaPipe tracking'
+        
+        return jsonify(result)
+        
+    except InvalidFrame as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/verify/stream/<session_id>', methods=['DELETE'])
+def close_stream(session_id):
+    # Sem servidor de sessões e sem gerenciador local ainda, nenhuma sessão existe
+    if _stream_manager is None and not os.environ.get('STREAM_SERVER_ADDRESS'):
+        summary = None
+    else:
+        summary = get_stream_manager().finish(session_id)
+    
+    if summary is None:
+        return jsonify({'error': f'Session {session_id} not found or expired'}), 404
+    
+    return jsonify(summary)
+
+@app.route('/identify', methods=['POST'])
+def identify():
+    try:
+        data = request.get_json()
+        image_base64 = data.get('image_base64')
+        
+        if not image_base64:
+            return jsonify({'error': 'image_base64 is required'}), 400
+        
+        try:
+            k = int(data.get('k', 5))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'k must be an integer'}), 400
+        
+        if k < 1 or k > IDENTIFY_MAX_K:
+            return jsonify({'error': f'k must be between 1 and {IDENTIFY_MAX_K}'}), 400
+        
+        # Identificação 1:N contra toda a galeria (sem salvar nem retreinar)
+        person_id, similarity, candidates = trainer.identify_face(image_base64, k=k)
+        
+        confidence = max(0, (1 - similarity) * 100) if similarity <= 1 else max(0, 100 - (similarity * 0.01))
+        
+        return jsonify({
+            'match': person_id is not None,
+            'person_id': person_id,
+            'similarity': float(similarity),
+            'confidence': float(confidence),
+            'candidates': [
+                {'person_id': candidate_id, 'distance': distance}
+                for candidate_id, distance in candidates
+            ],
+            'verification_method': trainer.verification_method
+        })
+        
+    except EncodePoolError as e:
+        return encode_pool_error_response(e)
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    os.makedirs('dataset', exist_ok=True)
-    app.run(debug=True, host='0.0.0.0', port=3000)
+    # Servidor de desenvolvimento; em produção use o gunicorn (wsgi.py)
+    warm_up()
+    start_encode_pool()
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', host='0.0.0.0', port=3000)
@@ -0,0 +1,321 @@
+"""
+Benchmark reprodutível dos caminhos quentes do /verify e do /register
+
+Gera um dataset sintético (N pessoas x M fotos, rostos desenhados que o Haar
+cascade detecta) num diretório temporário e mede throughput e latência
+p50/p95/p99 de:
+
+    extract_face_encoding   (OpenCV e MediaPipe)
+    FaceModel.identify_face (todos os encodings da galeria num modelo)
+    verify_face             (OpenCV e MediaPipe)
+    train_person            (OpenCV e MediaPipe, retreino completo)
+    POST /verify e /register pelo test client do Flask (ponta a ponta)
+
+A galeria do OpenCV pode ser inflada com pessoas só de encodings
+(--gallery-persons) para simular cadastros grandes sem gerar milhares de
+fotos. O resultado vai para um JSON (com o commit atual) para comparar
+versões; --baseline mostra a variação contra um JSON anterior. Roda offline,
+só com CPU, e não toca no dataset/ nem nos modelos do diretório atual.
+
+Uso:
+    python benchmark.py
+    python benchmark.py --persons 50 --images 5 --gallery-persons 5000 --output bench.json
+    python benchmark.py --backends opencv --baseline bench_main.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import cv2
+import numpy as np
+from faceid.log import configure_logging
+
+BACKENDS = ("opencv", "mediapipe")
+
+def summarize(latencies, total_seconds):
+    """Latências (s) -> throughput e percentis em ms"""
+    ms = np.asarray(latencies) * 1000
+    return {
+        "n": len(latencies),
+        "throughput_per_s": len(latencies) / total_seconds if total_seconds > 0 else 0.0,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+def measure(fn, inputs, repeat=1, warmup=2):
+    """Chama fn(x) para cada entrada (repeat vezes), depois de `warmup` chamadas descartadas"""
+    for x in inputs[:warmup]:
+        fn(x)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for x in inputs:
+            t = time.perf_counter()
+            fn(x)
+            latencies.append(time.perf_counter() - t)
+
+    return summarize(latencies, time.perf_counter() - start)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def to_base64(image_rgb):
+    ok, buffer = cv2.imencode(".jpg", cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return base64.b64encode(buffer.tobytes()).decode()
+
+def pad_gallery(gallery, persons, per_person, dim, dtype, seed=0):
+    """Pessoas extras só com encodings (centro aleatório + ruído), direto na galeria em memória"""
+    rng = np.random.default_rng(seed)
+    padding = {}
+
+    for p in range(persons):
+        if dtype == np.uint8:
+            center = rng.uniform(0, 255, size=dim)
+            encodings = np.clip(center + rng.normal(0, 40, size=(per_person, dim)), 0, 255).astype(np.uint8)
+        else:
+            center = rng.normal(0, 1, size=dim)
+            encodings = (center + rng.normal(0, 0.3, size=(per_person, dim))).astype(np.float32)
+        padding[f"padding{p:06d}"] = (encodings, None)
+
+    # Uma única atualização da galeria para todas as pessoas extras
+    gallery.update_persons(padding)
+
+def match_rate(trainer, probes):
+    """Fração das consultas verificadas como a própria pessoa (sanidade do dataset sintético)"""
+    matches = sum(bool(trainer.verify_face(person_id, image_base64)[0]) for person_id, _, image_base64 in probes)
+    return matches / len(probes)
+
+def run_opencv(results, faces, probes, args):
+    from faceid.model import FaceModel
+    from faceid.opencv_trainer import OpenCVFaceTrainer
+
+    trainer = OpenCVFaceTrainer()
+    person_ids = list(faces)
+
+    print("⏱️  OpenCV: train_person")
+    results["opencv.train_person"] = measure(
+        lambda p: trainer.train_person(p, incremental=False), person_ids, warmup=0
+    )
+
+    if args.gallery_persons:
+        dtype = np.uint8 if trainer.projection is None else np.float32
+        pad_gallery(trainer.gallery, args.gallery_persons, args.images, trainer.encoding_dim, dtype, args.seed)
+    print(f"   galeria: {trainer.gallery.get_person_count()} pessoas, {trainer.gallery.get_face_count()} encodings")
+
+    print("⏱️  OpenCV: extract_face_encoding")
+    results["opencv.extract_face_encoding"] = measure(
+        trainer.extract_face_encoding, [image for _, image, _ in probes], args.repeat
+    )
+
+    print("⏱️  OpenCV: FaceModel.identify_face")
+    model = FaceModel(None)
+    for person_id in trainer.gallery.get_person_ids():
+        for encoding in trainer.gallery.get_encodings(person_id):
+            model.add_face(encoding, {"person_id": person_id})
+    encodings = [trainer.extract_face_encoding(image) for _, image, _ in probes]
+    results["opencv.identify_face"] = measure(
+        model.identify_face, [e for e in encodings if e is not None], args.repeat
+    )
+
+    print("⏱️  OpenCV: verify_face")
+    results["opencv.verify_face"] = measure(
+        lambda probe: trainer.verify_face(probe[0], probe[2]), probes, args.repeat
+    )
+
+    results["opencv.verify_face"]["match_rate"] = match_rate(trainer, probes)
+
+def run_mediapipe(results, faces, probes, args):
+    try:
+        from faceid.mediapipe_trainer import MediaPipeFaceTrainer
+    except ImportError as e:
+        print(f"⚠️  MediaPipe indisponível, pulando: {e}")
+        results["mediapipe"] = {"skipped": str(e)}
+        return
+
+    trainer = MediaPipeFaceTrainer()
+
+    print("⏱️  MediaPipe: train_person")
+    results["mediapipe.train_person"] = measure(
+        lambda p: trainer.train_person(p, incremental=False), list(faces), warmup=0
+    )
+
+    print("⏱️  MediaPipe: extract_face_encoding")
+    results["mediapipe.extract_face_encoding"] = measure(
+        trainer.extract_face_encoding, [image for _, image, _ in probes], args.repeat
+    )
+
+    print("⏱️  MediaPipe: verify_face")
+    results["mediapipe.verify_face"] = measure(
+        lambda probe: trainer.verify_face(probe[0], probe[2]), probes, args.repeat
+    )
+    results["mediapipe.verify_face"]["match_rate"] = match_rate(trainer, probes)
+
+def run_flask(results, faces, probes, args):
+    """Ponta a ponta pelo test client: JSON, base64, pool de encoding e resposta"""
+    import api_opencv
+
+    client = api_opencv.app.test_client()
+    api_opencv.warm_up()
+
+    def verify(probe):
+        response = client.post("/verify", json={"person_id": probe[0], "image_base64": probe[2]})
+        assert response.status_code == 200, response.get_json()
+
+    print("⏱️  Flask: POST /verify")
+    results["flask.verify"] = measure(verify, probes, args.repeat)
+    results["flask.verify"]["encode_pool_workers"] = api_opencv.ENCODE_POOL_WORKERS
+
+    # Cada /register cria uma pessoa nova com as fotos de uma pessoa sintética
+    registrations = [
+        (f"register{i:05d}", [to_base64(image) for image in faces[person_id]])
+        for i, person_id in enumerate(list(faces) * args.repeat)
+    ]
+
+    def register(item):
+        response = client.post("/register", json={"person_id": item[0], "image_base64": item[1]})
+        assert response.status_code == 200, response.get_json()
+
+    print("⏱️  Flask: POST /register")
+    results["flask.register"] = measure(register, registrations, warmup=0)
+
+    # Retreinos agendados pelos matches do /verify não podem ficar rodando no fim
+    api_opencv.retrain_queue.join()
+    if api_opencv.trainer.encode_pool is not None:
+        api_opencv.trainer.encode_pool.close()
+
+def stage_summary():
+    """Média e contagem de cada etapa registrada nos histogramas de faceid.metrics"""
+    from faceid.metrics import STAGE_SECONDS
+
+    stages = {}
+    for labels, counts, total in STAGE_SECONDS.snapshot()["series"]:
+        n = sum(counts)
+        stages[labels[0]] = {"n": n, "mean_ms": total * 1000 / n if n else 0.0}
+    return stages
+
+def print_results(results, baseline=None):
+    print("\n📊 RESULTADOS (ms)")
+    print(f"{'benchmark':<34}{'p50':>9}{'p95':>9}{'p99':>9}{'ops/s':>10}")
+
+    for name, result in results.items():
+        if "p50_ms" not in result:
+            continue
+        line = f"{name:<34}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['throughput_per_s']:>10.1f}"
+
+        old = (baseline or {}).get(name)
+        if old and old.get("p50_ms"):
+            line += f"   p50 {result['p50_ms'] / old['p50_ms'] - 1:+.1%}, p99 {result['p99_ms'] / old['p99_ms'] - 1:+.1%}"
+        print(line)
+
+def run_benchmark(args):
+    from faceid.synthetic import synthetic_faces, write_synthetic_dataset
+
+    # Só fotos em que o Haar cascade acha um rosto: o benchmark mede o caminho com rosto
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    detect = lambda image: len(cascade.detectMultiScale(cv2.cvtColor(image, cv2.COLOR_RGB2GRAY), 1.3, 5)) > 0
+
+    print(f"🧪 Gerando {args.persons} pessoas x {args.images} fotos (+{args.probes} consultas cada, seed {args.seed})")
+    faces = synthetic_faces(args.persons, args.images + args.probes, args.seed, accept=detect)
+
+    # As últimas fotos de cada pessoa ficam fora do dataset e viram consultas
+    probes = [
+        (person_id, image, to_base64(image))
+        for person_id, images in faces.items() for image in images[args.images:]
+    ]
+    faces = {person_id: images[:args.images] for person_id, images in faces.items() if images[:args.images]}
+    write_synthetic_dataset("dataset", faces)
+
+    results = {}
+    if "opencv" in args.backends:
+        run_opencv(results, faces, probes, args)
+    if "mediapipe" in args.backends:
+        run_mediapipe(results, faces, probes, args)
+    if "opencv" in args.backends and not args.skip_flask:
+        run_flask(results, faces, probes, args)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "config": {
+            "persons": args.persons,
+            "images": args.images,
+            "probes": len(probes),
+            "gallery_persons": args.gallery_persons,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "backends": list(args.backends),
+            "matcher": os.environ.get("FACEID_MATCHER", "pixels"),
+            "projection": os.environ.get("FACEID_PROJECTION"),
+        },
+        "results": results,
+        "stages": stage_summary(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos de verificação e cadastro")
+    parser.add_argument("--persons", type=int, default=20, help="Pessoas com fotos no dataset sintético")
+    parser.add_argument("--images", type=int, default=5, help="Fotos de cadastro por pessoa")
+    parser.add_argument("--probes", type=int, default=2, help="Fotos de consulta por pessoa (fora do dataset)")
+    parser.add_argument("--gallery-persons", type=int, default=0,
+                        help="Pessoas extras só com encodings na galeria do OpenCV (simula galerias grandes)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passadas sobre as consultas")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="opencv,mediapipe")
+    parser.add_argument("--projection", default=None, help="Arquivo .npz de projeção a usar (padrão: nenhuma)")
+    parser.add_argument("--skip-flask", action="store_true", help="Não medir /verify e /register ponta a ponta")
+    parser.add_argument("--output", default="benchmark.json", help="Arquivo JSON de saída")
+    parser.add_argument("--baseline", default=None, help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+    args.backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    # Log só de avisos: formatar e escrever log não deve entrar na latência medida
+    configure_logging(os.environ.get("LOG_LEVEL", "WARNING"))
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    # Dataset, modelos e projeção isolados num diretório temporário
+    for name in ("FACEID_PROJECTION", "FACEID_GALLERY_STORE", "FACEID_LBPH_FILE", "FACEID_METRICS_DIR"):
+        os.environ.pop(name, None)
+    if args.projection:
+        os.environ["FACEID_PROJECTION"] = os.path.abspath(args.projection)
+    # Consultas repetidas seriam acertos do cache de imagens
+    os.environ["FACEID_IMAGE_CACHE_SIZE"] = "0"
+
+    workdir = tempfile.mkdtemp(prefix="faceid-bench-")
+    os.environ["FACEID_MODELS_DIR"] = os.path.join(workdir, "models")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    try:
+        report = run_benchmark(args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(report["results"], baseline)
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Resultados salvos em {output}")
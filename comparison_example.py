@@ -5,6 +5,7 @@ Este exemplo mostra como usar ambas as implementações e suas diferenças.
 """
 
 import base64
+from faceid.log import configure_logging
 from faceid.opencv_trainer import OpenCVFaceTrainer
 from faceid.mediapipe_trainer import MediaPipeFaceTrainer
 
@@ -150,6 +151,8 @@ def recommendations():
     print("   • Combine resultados para máxima confiabilidade")
 
 if __name__ == "__main__":
+    configure_logging()
+    
     # Executar comparação
     opencv_trainer, mediapipe_trainer = compare_face_recognition_systems()
     
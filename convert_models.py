@@ -0,0 +1,72 @@
+"""
+Script para converter modelos antigos (pickle) para o formato binário
+
+Reescreve cada *_model.pkl que ainda está em pickle no novo formato
+versionado (header + bloco de encodings + tabela de metadados), em todos os
+namespaces do diretório de modelos. Modelos já convertidos são ignorados,
+então o script pode ser executado mais de uma vez. (Modelos legados do
+diretório de trabalho são importados para models/ pelos próprios trainers,
+já no formato binário.)
+"""
+
+import argparse
+import os
+import shutil
+import numpy as np
+from faceid.model_format import is_binary_model, read_model_file, write_model_file
+from faceid.registry import MODEL_SUFFIX, models_root
+
+def infer_model_type(data):
+    """Modelos OpenCV antigos não gravavam o tipo; encodings uint8 indicam OpenCV"""
+    if data.get("model_type"):
+        return data["model_type"]
+
+    encodings = data["encodings"]
+    if len(encodings) and np.asarray(encodings[0]).dtype == np.uint8:
+        return "opencv"
+    return None
+
+def convert_models(model_dir=None, backup=False):
+    """Converte todos os modelos legados do diretório (e subdiretórios)"""
+
+    print("🔄 CONVERSÃO DE MODELOS PARA FORMATO BINÁRIO")
+    print("=" * 50)
+
+    model_dir = model_dir or models_root()
+    model_files = sorted(
+        os.path.relpath(os.path.join(root, f), model_dir)
+        for root, _, files in os.walk(model_dir) for f in files if f.endswith(MODEL_SUFFIX)
+    )
+    converted = 0
+
+    for model_file in model_files:
+        model_path = os.path.join(model_dir, model_file)
+
+        if is_binary_model(model_path):
+            print(f"   ⏭️  {model_file}: já está no formato binário")
+            continue
+
+        try:
+            data = read_model_file(model_path)
+            model_type = infer_model_type(data)
+
+            if backup:
+                shutil.copy2(model_path, model_path + ".bak")
+
+            write_model_file(model_path, data["encodings"], data["metadata"], model_type=model_type)
+            converted += 1
+
+            print(f"   ✅ {model_file}: {len(data['encodings'])} encodings ({model_type or 'desconhecido'})")
+        except Exception as e:
+            print(f"   ❌ {model_file}: erro na conversão: {e}")
+
+    print(f"\n🏁 {converted}/{len(model_files)} modelos convertidos")
+    return converted
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converte modelos pickle para o formato binário")
+    parser.add_argument("--model-dir", default=None, help="Diretório com os arquivos *_model.pkl (padrão: models/)")
+    parser.add_argument("--backup", action="store_true", help="Manter cópia .bak do pickle original")
+    args = parser.parse_args()
+
+    convert_models(args.model_dir, backup=args.backup)
@@ -0,0 +1,418 @@
+"""
+Avaliação de thresholds: FAR/FRR, EER e curvas ROC/DET dos dois backends
+
+Codifica as imagens do dataset/ com cada backend e compara todos os pares
+com matrizes de distância (um produto de matrizes por bloco de linhas):
+pares da mesma pessoa são genuínos, de pessoas diferentes são impostores.
+Para cada backend imprime:
+
+- FAR (impostores aceitos) e FRR (genuínos rejeitados) no threshold atual,
+  no EER e em alguns thresholds candidatos;
+- a regra completa do verify_face (threshold + margem para a segunda melhor
+  pessoa), avaliada deixando cada imagem de fora da galeria, para várias margens;
+- a latência de encoding por imagem e da comparação contra a galeria.
+
+As curvas vão para o JSON de saída (e para um PNG com --plot, se o
+matplotlib estiver instalado). Os thresholds saem nas unidades de cada
+backend: distância entre pixels (ou no espaço projetado) no OpenCV e
+distância normalizada dos landmarks/HOG no MediaPipe.
+
+Uso:
+    python evaluate_thresholds.py
+    python evaluate_thresholds.py --from-models --output evaluation.json --plot curves.png
+    python evaluate_thresholds.py --synthetic 30     # dataset sintético, para testar a ferramenta
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import numpy as np
+from faceid.dataset import scan_person_images
+from faceid.distance import as_matrix, euclidean_distances, min_by_segment, squared_norms
+from faceid.log import configure_logging
+from faceid.model_format import read_model_file
+
+BACKENDS = ("opencv", "mediapipe")
+
+# Resolução dos histogramas de distância (FAR/FRR são lidos deles)
+HISTOGRAM_BINS = 20000
+
+# Elementos da matriz de distâncias calculados por bloco
+BLOCK_ELEMENTS = 1 << 24
+
+def load_backend(backend):
+    """(trainer, threshold atual, margem atual, escala das distâncias) do backend"""
+    if backend == "opencv":
+        from faceid.opencv_trainer import MATCH_MARGIN, OpenCVFaceTrainer
+
+        trainer = OpenCVFaceTrainer()
+        return trainer, trainer.distance_threshold, MATCH_MARGIN, None
+
+    from faceid.mediapipe_model import MediaPipeFaceModel
+    from faceid.mediapipe_trainer import MATCH_MARGIN, THRESHOLD_FACTOR, MediaPipeFaceTrainer
+
+    # O MediaPipe divide a distância pela raiz da dimensão (MediaPipeFaceModel.calculate_distances)
+    return MediaPipeFaceTrainer(), MediaPipeFaceModel.DISTANCE_THRESHOLD * THRESHOLD_FACTOR, MATCH_MARGIN, "sqrt_dim"
+
+def encode_dataset(trainer, dataset_path, max_per_person=None):
+    """Encodings de todas as imagens (agrupados por pessoa) e a latência de cada encoding"""
+    encodings, labels, latencies = [], [], []
+    skipped = 0
+
+    for person_id in sorted(os.listdir(dataset_path)):
+        person_path = os.path.join(dataset_path, person_id)
+        if not os.path.isdir(person_path):
+            continue
+
+        for image_file in list(scan_person_images(person_path))[:max_per_person]:
+            image = cv2.imread(os.path.join(person_path, image_file))
+            if image is None:
+                skipped += 1
+                continue
+
+            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            start = time.perf_counter()
+            encoding = trainer.extract_face_encoding(image_rgb)
+            latencies.append(time.perf_counter() - start)
+
+            if encoding is None:
+                skipped += 1
+                continue
+
+            encodings.append(np.asarray(encoding).ravel())
+            labels.append(person_id)
+
+    return encodings, labels, latencies, skipped
+
+def load_model_encodings(trainer, max_per_person=None):
+    """Encodings já gravados nos modelos do backend (sem rodar detecção / encoding)"""
+    encodings, labels = [], []
+
+    for person_id, model_path in trainer.registry.model_files():
+        data = read_model_file(model_path)
+        own = [
+            np.asarray(e).ravel() for e, m in zip(data["encodings"], data["metadata"])
+            if trainer._is_own_encoding(e, m)
+        ]
+        encodings.extend(own[:max_per_person])
+        labels.extend([person_id] * len(own[:max_per_person]))
+
+    return encodings, labels, [], 0
+
+def same_length(encodings, labels):
+    """Mantém só os encodings do tamanho mais comum (o MediaPipe mistura landmarks e HOG)"""
+    sizes = [len(e) for e in encodings]
+    dim = max(set(sizes), key=sizes.count)
+    keep = [i for i, size in enumerate(sizes) if size == dim]
+    return [encodings[i] for i in keep], [labels[i] for i in keep], len(encodings) - len(keep)
+
+def block_rows(n):
+    return max(1, BLOCK_ELEMENTS // max(n, 1))
+
+def pair_histograms(matrix, labels, scale, edges):
+    """Histogramas das distâncias dos pares genuínos e impostores (i < j), bloco a bloco"""
+    sq_norms = squared_norms(matrix)
+    genuine = np.zeros(len(edges) - 1, dtype=np.int64)
+    impostor = np.zeros(len(edges) - 1, dtype=np.int64)
+
+    n = len(matrix)
+    step = block_rows(n)
+
+    for start in range(0, n, step):
+        stop = min(n, start + step)
+
+        # Só as colunas a partir de `start`: cada par é contado uma vez
+        distances = euclidean_distances(matrix[start:stop], matrix[start:], sq_norms[start:]) * scale
+        upper = np.triu(np.ones(distances.shape, dtype=bool), k=1)
+        same = labels[start:stop, np.newaxis] == labels[np.newaxis, start:]
+
+        genuine += np.histogram(distances[upper & same], edges)[0]
+        impostor += np.histogram(distances[upper & ~same], edges)[0]
+
+    return genuine, impostor
+
+def per_person_distances(matrix, labels, starts, scale):
+    """Menor distância de cada imagem para cada pessoa, sem a própria imagem (leave-one-out)"""
+    sq_norms = squared_norms(matrix)
+    n = len(matrix)
+    result = np.empty((n, len(starts)), dtype=np.float32)
+    step = block_rows(n)
+
+    for start in range(0, n, step):
+        stop = min(n, start + step)
+        distances = euclidean_distances(matrix[start:stop], matrix, sq_norms) * scale
+        distances[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        result[start:stop] = min_by_segment(distances, starts)
+
+    return result
+
+def error_rates(genuine, impostor):
+    """FAR e FRR aceitando distâncias <= cada limite superior dos bins"""
+    far = np.cumsum(impostor) / max(impostor.sum(), 1)
+    frr = 1.0 - np.cumsum(genuine) / max(genuine.sum(), 1)
+    return far, frr
+
+def rates_at(threshold, edges, far, frr):
+    index = int(np.clip(np.searchsorted(edges[1:], threshold, side="right") - 1, 0, len(far) - 1))
+    if threshold < edges[1]:
+        return 0.0, 1.0
+    return float(far[index]), float(frr[index])
+
+def evaluate_rule(per_person, true_index, threshold, margin):
+    """FAR/FRR da regra do verify_face (threshold + margem) e erro de identificação do /identify"""
+    n, persons = per_person.shape
+    best_index = np.argmin(per_person, axis=1)
+    best = per_person[np.arange(n), best_index]
+
+    if persons > 1:
+        second = np.partition(per_person, 1, axis=1)[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            margins = np.where(second > 0, (second - best) / second, 0.0)
+        accepted = (best <= threshold) & (margins >= margin)
+    else:
+        # Com uma pessoa só o verify_face não exige margem
+        accepted = best <= threshold
+
+    # Genuínos: só imagens cuja pessoa tem outras imagens na galeria
+    has_gallery = np.isfinite(per_person[np.arange(n), true_index])
+    genuine_accepted = accepted & (best_index == true_index)
+
+    # Impostor: alegar ser outra pessoa; só a melhor pessoa pode ser aceita
+    wrong_accepted = accepted & (best_index != true_index)
+
+    return {
+        "margin": margin,
+        "frr": float(1.0 - genuine_accepted[has_gallery].mean()) if has_gallery.any() else None,
+        "far": float(wrong_accepted.sum() / (n * max(persons - 1, 1))),
+        "false_identification_rate": float(wrong_accepted.mean()),
+    }
+
+def downsample_curve(edges, far, frr, points=200):
+    """Pontos da curva (threshold, FAR, FRR) para o JSON, sem os 20000 bins"""
+    keep = np.unique(np.linspace(0, len(far) - 1, points).astype(int))
+    return {
+        "threshold": edges[1:][keep].tolist(),
+        "far": far[keep].tolist(),
+        "frr": frr[keep].tolist(),
+    }
+
+def latency_summary(latencies):
+    if not latencies:
+        return None
+    ms = np.asarray(latencies) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+def evaluate_backend(backend, dataset_path, from_models=False, max_per_person=None, target_far=0.001, margins=()):
+    print(f"\n🔬 {backend.upper()}")
+    print("-" * 50)
+
+    trainer, threshold, current_margin, scale_mode = load_backend(backend)
+
+    if from_models:
+        encodings, labels, latencies, skipped = load_model_encodings(trainer, max_per_person)
+    else:
+        encodings, labels, latencies, skipped = encode_dataset(trainer, dataset_path, max_per_person)
+
+    excluded = 0
+    if encodings:
+        encodings, labels, excluded = same_length(encodings, labels)
+
+    persons = sorted(set(labels))
+    if len(encodings) < 2 or len(persons) < 2:
+        print("❌ São necessárias pelo menos 2 pessoas com encodings")
+        return None
+
+    matrix = as_matrix(encodings)
+    labels = np.asarray(labels, dtype=object)
+    scale = 1.0 / np.sqrt(matrix.shape[1]) if scale_mode == "sqrt_dim" else 1.0
+
+    # Encodings agrupados por pessoa: início do segmento de cada uma
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    person_order = labels[starts]
+    true_index = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(labels)]))
+
+    print(f"{len(encodings)} encodings de {len(person_order)} pessoas ({matrix.shape[1]} dims); "
+          f"{skipped} imagens sem rosto, {excluded} encodings de outro tamanho ignorados")
+
+    # ||a - b|| <= ||a|| + ||b||: limite superior para os bins
+    edges = np.linspace(0.0, 2.0 * np.sqrt(squared_norms(matrix).max()) * scale, HISTOGRAM_BINS + 1)
+
+    start = time.perf_counter()
+    genuine, impostor = pair_histograms(matrix, labels, scale, edges)
+    pairs_seconds = time.perf_counter() - start
+
+    far, frr = error_rates(genuine, impostor)
+
+    eer_index = int(np.argmin(np.abs(far - frr)))
+    eer_threshold = float(edges[eer_index + 1])
+    eer = float((far[eer_index] + frr[eer_index]) / 2)
+
+    # Maior threshold com FAR <= alvo
+    below = np.flatnonzero(far <= target_far)
+    target_threshold = float(edges[below[-1] + 1]) if len(below) else 0.0
+
+    candidates = sorted({threshold, eer_threshold, target_threshold} | {
+        float(np.interp(q, np.cumsum(genuine) / max(genuine.sum(), 1), edges[1:])) for q in (0.5, 0.8, 0.9, 0.95, 0.99)
+    })
+
+    print(f"Pares: {int(genuine.sum())} genuínos, {int(impostor.sum())} impostores ({pairs_seconds:.2f}s)")
+    print(f"EER: {eer:.2%} no threshold {eer_threshold:.4g}")
+    print(f"\n{'threshold':>14}{'FAR':>10}{'FRR':>10}")
+
+    table = []
+    for candidate in candidates:
+        candidate_far, candidate_frr = rates_at(candidate, edges, far, frr)
+        notes = [name for name, value in (("atual", threshold), ("EER", eer_threshold), (f"FAR<={target_far:g}", target_threshold))
+                 if value == candidate]
+        table.append({"threshold": candidate, "far": candidate_far, "frr": candidate_frr, "notes": notes})
+        print(f"{candidate:>14.4g}{candidate_far:>10.2%}{candidate_frr:>10.2%}   {', '.join(notes)}")
+
+    # Regra completa do verify_face (threshold + margem), deixando cada imagem de fora
+    start = time.perf_counter()
+    per_person = per_person_distances(matrix, labels, starts, scale)
+    scan_ms = (time.perf_counter() - start) * 1000 / len(matrix)
+
+    print(f"\nRegra do verify_face (leave-one-out, threshold atual {threshold:.4g}):")
+    print(f"{'margem':>10}{'FAR':>10}{'FRR':>10}{'erro /identify':>16}")
+
+    rules = []
+    for margin in sorted(set(margins) | {current_margin}):
+        rule = evaluate_rule(per_person, true_index, threshold, margin)
+        rules.append(rule)
+        frr_text = f"{rule['frr']:>10.2%}" if rule["frr"] is not None else f"{'-':>10}"
+        print(f"{margin:>10.0%}{rule['far']:>10.2%}{frr_text}{rule['false_identification_rate']:>16.2%}"
+              f"{'   atual' if margin == current_margin else ''}")
+
+    encode_latency = latency_summary(latencies)
+    if encode_latency:
+        print(f"\n⏱️  Encoding: p50 {encode_latency['p50_ms']:.2f} ms, p99 {encode_latency['p99_ms']:.2f} ms por imagem; "
+              f"galeria: {scan_ms:.3f} ms por consulta")
+    else:
+        print(f"\n⏱️  Galeria: {scan_ms:.3f} ms por consulta (encodings lidos dos modelos)")
+
+    return {
+        "encodings": len(encodings),
+        "persons": len(person_order),
+        "dims": int(matrix.shape[1]),
+        "skipped_images": skipped,
+        "excluded_encodings": excluded,
+        "genuine_pairs": int(genuine.sum()),
+        "impostor_pairs": int(impostor.sum()),
+        "current": {"threshold": threshold, "margin": current_margin},
+        "eer": {"rate": eer, "threshold": eer_threshold},
+        "target_far": {"far": target_far, "threshold": target_threshold},
+        "thresholds": table,
+        "rule": rules,
+        "latency": {"encode": encode_latency, "gallery_scan_ms": scan_ms, "pairwise_seconds": pairs_seconds},
+        "curve": downsample_curve(edges, far, frr),
+    }
+
+def plot_curves(report, path):
+    """ROC (FAR x 1-FRR) e DET (FAR x FRR) de cada backend num PNG"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️  matplotlib não instalado: curvas só no JSON")
+        return False
+
+    fig, (roc, det) = plt.subplots(1, 2, figsize=(12, 5))
+
+    for backend, result in report.items():
+        curve = result["curve"]
+        far = np.asarray(curve["far"])
+        frr = np.asarray(curve["frr"])
+        label = f"{backend} (EER {result['eer']['rate']:.1%})"
+        roc.plot(far, 1 - frr, label=label)
+        det.plot(np.clip(far, 1e-6, 1), np.clip(frr, 1e-6, 1), label=label)
+
+    roc.set(title="ROC", xlabel="FAR", ylabel="1 - FRR", xscale="log")
+    det.set(title="DET", xlabel="FAR", ylabel="FRR", xscale="log", yscale="log")
+    for axis in (roc, det):
+        axis.grid(True, which="both", alpha=0.3)
+        axis.legend()
+
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    print(f"📈 Curvas salvas em {path}")
+    return True
+
+def run(args, dataset_path):
+    report = {}
+
+    for backend in args.backends:
+        try:
+            result = evaluate_backend(backend, dataset_path, args.from_models, args.max_per_person,
+                                      args.target_far, args.margins)
+        except ImportError as e:
+            print(f"\n⚠️  {backend} indisponível, pulando: {e}")
+            continue
+        if result is not None:
+            report[backend] = result
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAR/FRR, EER e curvas ROC/DET dos thresholds de cada backend")
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="opencv,mediapipe")
+    parser.add_argument("--from-models", action="store_true",
+                        help="Usa os encodings já gravados nos modelos em vez de codificar o dataset (mais rápido, sem latência de encoding)")
+    parser.add_argument("--max-per-person", type=int, default=None, help="Limita as imagens por pessoa")
+    parser.add_argument("--target-far", type=float, default=0.001, help="FAR alvo para o threshold sugerido")
+    parser.add_argument("--margins", default="0,0.1,0.2,0.3,0.4", help="Margens avaliadas na regra do verify_face")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Avalia um dataset sintético com N pessoas (testa a ferramenta sem dados reais)")
+    parser.add_argument("--synthetic-images", type=int, default=6, help="Fotos por pessoa no dataset sintético")
+    parser.add_argument("--output", default="threshold_evaluation.json", help="Arquivo JSON de saída")
+    parser.add_argument("--plot", default=None, help="PNG com as curvas ROC e DET (requer matplotlib)")
+    args = parser.parse_args()
+    args.backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    args.margins = [float(m) for m in args.margins.split(",") if m.strip()]
+
+    configure_logging(os.environ.get("LOG_LEVEL", "WARNING"))
+
+    # Distâncias euclidianas: o LBPH (chi-quadrado) não entra nesta avaliação
+    os.environ["FACEID_MATCHER"] = "pixels"
+    os.environ.pop("FACEID_ANN_MIN_ROWS", None)
+
+    print("🎯 AVALIAÇÃO DE THRESHOLDS")
+    print("=" * 50)
+
+    workdir = None
+    dataset_path = args.dataset
+    cwd = os.getcwd()
+
+    if args.synthetic:
+        from faceid.synthetic import synthetic_faces, write_synthetic_dataset
+
+        # Dataset e modelos sintéticos num diretório temporário
+        workdir = tempfile.mkdtemp(prefix="faceid-eval-")
+        os.environ["FACEID_MODELS_DIR"] = os.path.join(workdir, "models")
+        for name in ("FACEID_PROJECTION", "FACEID_GALLERY_STORE"):
+            os.environ.pop(name, None)
+        dataset_path = os.path.join(workdir, "dataset")
+        write_synthetic_dataset(dataset_path, synthetic_faces(args.synthetic, args.synthetic_images))
+        os.chdir(workdir)
+
+    try:
+        report = run(args, dataset_path)
+    finally:
+        os.chdir(cwd)
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if not report:
+        print("\n❌ Nenhum backend avaliado")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Resultados salvos em {args.output}")
+
+        if args.plot:
+            plot_curves(report, args.plot)
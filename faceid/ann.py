@@ -0,0 +1,185 @@
+import numpy as np
+from .distance import euclidean_distances
+
+
+def kmeans(data, n_clusters, n_iter=20, seed=0):
+    """K-means (Lloyd) em NumPy puro; retorna os centróides float32 (k, dim)"""
+    data = np.asarray(data, dtype=np.float32)
+    n_clusters = min(n_clusters, len(data))
+    rng = np.random.default_rng(seed)
+
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = np.argmin(euclidean_distances(data, centroids), axis=1)
+
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.zeros_like(centroids, dtype=np.float64)
+        np.add.at(sums, assignments, data)
+
+        empty = counts == 0
+        centroids[~empty] = (sums[~empty] / counts[~empty, np.newaxis]).astype(np.float32)
+
+        # Clusters vazios recebem pontos aleatórios para não desperdiçar listas
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+
+    return centroids
+
+
+class IVFPQIndex:
+    """Índice aproximado IVF-PQ em NumPy puro.
+
+    Um k-means grosso divide a galeria em n_lists listas; o resíduo de cada
+    encoding em relação ao centróide da sua lista é comprimido com product
+    quantization (n_subvectors sub-vetores de 1 byte cada). Na busca, só as
+    nprobe listas mais próximas são varridas, com distâncias aproximadas por
+    tabelas de lookup (ADC). Cada entrada guarda o person_id dono, e a
+    distância exata é recalculada depois pela galeria (re-rank).
+    """
+
+    def __init__(self, n_lists=64, n_subvectors=16, n_bits=8, nprobe=8, max_train=5000, seed=0):
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.n_centroids = 2 ** n_bits
+        self.nprobe = nprobe
+        self.max_train = max_train
+        self.seed = seed
+
+        self.coarse = None
+        self.codebooks = None
+        self.dim = None
+        self.sub_dim = None
+
+        # Por lista: tupla (códigos PQ (n, n_subvectors) uint8, person_ids (n,)).
+        # add/remove trocam a tupla inteira numa única atribuição, então uma
+        # busca concorrente (sem lock) sempre lê códigos e labels da mesma versão.
+        self._lists = []
+
+    @property
+    def is_trained(self):
+        return self.coarse is not None
+
+    def __len__(self):
+        return sum(len(labels) for _, labels in self._lists)
+
+    def _pad(self, data):
+        """Completa com zeros para a dimensão ser múltipla de n_subvectors"""
+        padded_dim = self.sub_dim * self.n_subvectors
+        if data.shape[1] == padded_dim:
+            return data
+        out = np.zeros((len(data), padded_dim), dtype=np.float32)
+        out[:, :data.shape[1]] = data
+        return out
+
+    def train(self, data):
+        """Treina o k-means grosso e os codebooks PQ numa amostra de até max_train linhas"""
+        rng = np.random.default_rng(self.seed)
+
+        # Amostrar antes de converter: a galeria pode ser um memmap uint8 enorme
+        if len(data) > self.max_train:
+            data = data[np.sort(rng.choice(len(data), self.max_train, replace=False))]
+        data = np.asarray(data, dtype=np.float32)
+
+        self.dim = data.shape[1]
+        self.sub_dim = -(-self.dim // self.n_subvectors)
+
+        self.coarse = kmeans(data, self.n_lists, seed=self.seed)
+        self.n_lists = len(self.coarse)
+
+        assignments = np.argmin(euclidean_distances(data, self.coarse), axis=1)
+        residuals = self._pad(data - self.coarse[assignments])
+
+        self.codebooks = np.stack([
+            self._train_subspace(residuals[:, m * self.sub_dim:(m + 1) * self.sub_dim], m)
+            for m in range(self.n_subvectors)
+        ])
+
+        self._lists = [
+            (np.empty((0, self.n_subvectors), dtype=np.uint8), np.empty(0, dtype=object))
+            for _ in range(self.n_lists)
+        ]
+
+    def _train_subspace(self, sub_data, m):
+        codebook = kmeans(sub_data, self.n_centroids, n_iter=15, seed=self.seed + m + 1)
+        # Com poucos dados de treino sobram códigos: repetir o último centróide
+        if len(codebook) < self.n_centroids:
+            filler = np.repeat(codebook[-1:], self.n_centroids - len(codebook), axis=0)
+            codebook = np.concatenate([codebook, filler])
+        return codebook
+
+    def _encode(self, residuals):
+        residuals = self._pad(residuals)
+        codes = np.empty((len(residuals), self.n_subvectors), dtype=np.uint8)
+        for m in range(self.n_subvectors):
+            sub = residuals[:, m * self.sub_dim:(m + 1) * self.sub_dim]
+            codes[:, m] = np.argmin(euclidean_distances(sub, self.codebooks[m]), axis=1)
+        return codes
+
+    def add(self, data, person_id):
+        """Adiciona os encodings de uma pessoa (o índice precisa estar treinado)"""
+        data = np.asarray(data, dtype=np.float32)
+        if len(data) == 0:
+            return
+
+        assignments = np.argmin(euclidean_distances(data, self.coarse), axis=1)
+        codes = self._encode(data - self.coarse[assignments])
+
+        for list_id in np.unique(assignments):
+            mask = assignments == list_id
+            list_codes, list_labels = self._lists[list_id]
+            self._lists[list_id] = (
+                np.concatenate([list_codes, codes[mask]]),
+                np.concatenate([list_labels, np.full(int(mask.sum()), person_id, dtype=object)]),
+            )
+
+    def remove(self, person_id):
+        for list_id in range(self.n_lists):
+            list_codes, list_labels = self._lists[list_id]
+            keep = list_labels != person_id
+            if not keep.all():
+                self._lists[list_id] = (list_codes[keep], list_labels[keep])
+
+    def update(self, person_id, data):
+        self.remove(person_id)
+        self.add(data, person_id)
+
+    def search(self, query, n_candidates=100, nprobe=None):
+        """Person_ids das entradas aproximadamente mais próximas da query (sem repetição, em ordem)"""
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        query = np.asarray(query, dtype=np.float32).ravel()
+
+        coarse_distances = euclidean_distances(query, self.coarse)
+        probe_lists = np.argpartition(coarse_distances, nprobe - 1)[:nprobe]
+
+        all_distances = []
+        all_labels = []
+
+        for list_id in probe_lists:
+            codes, labels = self._lists[list_id]
+            if len(codes) == 0:
+                continue
+
+            residual = self._pad((query - self.coarse[list_id])[np.newaxis, :])[0]
+            sub_queries = residual.reshape(self.n_subvectors, self.sub_dim)
+
+            # Tabela ADC: distância de cada sub-vetor da query para cada centróide
+            diff = self.codebooks - sub_queries[:, np.newaxis, :]
+            tables = np.einsum('mkd,mkd->mk', diff, diff)
+
+            approx = tables[np.arange(self.n_subvectors), codes].sum(axis=1)
+            all_distances.append(approx)
+            all_labels.append(labels)
+
+        if not all_distances:
+            return []
+
+        distances = np.concatenate(all_distances)
+        labels = np.concatenate(all_labels)
+
+        n_candidates = min(n_candidates, len(distances))
+        top = np.argpartition(distances, n_candidates - 1)[:n_candidates]
+        top = top[np.argsort(distances[top])]
+
+        return list(dict.fromkeys(labels[top]))
+
@@ -0,0 +1,76 @@
+import os
+from .locking import atomic_write
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def scan_person_images(person_path):
+    """Lista as imagens da pasta da pessoa com sua assinatura (mtime_ns, tamanho)"""
+    images = {}
+
+    for image_file in sorted(os.listdir(person_path)):
+        if not image_file.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+
+        st = os.stat(os.path.join(person_path, image_file))
+        images[image_file] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+    return images
+
+
+def same_signature(recorded, signature):
+    return recorded.get("mtime_ns") == signature["mtime_ns"] and recorded.get("size") == signature["size"]
+
+
+def unchanged_images(recorded_images, current_images):
+    """As entradas {image_file: assinatura} cujo arquivo ainda existe com a mesma assinatura"""
+    return {
+        image_file: recorded for image_file, recorded in recorded_images.items()
+        if image_file in current_images and same_signature(recorded, current_images[image_file])
+    }
+
+
+def plan_incremental_update(known_metadata, current_images, no_face_images=None):
+    """Compara o modelo salvo com a pasta da pessoa.
+
+    Retorna (keep_indices, new_files): os índices dos encodings que continuam
+    válidos (mesmo arquivo, mesmo mtime e tamanho) e os arquivos que ainda
+    precisam ser codificados. Encodings de arquivos removidos ou alterados
+    ficam de fora de keep_indices. Entradas antigas sem assinatura são
+    tratadas como alteradas e recodificadas uma única vez. Imagens em
+    no_face_images (sem rosto detectado no último treino) só voltam a
+    new_files quando o arquivo muda.
+    """
+    keep_indices = []
+    encoded_files = set()
+
+    for i, metadata in enumerate(known_metadata):
+        image_file = metadata.get("image_file")
+        signature = current_images.get(image_file)
+
+        if signature is None or image_file in encoded_files:
+            continue
+
+        if same_signature(metadata, signature):
+            keep_indices.append(i)
+            encoded_files.add(image_file)
+
+    skipped = unchanged_images(no_face_images or {}, current_images)
+    new_files = [f for f in current_images if f not in encoded_files and f not in skipped]
+    return keep_indices, new_files
+
+
+def save_person_image(person_path, person_id, image_data, number):
+    """Grava a imagem no primeiro nome {person_id}_{n}_cropped.jpg livre a partir de `number`.
+
+    A gravação é atômica e nunca sobrescreve uma imagem existente, mesmo com
+    outro worker salvando imagens da mesma pessoa ao mesmo tempo. Retorna
+    (nome do arquivo, próximo número).
+    """
+    while True:
+        image_filename = f"{person_id}_{number}_cropped.jpg"
+        try:
+            atomic_write(os.path.join(person_path, image_filename), image_data, overwrite=False)
+            return image_filename, number + 1
+        except FileExistsError:
+            number += 1
@@ -0,0 +1,95 @@
+import cv2
+from .image_utils import DEFAULT_PADDING, STANDARD_FACE_SIZE, crop_square, decode_image_bytes, encode_jpeg, square_crop_box
+
+# Imagens até este tamanho já são crops do dataset (180x180) e não são cropadas de novo
+PRE_CROPPED_MAX_SIZE = 200
+
+
+class DetectionResult:
+    """Resultado de uma única detecção de rosto numa imagem RGB.
+
+    Guarda a caixa detectada e deriva dela, sob demanda, o crop quadrado
+    (usado para salvar no dataset) e a ROI em escala de cinza (usada no
+    encoding). Assim o detector roda uma vez só por imagem e todas as etapas
+    enxergam exatamente o mesmo rosto.
+    """
+
+    def __init__(self, image_rgb, box, padding=DEFAULT_PADDING):
+        height, width = image_rgb.shape[:2]
+        x, y, w, h = (int(v) for v in box)
+
+        # Detectores como o MediaPipe podem retornar caixas parcialmente fora da imagem
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(width, x + w), min(height, y + h)
+
+        self.image_rgb = image_rgb
+        self.box = (x1, y1, x2 - x1, y2 - y1)
+        self.original_size = (w, h)
+        self.padding = padding
+
+        self._crop_box = None
+        self._crop = None
+        self._crop_jpeg = None
+        self._gray_roi = None
+
+    @property
+    def is_empty(self):
+        return self.box[2] <= 0 or self.box[3] <= 0
+
+    @property
+    def crop_box(self):
+        """Quadrado (x1, y1, x2, y2) na imagem original de onde sai o crop"""
+        if self._crop_box is None:
+            x, y, w, h = self.box
+            height, width = self.image_rgb.shape[:2]
+            self._crop_box = square_crop_box(x, y, w, h, width, height, self.padding)
+        return self._crop_box
+
+    @property
+    def crop(self):
+        """Crop quadrado 180x180 (RGB) centrado no rosto, com padding"""
+        if self._crop is None:
+            self._crop = crop_square(self.image_rgb, self.crop_box, STANDARD_FACE_SIZE)
+        return self._crop
+
+    @property
+    def crop_jpeg(self):
+        """Crop em JPEG, exatamente como é salvo no dataset"""
+        if self._crop_jpeg is None:
+            self._crop_jpeg = encode_jpeg(self.crop, quality=95)
+        return self._crop_jpeg
+
+    @property
+    def gray_roi(self):
+        """Região exata do rosto em escala de cinza"""
+        if self._gray_roi is None:
+            x, y, w, h = self.box
+            self._gray_roi = cv2.cvtColor(self.image_rgb[y:y + h, x:x + w], cv2.COLOR_RGB2GRAY)
+        return self._gray_roi
+
+
+def detect_in_face_crop(image_rgb, detect, detection=None):
+    """Detecção de onde sai o encoding: sempre dentro de um crop 180x180 do rosto.
+
+    O dataset guarda crops 180x180 e o treino detecta o rosto neles; para o
+    encoding de uma imagem enviada bater com o do treino, ela passa pelo
+    mesmo caminho: crop 180x180 (com o padding padrão, em JPEG como no
+    dataset) em volta da primeira detecção e nova detecção dentro do crop,
+    barata num quadro desse tamanho. Imagens que já têm o tamanho de um
+    crop são usadas diretamente.
+
+    `detect` recebe uma imagem RGB e retorna um DetectionResult ou None;
+    `detection` é a detecção já feita em image_rgb, se houver.
+    """
+    height, width = image_rgb.shape[:2]
+    if width <= PRE_CROPPED_MAX_SIZE and height <= PRE_CROPPED_MAX_SIZE:
+        return detection if detection is not None else detect(image_rgb)
+
+    if detection is None:
+        detection = detect(image_rgb)
+        if detection is None:
+            return None
+
+    if detection.padding != DEFAULT_PADDING:
+        detection = DetectionResult(image_rgb, detection.box)
+    return detect(decode_image_bytes(detection.crop_jpeg))
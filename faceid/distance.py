@@ -0,0 +1,69 @@
+import numpy as np
+
+# Linhas convertidas para float por vez quando a galeria não é float32
+# (ex.: memmap uint8), para não materializar uma cópia inteira em memória
+CHUNK_ROWS = 4096
+
+
+def as_matrix(encodings, dtype=np.float32):
+    """Empilha uma lista de encodings numa matriz 2-D contígua (n, dim)"""
+    if isinstance(encodings, np.ndarray) and encodings.ndim == 2:
+        return np.ascontiguousarray(encodings, dtype=dtype)
+    return np.ascontiguousarray(np.stack([np.asarray(e).ravel() for e in encodings]), dtype=dtype)
+
+
+def squared_norms(matrix):
+    """||x||² de cada linha, em float64 para reduzir erro de cancelamento"""
+    matrix = np.asarray(matrix)
+    norms = np.empty(len(matrix), dtype=np.float64)
+    for start in range(0, len(matrix), CHUNK_ROWS):
+        chunk = np.asarray(matrix[start:start + CHUNK_ROWS], dtype=np.float64)
+        norms[start:start + len(chunk)] = np.einsum('ij,ij->i', chunk, chunk)
+    return norms
+
+
+def _dot_transposed(queries, gallery):
+    """queries @ gallery.T, convertendo a galeria em blocos se não for float32"""
+    if gallery.dtype == np.float32:
+        return queries @ gallery.T
+
+    dot = np.empty((len(queries), len(gallery)), dtype=np.float32)
+    for start in range(0, len(gallery), CHUNK_ROWS):
+        chunk = np.asarray(gallery[start:start + CHUNK_ROWS], dtype=np.float32)
+        dot[:, start:start + len(chunk)] = queries @ chunk.T
+    return dot
+
+
+def euclidean_distances(queries, gallery, gallery_sq_norms=None):
+    """Distâncias euclidianas entre queries (m, d) e galeria (n, d) numa única chamada.
+
+    Usa a expansão ||a||² + ||b||² - 2ab, de forma que o trabalho pesado é um
+    único produto de matrizes (BLAS). As normas da galeria podem ser passadas
+    já calculadas para não recalculá-las a cada busca.
+    Aceita uma query 1-D e, nesse caso, retorna um vetor (n,).
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    single = queries.ndim == 1
+    if single:
+        queries = queries[np.newaxis, :]
+
+    gallery = np.asarray(gallery)
+    if gallery_sq_norms is None:
+        gallery_sq_norms = squared_norms(gallery)
+
+    dot = _dot_transposed(queries, gallery)
+    sq = squared_norms(queries)[:, np.newaxis] + gallery_sq_norms[np.newaxis, :] - 2.0 * dot
+    np.maximum(sq, 0.0, out=sq)
+    distances = np.sqrt(sq)
+
+    return distances[0] if single else distances
+
+
+def min_by_segment(distances, starts):
+    """Menor distância de cada segmento contíguo de linhas da galeria.
+
+    `starts` são os índices iniciais de cada pessoa na galeria (ordenados e
+    sem segmentos vazios). Funciona sobre o último eixo, então aceita tanto
+    um vetor de distâncias quanto uma matriz (queries, galeria).
+    """
+    return np.minimum.reduceat(distances, starts, axis=-1)
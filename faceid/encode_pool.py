@@ -0,0 +1,223 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from .detection import DetectionResult, detect_in_face_crop
+from .image_utils import DEFAULT_PADDING
+from .metrics import observe_stage, span
+
+logger = logging.getLogger(__name__)
+
+
+class EncodePoolError(RuntimeError):
+    """Erro do pool de encoding (não é um problema da imagem enviada)"""
+
+
+class EncodePoolBusy(EncodePoolError):
+    """Fila cheia: o cliente deve tentar de novo mais tarde (HTTP 503)"""
+
+
+class EncodePoolRestarting(EncodePoolBusy):
+    """Um processo do pool morreu e o pool foi recriado: o cliente deve tentar de novo (HTTP 503)"""
+
+
+class EncodeTimeout(EncodePoolError):
+    """A imagem não foi processada dentro do timeout da requisição (HTTP 504)"""
+
+
+# Estado de cada processo do pool, criado pelo initializer
+_worker = {}
+
+
+def _init_worker(projection, encoding_size):
+    _worker["cascade"] = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    _worker["projection"] = projection
+    _worker["encoding_size"] = encoding_size
+
+
+def _detect(image_rgb, padding=DEFAULT_PADDING):
+    gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+    faces = _worker["cascade"].detectMultiScale(gray, 1.3, 5)
+    return DetectionResult(image_rgb, faces[0], padding) if len(faces) > 0 else None
+
+
+def _process_image(shm_name, size, want_encoding, want_crop, padding):
+    """Roda no processo do pool: decode -> detecção -> encoding e/ou crop JPEG.
+
+    A imagem chega como bytes JPEG/PNG num bloco de memória compartilhada;
+    só o resultado (encoding, caixa e crop, poucos KB) volta serializado,
+    junto com a duração de cada etapa ({etapa: segundos}) para as métricas
+    do processo da requisição. result é None quando não há rosto.
+    """
+    timings = {}
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # imdecode copia os pixels, então o bloco pode ser liberado logo em seguida
+        with span("image_decode", timings):
+            image_bgr = cv2.imdecode(np.ndarray((size,), dtype=np.uint8, buffer=shm.buf), cv2.IMREAD_COLOR)
+            image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB) if image_bgr is not None else None
+    finally:
+        shm.close()
+
+    if image_rgb is None:
+        return None, timings
+
+    with span("detect", timings):
+        detection = _detect(image_rgb, padding)
+
+    if detection is None:
+        return None, timings
+
+    encoding = None
+    if want_encoding:
+        # Mesmo caminho do OpenCVFaceTrainer.extract_face_encoding: o encoding sai do crop 180x180
+        with span("detect", timings):
+            face = detect_in_face_crop(image_rgb, _detect, detection)
+
+        if face is not None:
+            with span("encode", timings):
+                encoding = cv2.resize(face.gray_roi, _worker["encoding_size"]).flatten()
+                if _worker["projection"] is not None:
+                    encoding = _worker["projection"].transform(encoding)
+
+    crop = None
+    if want_crop:
+        with span("crop", timings):
+            crop = detection.crop_jpeg
+
+    return (encoding, detection.box, crop), timings
+
+
+class EncodePool:
+    """Pool de processos para o pipeline decode -> detecção -> encoding.
+
+    Haar cascade e decode de JPEG seguram a CPU por dezenas de ms; rodando
+    nas threads do Flask uma imagem grande atrasa todas as outras
+    requisições do processo. Aqui cada imagem vai para um processo do pool:
+
+    - os bytes da imagem são copiados para um bloco de memória compartilhada
+      e só o nome do bloco atravessa a fronteira (nada de base64 em pickle);
+    - no máximo `workers + queue_size` imagens ficam pendentes; acima disso
+      a chamada falha na hora com EncodePoolBusy (backpressure);
+    - cada chamada espera no máximo `timeout` segundos (EncodeTimeout). Uma
+      imagem que já começou a rodar não é interrompida: ela continua
+      ocupando um processo do pool (e a sua vaga) até terminar, então um
+      pool travado continua recusando trabalho novo;
+    - se um processo do pool morre (ex.: OOM killer), o executor inteiro
+      fica quebrado: ele é recriado e as imagens afetadas falham com
+      EncodePoolRestarting (503), em vez de toda requisição seguinte falhar.
+    """
+
+    def __init__(self, projection=None, encoding_size=(100, 100), workers=2, queue_size=8,
+                 timeout=10.0, start_method="spawn"):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._executor_args = dict(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(projection, encoding_size),
+        )
+        self._executor = ProcessPoolExecutor(**self._executor_args)
+
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def process(self, image_data, encoding=True, crop=False, timeout=None, padding=DEFAULT_PADDING):
+        """Processa os bytes de uma imagem; retorna (encoding, box, crop_jpeg) ou None sem rosto/imagem inválida"""
+        if not image_data:
+            return None
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise EncodePoolBusy(f"Encode pool is full ({self.capacity} images pending)")
+
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=len(image_data))
+        except BaseException:
+            self._slots.release()
+            raise
+
+        executor = self._executor
+        try:
+            shm.buf[:len(image_data)] = image_data
+            future = executor.submit(_process_image, shm.name, len(image_data), encoding, crop, padding)
+        except BrokenProcessPool:
+            self._release(shm)
+            self._restart(executor)
+            raise EncodePoolRestarting("Encode pool was broken and has been restarted")
+        except BaseException:
+            self._release(shm)
+            raise
+
+        with self._lock:
+            self.submitted += 1
+
+        # A vaga e o bloco só são liberados quando o processo termina (mesmo após timeout)
+        future.add_done_callback(lambda _: self._release(shm))
+
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            result, timings = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            observe_stage("pool_wait", time.perf_counter() - start)
+            raise EncodeTimeout(f"Image not processed within {timeout}s")
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise EncodePoolRestarting("An encode pool process died and the pool has been restarted")
+
+        # Etapas medidas no processo do pool; o resto da ida e volta é fila + IPC
+        for stage, seconds in timings.items():
+            observe_stage(stage, seconds)
+        observe_stage("pool_wait", max(0.0, time.perf_counter() - start - sum(timings.values())))
+
+        return result
+
+    def _restart(self, broken):
+        """Troca o executor quebrado por um novo (uma única vez, mesmo com várias threads vendo a falha)"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = ProcessPoolExecutor(**self._executor_args)
+            self.restarts += 1
+
+        logger.warning("Encode pool process died, pool restarted (%d restarts)", self.restarts)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, shm):
+        shm.close()
+        shm.unlink()
+        self._slots.release()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+            }
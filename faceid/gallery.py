@@ -0,0 +1,648 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from .model import FaceModel
+from .distance import euclidean_distances, min_by_segment, squared_norms
+from .ann import IVFPQIndex
+from .registry import MODEL_SUFFIX
+
+# Estado imutável da galeria; trocado por inteiro a cada atualização
+_Snapshot = namedtuple("_Snapshot", ["encodings", "sq_norms", "person_order", "starts", "offsets"])
+
+# Capacidade mínima (linhas) do buffer da galeria em memória
+MIN_CAPACITY = 64
+
+# Compacta o buffer quando as linhas mortas chegam a esta fração das vivas
+COMPACT_DEAD_RATIO = 1.0
+
+# Retreina o ANN quando a galeria chega a este múltiplo das linhas do último treino
+ANN_REBUILD_GROWTH = 4
+
+logger = logging.getLogger(__name__)
+
+
+class Gallery:
+    """Índice em memória com os encodings de todas as pessoas cadastradas.
+
+    Todos os modelos são carregados uma única vez e mantidos numa matriz
+    float32 contígua, dividida em segmentos (um por pessoa). O índice é
+    atualizado em memória quando um modelo é retreinado, então a verificação
+    não precisa mais ler os arquivos *_model.pkl a cada requisição.
+
+    A matriz fica num buffer com folga: o retreino de uma pessoa anexa o
+    bloco novo (e só as normas dele) no fim e marca o segmento antigo como
+    morto, sem copiar a galeria. Leitores usam views das linhas já
+    publicadas, que nunca são reescritas; quando as linhas mortas passam de
+    COMPACT_DEAD_RATIO das vivas, as vivas são copiadas para um buffer novo.
+
+    Com um GalleryStore, a matriz passa a ser o arquivo mapeado em memória
+    (compartilhado entre workers) em vez de uma cópia privada do processo.
+    Sem o store, reload_interval (segundos) faz a galeria reler, no máximo
+    uma vez por intervalo, os modelos que outros processos gravaram no
+    diretório.
+
+    Para galerias muito grandes, build_ann() liga um índice IVF-PQ: a busca
+    aproximada seleciona as pessoas candidatas e só as linhas delas têm a
+    distância exata calculada, então o threshold e a margem continuam
+    valendo sobre distâncias reais. Com enable_ann() o índice é construído
+    quando a galeria atinge o mínimo de linhas e retreinado quando ela cresce
+    ANN_REBUILD_GROWTH vezes desde o último treino.
+    """
+
+    def __init__(self, model_dir=".", model_class=FaceModel, encoding_dim=None, store=None, load=True,
+                 reload_interval=None):
+        self.model_dir = model_dir
+        self.model_class = model_class
+        self.store = store
+        self.encoding_dim = store.dim if store is not None else encoding_dim
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+
+        # Assinatura de cada arquivo de modelo na última leitura do diretório
+        self._model_stamps = {}
+        self._last_reload = time.monotonic()
+        self._reload_lock = threading.Lock()
+        self._store_norms = (None, np.empty(0, dtype=np.float64))
+
+        # Galeria em memória: buffers com folga, índice do segmento de cada
+        # pessoa em person_order e total de linhas vivas
+        self._buffer = None
+        self._norms = None
+        self._segments = {}
+        self._live_rows = 0
+        self._snapshot = self._build_snapshot({})
+
+        # Índice aproximado (opcional) e a versão de cada pessoa já indexada nele
+        self.ann = None
+        self.ann_min_rows = 0
+        self.ann_candidates = 100
+        self._ann_keys = {}
+        self._versions = {}
+        self._ann_config = None
+        self._ann_trained_rows = 0
+        self._ann_building = False
+
+        # load=False: galeria vazia, para processos que só gravam modelos (retreino em massa)
+        if load:
+            self.load()
+
+    def _build_snapshot(self, blocks, norms=None):
+        """Monta um snapshot compacto a partir dos blocos por pessoa (carga e compactação).
+
+        norms ({person_id: normas}) evita recalcular as normas de blocos já conhecidos.
+        """
+        rows = sum(len(b) for b in blocks.values())
+        self._allocate(max(2 * rows, MIN_CAPACITY))
+
+        # offsets[p] = (início, fim) das linhas da pessoa na matriz
+        offsets = {}
+        starts = []
+        start = 0
+        for p, block in blocks.items():
+            end = start + len(block)
+            self._buffer[start:end] = block
+            self._norms[start:end] = norms[p] if norms is not None else squared_norms(block)
+            offsets[p] = (start, end)
+            starts.append(start)
+            start = end
+
+        self._segments = {p: i for i, p in enumerate(blocks)}
+        self._live_rows = rows
+
+        return _Snapshot(
+            encodings=self._buffer[:rows],
+            sq_norms=self._norms[:rows],
+            person_order=np.array(list(blocks), dtype=object),
+            starts=np.array(starts, dtype=np.intp),
+            offsets=offsets,
+        )
+
+    def _allocate(self, capacity, keep_rows=0):
+        """Troca os buffers por outros de `capacity` linhas, copiando as primeiras keep_rows"""
+        buffer = np.empty((capacity, self.encoding_dim or 0), dtype=np.float32)
+        norms = np.empty(capacity, dtype=np.float64)
+
+        if keep_rows:
+            buffer[:keep_rows] = self._buffer[:keep_rows]
+            norms[:keep_rows] = self._norms[:keep_rows]
+
+        # Snapshots antigos continuam apontando para os buffers anteriores
+        self._buffer = buffer
+        self._norms = norms
+
+    def _apply_blocks(self, changes):
+        """Snapshot com os blocos de `changes` ({person_id: bloco ou None}) trocados.
+
+        Os segmentos antigos viram linhas mortas e os blocos novos são
+        anexados depois da última linha publicada: o custo é proporcional às
+        linhas alteradas, não ao tamanho da galeria.
+        """
+        snapshot = self._snapshot
+        rows = len(snapshot.encodings)
+        offsets = dict(snapshot.offsets)
+        person_order = snapshot.person_order.copy()
+
+        for person_id in changes:
+            index = self._segments.pop(person_id, None)
+            if index is not None:
+                person_order[index] = None
+                start, end = offsets.pop(person_id)
+                self._live_rows -= end - start
+
+        added = {p: b for p, b in changes.items() if b is not None}
+        total = rows + sum(len(b) for b in added.values())
+
+        if self._buffer.shape[1] != (self.encoding_dim or 0) or total > len(self._buffer):
+            self._allocate(max(2 * total, MIN_CAPACITY), keep_rows=rows)
+
+        labels = []
+        starts = []
+        position = rows
+        for person_id, block in added.items():
+            end = position + len(block)
+            self._buffer[position:end] = block
+            self._norms[position:end] = squared_norms(block)
+            offsets[person_id] = (position, end)
+            self._segments[person_id] = len(person_order) + len(labels)
+            labels.append(person_id)
+            starts.append(position)
+            position = end
+
+        self._live_rows += total - rows
+
+        snapshot = _Snapshot(
+            encodings=self._buffer[:total],
+            sq_norms=self._norms[:total],
+            person_order=np.concatenate([person_order, np.array(labels, dtype=object)]),
+            starts=np.concatenate([snapshot.starts, np.array(starts, dtype=np.intp)]),
+            offsets=offsets,
+        )
+
+        dead = total - self._live_rows
+        if dead > 0 and dead >= self._live_rows * COMPACT_DEAD_RATIO:
+            snapshot = self._compact(snapshot)
+
+        return snapshot
+
+    def _compact(self, snapshot):
+        """Copia só as linhas vivas (e as normas já calculadas) para buffers novos"""
+        ranges = sorted(snapshot.offsets.items(), key=lambda item: item[1][0])
+        blocks = {p: snapshot.encodings[start:end] for p, (start, end) in ranges}
+        norms = {p: snapshot.sq_norms[start:end] for p, (start, end) in ranges}
+
+        logger.debug("Gallery: compacting %d rows into %d live rows", len(snapshot.encodings), self._live_rows)
+        return self._build_snapshot(blocks, norms)
+
+    def _build_store_snapshot(self):
+        """Snapshot apontando para o memmap do GalleryStore (sem cópia dos encodings)"""
+        index, matrix = self.store.state()
+        starts, labels = self.store.segments(index)
+
+        # As linhas só são anexadas, então as normas já calculadas continuam válidas
+        # enquanto o arquivo de dados for o mesmo (muda apenas na compactação)
+        norms_file, norms = self._store_norms
+        if norms_file != index["data_file"] or len(norms) > len(matrix):
+            norms = np.empty(0, dtype=np.float64)
+        if len(norms) < len(matrix):
+            norms = np.concatenate([norms, squared_norms(matrix[len(norms):])])
+        self._store_norms = (index["data_file"], norms)
+
+        counts = np.diff(np.append(starts, len(matrix)))
+        offsets = {
+            p: (int(start), int(start + count))
+            for p, start, count in zip(labels, starts, counts) if p is not None
+        }
+
+        return _Snapshot(
+            encodings=matrix,
+            sq_norms=norms,
+            person_order=np.array(labels, dtype=object),
+            starts=starts,
+            offsets=offsets,
+        )
+
+    def _current_snapshot(self):
+        """Snapshot atual; recarrega o que outro worker alterou (índice do store ou arquivos de modelo)"""
+        if self.store is not None:
+            if self.store.refresh():
+                with self._lock:
+                    self._snapshot = self._build_store_snapshot()
+                    self._sync_ann()
+                # Caminho de leitura: o treino do índice não atrasa a requisição
+                self._maybe_build_ann(background=True)
+        elif self.reload_interval is not None and time.monotonic() - self._last_reload >= self.reload_interval:
+            # Uma thread relê; as demais seguem com o snapshot atual
+            if self._reload_lock.acquire(blocking=False):
+                try:
+                    self.reload_changed()
+                finally:
+                    self._reload_lock.release()
+        return self._snapshot
+
+    def _person_key(self, person_id):
+        """Identifica a versão atual das linhas de uma pessoa (para sincronizar o ANN)"""
+        if self.store is not None:
+            return (self._store_norms[0],) + self._snapshot.offsets[person_id]
+        return self._versions.get(person_id, 0)
+
+    def _sync_ann(self, persons=None):
+        """Reindexa no ANN só as pessoas cujas linhas mudaram desde a última sincronização.
+
+        persons limita a verificação às pessoas informadas (as alteradas num update).
+        """
+        if self.ann is None:
+            return
+
+        snapshot = self._snapshot
+        if persons is None:
+            persons = set(self._ann_keys) | set(snapshot.offsets)
+
+        for person_id in persons:
+            if person_id not in snapshot.offsets:
+                if self._ann_keys.pop(person_id, None) is not None:
+                    self.ann.remove(person_id)
+                continue
+
+            key = self._person_key(person_id)
+            if self._ann_keys.get(person_id) != key:
+                start, end = snapshot.offsets[person_id]
+                self.ann.update(person_id, snapshot.encodings[start:end])
+                self._ann_keys[person_id] = key
+
+    def build_ann(self, min_rows=0, n_candidates=100, **params):
+        """Treina e popula o índice IVF-PQ com a galeria atual.
+
+        O ANN só é usado quando a galeria tem pelo menos min_rows linhas;
+        n_candidates é o número de entradas aproximadas usadas para escolher
+        as pessoas que passam pelo re-rank exato. Os demais parâmetros vão
+        para o IVFPQIndex (n_lists, n_subvectors, nprobe...).
+        """
+        snapshot = self._current_snapshot()
+        ann = IVFPQIndex(**params)
+
+        if len(snapshot.encodings) == 0:
+            logger.warning("Gallery: empty gallery, ANN index not built")
+            return None
+
+        # Linhas mortas do GalleryStore podem entrar na amostra de treino sem prejuízo
+        ann.train(snapshot.encodings)
+
+        with self._lock:
+            self.ann = ann
+            self.ann_min_rows = min_rows
+            self.ann_candidates = n_candidates
+            self._ann_trained_rows = len(snapshot.encodings)
+            self._ann_keys = {}
+            self._sync_ann()
+
+        logger.info("Gallery: ANN index built with %d entries in %d lists (nprobe=%d)", len(ann), ann.n_lists, ann.nprobe)
+        return ann
+
+    def enable_ann(self, min_rows, n_candidates=100, **params):
+        """Liga o ANN sob demanda: construído ao atingir min_rows linhas e retreinado conforme a galeria cresce.
+
+        Os parâmetros são os mesmos de build_ann(). A galeria é verificada
+        agora e a cada atualização (cadastro, retreino ou refresh do store).
+        """
+        self._ann_config = (min_rows, n_candidates, params)
+        self._maybe_build_ann()
+
+    def _ann_due(self):
+        """True se o índice ainda não existe ou foi treinado com uma galeria bem menor"""
+        rows = len(self._snapshot.encodings)
+        min_rows = self._ann_config[0]
+
+        if rows == 0 or rows < min_rows:
+            return False
+        if self.ann is None:
+            return True
+        # As listas do k-means foram aprendidas com a galeria da época do treino
+        return rows >= ANN_REBUILD_GROWTH * self._ann_trained_rows
+
+    def _maybe_build_ann(self, background=False):
+        """Constrói ou retreina o ANN configurado por enable_ann(), se for a hora"""
+        if self._ann_config is None:
+            return
+
+        with self._lock:
+            if self._ann_building or not self._ann_due():
+                return
+            self._ann_building = True
+
+        def build():
+            try:
+                min_rows, n_candidates, params = self._ann_config
+                self.build_ann(min_rows, n_candidates, **params)
+            except Exception as e:
+                logger.exception("Gallery: failed to build ANN index: %s", e)
+            finally:
+                self._ann_building = False
+
+        if background:
+            threading.Thread(target=build, name="gallery-ann-build", daemon=True).start()
+        else:
+            build()
+
+    def _use_ann(self, snapshot):
+        return self.ann is not None and len(snapshot.encodings) >= self.ann_min_rows
+
+    def _reranked_distances(self, snapshot, probe, n_candidates=None, include=()):
+        """Distâncias exatas só para as pessoas pré-selecionadas pelo ANN"""
+        candidates = self.ann.search(probe, n_candidates or self.ann_candidates)
+        persons = [p for p in dict.fromkeys(list(candidates) + list(include)) if p in snapshot.offsets]
+
+        if not persons:
+            return {}
+
+        ranges = [snapshot.offsets[p] for p in persons]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        starts = np.cumsum([0] + [end - start for start, end in ranges[:-1]])
+
+        distances = euclidean_distances(probe, snapshot.encodings[rows], snapshot.sq_norms[rows])
+        return dict(zip(persons, min_by_segment(distances, starts).tolist()))
+
+    def _to_block(self, person_id, encodings):
+        """Converte a lista de encodings de um modelo num bloco float32 (n, dim)"""
+        rows = [np.asarray(e, dtype=np.float32).ravel() for e in encodings]
+
+        if self.encoding_dim is not None:
+            valid = [r for r in rows if r.shape[0] == self.encoding_dim]
+            if len(valid) != len(rows):
+                # Esperado no MediaPipe: landmarks e HOG ficam em galerias separadas
+                logger.debug("Gallery: skipping %d encodings with wrong size for %s", len(rows) - len(valid), person_id)
+            rows = valid
+
+        if not rows:
+            return None
+
+        if len({r.shape[0] for r in rows}) != 1:
+            logger.warning("Gallery: inconsistent encoding sizes for %s, skipping", person_id)
+            return None
+
+        return np.stack(rows)
+
+    def _scan_model_stamps(self):
+        """{person_id: (mtime_ns, tamanho, inode)} dos arquivos de modelo do diretório"""
+        stamps = {}
+
+        try:
+            entries = os.scandir(self.model_dir)
+        except FileNotFoundError:
+            return stamps
+
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(MODEL_SUFFIX):
+                    st = entry.stat()
+                    stamps[entry.name[:-len(MODEL_SUFFIX)]] = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+        return stamps
+
+    def reload_changed(self):
+        """Relê só os modelos criados, alterados ou removidos desde a última leitura do diretório.
+
+        Os modelos são gravados com rename atômico, então um arquivo novo
+        sempre muda a assinatura. Retorna o número de pessoas atualizadas.
+        """
+        stamps = self._scan_model_stamps()
+        previous = self._model_stamps
+        self._model_stamps = stamps
+        self._last_reload = time.monotonic()
+
+        persons = {p: ([], None) for p in previous if p not in stamps}
+
+        for person_id, stamp in stamps.items():
+            if previous.get(person_id) != stamp:
+                model = self.model_class(os.path.join(self.model_dir, f"{person_id}{MODEL_SUFFIX}"))
+                persons[person_id] = (model.known_face_encodings, model.known_face_metadata)
+
+        if persons:
+            logger.debug("Gallery: reloading %d changed models from %s", len(persons), self.model_dir)
+            self.update_persons(persons)
+
+        return len(persons)
+
+    def _load_model_files(self):
+        """Lê todos os *_model.pkl do diretório em blocos por pessoa"""
+        blocks = {}
+        metadata = {}
+
+        if os.path.isdir(self.model_dir):
+            for model_file in sorted(os.listdir(self.model_dir)):
+                if not model_file.endswith(MODEL_SUFFIX):
+                    continue
+
+                person_id = model_file[:-len(MODEL_SUFFIX)]
+                model = self.model_class(os.path.join(self.model_dir, model_file))
+
+                if model.get_face_count() == 0:
+                    continue
+
+                block = self._to_block(person_id, model.known_face_encodings)
+                if block is not None:
+                    blocks[person_id] = block
+                    metadata[person_id] = model.known_face_metadata
+
+        if self.encoding_dim is None and blocks:
+            self.encoding_dim = next(iter(blocks.values())).shape[1]
+            blocks = {p: b for p, b in blocks.items() if b.shape[1] == self.encoding_dim}
+
+        return blocks, metadata
+
+    def load(self):
+        """Carrega todos os modelos (executado uma vez no startup)"""
+        if self.store is not None:
+            self.store.refresh()
+            if not self.store.person_ids():
+                # Primeira execução com o store: importar os modelos existentes
+                blocks, metadata = self._load_model_files()
+                if blocks:
+                    self.store.put_many(
+                        {p: (b, metadata[p]) for p, b in blocks.items()}, only_if_empty=True
+                    )
+
+            with self._lock:
+                self._snapshot = self._build_store_snapshot()
+
+            logger.info("Gallery loaded from store %s: %d persons, %d rows",
+                        self.store.data_path, len(self._snapshot.offsets), len(self._snapshot.encodings))
+            return
+
+        # Assinaturas antes da leitura: o que mudar durante a carga é relido no próximo reload
+        self._model_stamps = self._scan_model_stamps()
+        self._last_reload = time.monotonic()
+        blocks, _ = self._load_model_files()
+
+        with self._lock:
+            self._snapshot = self._build_snapshot(blocks)
+
+        logger.info("Gallery loaded: %d persons, %d encodings", len(blocks), len(self._snapshot.encodings))
+
+    def update_person(self, person_id, encodings, metadata=None):
+        """Substitui os encodings de uma pessoa no índice (chamado após o treino)"""
+        self.update_persons({person_id: (encodings, metadata)})
+
+    def update_persons(self, persons):
+        """Substitui os encodings de várias pessoas numa única troca de snapshot.
+
+        persons: {person_id: (encodings, metadata)}; encodings vazio remove a pessoa.
+        """
+        blocks = {p: self._to_block(p, encodings) for p, (encodings, _) in persons.items()}
+
+        if self.store is not None:
+            self.store.put_many({p: (b if b is not None else [], persons[p][1]) for p, b in blocks.items()})
+            with self._lock:
+                self._snapshot = self._build_store_snapshot()
+                self._sync_ann()
+            self._maybe_build_ann()
+            return
+
+        with self._lock:
+            if self.encoding_dim is None:
+                dims = [b.shape[1] for b in blocks.values() if b is not None]
+                if dims:
+                    self.encoding_dim = dims[0]
+                    blocks = {p: b if b is None or b.shape[1] == dims[0] else None for p, b in blocks.items()}
+
+            for person_id in blocks:
+                self._versions[person_id] = self._versions.get(person_id, 0) + 1
+
+            # Leitores continuam usando o snapshot anterior até a troca
+            self._snapshot = self._apply_blocks(blocks)
+            self._sync_ann(blocks)
+
+        self._maybe_build_ann()
+
+    def remove_person(self, person_id):
+        self.update_person(person_id, [])
+
+    def has_person(self, person_id):
+        return person_id in self._current_snapshot().offsets
+
+    def get_face_count(self, person_id=None):
+        snapshot = self._current_snapshot()
+        if person_id is None:
+            # Só as linhas vivas (a matriz pode ter segmentos mortos)
+            return sum(end - start for start, end in snapshot.offsets.values())
+        start, end = snapshot.offsets.get(person_id, (0, 0))
+        return end - start
+
+    def get_person_count(self):
+        return len(self._current_snapshot().offsets)
+
+    def get_person_ids(self):
+        return list(self._current_snapshot().offsets)
+
+    def get_encodings(self, person_id):
+        """Linhas da pessoa na matriz da galeria (vazio se ela não existir)"""
+        snapshot = self._current_snapshot()
+        start, end = snapshot.offsets.get(person_id, (0, 0))
+        return snapshot.encodings[start:end]
+
+    def min_distances(self, face_encoding, include=()):
+        """Menor distância euclidiana do encoding para cada pessoa da galeria.
+
+        Com o ANN ativo, o dict contém apenas as pessoas candidatas (mais as
+        de `include`, ex.: a pessoa alegada na verificação), com distância exata.
+        """
+        snapshot = self._current_snapshot()
+
+        if len(snapshot.encodings) == 0:
+            return {}
+
+        probe = np.asarray(face_encoding, dtype=np.float32).ravel()
+
+        if self._use_ann(snapshot):
+            return self._reranked_distances(snapshot, probe, include=include)
+
+        distances = euclidean_distances(probe, snapshot.encodings, snapshot.sq_norms)
+        per_person = min_by_segment(distances, snapshot.starts)
+
+        # Segmentos sem dono (None) são linhas mortas do GalleryStore
+        return {
+            person_id: distance
+            for person_id, distance in zip(snapshot.person_order, per_person.tolist())
+            if person_id is not None
+        }
+
+    def search(self, face_encoding, k=5, n_candidates=None):
+        """Top-k pessoas mais próximas do encoding: lista de (person_id, distância).
+
+        Usa np.argpartition para selecionar os k menores sem ordenar a galeria
+        inteira; só os k escolhidos são ordenados.
+        """
+        snapshot = self._current_snapshot()
+
+        if len(snapshot.encodings) == 0 or k <= 0:
+            return []
+
+        probe = np.asarray(face_encoding, dtype=np.float32).ravel()
+
+        if self._use_ann(snapshot):
+            n_candidates = max(n_candidates or self.ann_candidates, 4 * k)
+            ranked = sorted(self._reranked_distances(snapshot, probe, n_candidates).items(), key=lambda item: item[1])
+            return ranked[:k]
+
+        distances = euclidean_distances(probe, snapshot.encodings, snapshot.sq_norms)
+        per_person = min_by_segment(distances, snapshot.starts)
+
+        # Linhas mortas do GalleryStore nunca entram no resultado
+        live = np.array([p is not None for p in snapshot.person_order])
+        per_person = np.where(live, per_person, np.inf)
+        k = min(k, int(live.sum()))
+
+        if k == 0:
+            return []
+
+        top = np.argpartition(per_person, k - 1)[:k]
+        top = top[np.argsort(per_person[top])]
+
+        return [(snapshot.person_order[i], float(per_person[i])) for i in top]
+
+    def min_distances_batch(self, face_encodings, include=None):
+        """Como min_distances, para vários encodings com um único produto de matrizes.
+
+        `include` (opcional) é uma lista paralela de person_ids que devem
+        entrar no re-rank de cada encoding quando o ANN está ativo.
+        """
+        snapshot = self._current_snapshot()
+
+        if len(snapshot.encodings) == 0 or len(face_encodings) == 0:
+            return [{} for _ in face_encodings]
+
+        probes = np.stack([np.asarray(e, dtype=np.float32).ravel() for e in face_encodings])
+
+        if self._use_ann(snapshot):
+            include = include or [None] * len(probes)
+            return [
+                self._reranked_distances(snapshot, probe, include=[p for p in (person_id,) if p is not None])
+                for probe, person_id in zip(probes, include)
+            ]
+
+        distances = euclidean_distances(probes, snapshot.encodings, snapshot.sq_norms)
+        per_person = min_by_segment(distances, snapshot.starts)
+
+        live = [i for i, p in enumerate(snapshot.person_order) if p is not None]
+        person_ids = snapshot.person_order[live]
+
+        return [dict(zip(person_ids, row.tolist())) for row in per_person[:, live]]
+
+
+_shared_galleries = {}
+_shared_lock = threading.Lock()
+
+
+def get_gallery(model_dir=".", model_class=FaceModel, encoding_dim=None, store=None, reload_interval=None):
+    """Retorna a galeria compartilhada pelo processo para o diretório/modelo/dimensão"""
+    key = (os.path.abspath(model_dir), model_class, encoding_dim)
+
+    with _shared_lock:
+        gallery = _shared_galleries.get(key)
+        if gallery is None:
+            gallery = Gallery(model_dir, model_class, encoding_dim, store, reload_interval=reload_interval)
+            _shared_galleries[key] = gallery
+
+    return gallery
@@ -0,0 +1,419 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+from .locking import atomic_write, file_lock
+
+# Compacta o arquivo quando as linhas mortas chegam a esta proporção das vivas
+COMPACT_DEAD_RATIO = 1.0
+
+# O journal vira um novo índice base quando passa do tamanho do base (e deste mínimo)
+JOURNAL_CHECKPOINT_BYTES = 1 << 20
+
+# Tentativas do refresh() quando outro processo troca os arquivos durante a leitura
+REFRESH_ATTEMPTS = 5
+
+logger = logging.getLogger(__name__)
+
+
+class GalleryStore:
+    """Galeria de encodings num único arquivo mapeado em memória (np.memmap).
+
+    Os encodings de todas as pessoas ficam num arquivo binário de linhas de
+    tamanho fixo, compartilhado por todos os workers via page cache. Um índice
+    JSON ao lado do arquivo mapeia person_id -> faixa de linhas. Novos cadastros
+    são sempre anexados ao final; ao retreinar uma pessoa, a faixa antiga vira
+    espaço morto. A escrita que deixa mais linhas mortas que vivas compacta o
+    arquivo, então ele nunca passa de ~2x o tamanho dos encodings vivos.
+
+    O índice é um base (checkpoint) mais um journal só de anexação: cada
+    escrita acrescenta uma linha JSON com as pessoas alteradas, e cada worker
+    aplica só as linhas novas no refresh(). Quando o journal passa do tamanho
+    do base, ele é incorporado num base novo; assim o custo de escrever e de
+    reler o índice é proporcional à mudança, não à galeria.
+    """
+
+    def __init__(self, path, dim, dtype=np.uint8):
+        self.data_path = path
+        self.index_path = path + ".index.json"
+        self.lock_path = path + ".lock"
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = self.dim * self.dtype.itemsize
+
+        self._local_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # (índice, matriz, assinatura do base, bytes do journal já aplicados),
+        # trocados juntos para leitores nunca misturarem versões
+        self._view = (self._empty_index(), np.empty((0, self.dim), dtype=self.dtype), None, 0)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._reset_if_incompatible()
+        self.refresh()
+
+    def _empty_index(self):
+        return {
+            "dtype": self.dtype.str,
+            "dim": self.dim,
+            "rows": 0,
+            "generation": 0,
+            "data_file": os.path.basename(self.data_path),
+            "journal": None,
+            "persons": {},
+        }
+
+    @contextmanager
+    def _write_lock(self):
+        """Lock exclusivo entre processos para escrita (leitores não bloqueiam)"""
+        with self._local_lock, file_lock(self.lock_path):
+            yield
+
+    def _stat_base(self):
+        try:
+            st = os.stat(self.index_path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def _is_compatible(self, index):
+        return index["dim"] == self.dim and np.dtype(index["dtype"]) == self.dtype
+
+    def _reset_if_incompatible(self):
+        """Descarta um store gravado com outra dimensão/dtype (ex.: de outra versão das features).
+
+        O store é só um cache dos modelos: vazio, a galeria importa os
+        modelos do diretório de novo na carga.
+        """
+        with self._write_lock():
+            try:
+                with open(self.index_path) as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                return
+
+            if self._is_compatible(index):
+                return
+
+            logger.warning("Gallery store %s has dim=%s dtype=%s, expected dim=%d dtype=%s: rebuilding it",
+                           self.data_path, index["dim"], index["dtype"], self.dim, self.dtype.str)
+
+            old_file = self._data_file(index)
+            fresh = self._empty_index()
+            fresh["generation"] = index["generation"]
+            fresh["journal"] = index.get("journal")
+            # Nome novo: processos antigos que ainda mapeiam o arquivo não leem linhas do novo formato
+            fresh["data_file"] = f"{os.path.basename(self.data_path)}.{index['generation'] + 1}"
+            self._write_base(fresh)
+
+            if os.path.exists(old_file):
+                os.remove(old_file)
+
+    def _read_base(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return self._empty_index()
+
+        if not self._is_compatible(index):
+            raise ValueError(
+                f"Gallery store {self.data_path} has dim={index['dim']} dtype={index['dtype']}, "
+                f"expected dim={self.dim} dtype={self.dtype.str}"
+            )
+        # Índices gravados antes do journal
+        index.setdefault("journal", None)
+        return index
+
+    def _write_base(self, index):
+        """Publica o índice inteiro como novo base, com um journal novo e vazio"""
+        old_journal = index["journal"]
+        index["generation"] += 1
+        index["journal"] = f"{os.path.basename(self.data_path)}.journal.{index['generation']}"
+
+        journal_path = self._sibling(index["journal"])
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+
+        atomic_write(self.index_path, json.dumps(index, separators=(",", ":")).encode())
+
+        # Leitores que ainda estavam no journal antigo recebem FileNotFoundError e releem o base
+        if old_journal is not None and old_journal != index["journal"] and os.path.exists(self._sibling(old_journal)):
+            os.remove(self._sibling(old_journal))
+
+    def _read_journal(self, index, offset, base_stamp):
+        """Aplica ao índice as linhas completas do journal a partir de offset; retorna (índice, offset)"""
+        if index["journal"] is None:
+            return index, offset
+
+        try:
+            with open(self._sibling(index["journal"]), "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            if self._stat_base() == base_stamp:
+                # Base novo: ninguém escreveu no journal ainda
+                return index, offset
+            raise
+
+        # Uma linha sem \n no fim é uma escrita em andamento (ou interrompida)
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return index, offset
+
+        # Cópia: leitores do índice anterior não veem o dict mudar
+        persons = dict(index["persons"])
+        index = dict(index, persons=persons)
+
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            for person_id, entry in record["persons"].items():
+                if entry is None:
+                    persons.pop(person_id, None)
+                else:
+                    persons[person_id] = entry
+            index["rows"] = record["rows"]
+            index["generation"] += 1
+
+        return index, offset + end
+
+    def _append_journal(self, index, offset, changes):
+        """Anexa uma escrita ao journal; retorna o tamanho do journal depois dela"""
+        # Mesma geração que os leitores terão ao aplicar a linha
+        index["generation"] += 1
+        line = json.dumps({"rows": index["rows"], "persons": changes}, separators=(",", ":")).encode() + b"\n"
+
+        with open(self._sibling(index["journal"]), "ab") as f:
+            # Descarta restos de uma escrita interrompida, como no arquivo de dados
+            f.truncate(offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        return offset + len(line)
+
+    def _sibling(self, name):
+        return os.path.join(os.path.dirname(os.path.abspath(self.data_path)), name)
+
+    def _data_file(self, index):
+        """Arquivo de dados atual (muda de nome a cada compactação)"""
+        return self._sibling(index["data_file"])
+
+    def _map_rows(self, index):
+        rows = index["rows"]
+        if rows == 0:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        return np.memmap(self._data_file(index), dtype=self.dtype, mode="r", shape=(rows, self.dim))
+
+    def refresh(self):
+        """Aplica o que outros processos escreveram desde a última leitura. Retorna True se mudou."""
+        with self._refresh_lock:
+            for _ in range(REFRESH_ATTEMPTS):
+                index, matrix, base_stamp, offset = self._view
+                stamp = self._stat_base()
+
+                try:
+                    if stamp != base_stamp:
+                        index, offset = self._read_base(), 0
+                    new_index, new_offset = self._read_journal(index, offset, stamp)
+
+                    if stamp == base_stamp and new_offset == offset:
+                        return False
+
+                    if new_index["rows"] != len(matrix) or new_index["data_file"] != self._view[0]["data_file"]:
+                        matrix = self._map_rows(new_index)
+                except FileNotFoundError:
+                    # Outro processo publicou um base novo (checkpoint ou compactação) durante a leitura
+                    continue
+
+                self._view = (new_index, matrix, stamp, new_offset)
+                return True
+
+        # Escritas seguidas de outros processos: fica com a versão atual e tenta no próximo refresh
+        logger.warning("Gallery store %s changed during %d refresh attempts, keeping generation %d",
+                       self.data_path, REFRESH_ATTEMPTS, self.generation)
+        return False
+
+    def state(self):
+        """Par (índice, matriz) consistente entre si"""
+        return self._view[:2]
+
+    @property
+    def generation(self):
+        return self._view[0]["generation"]
+
+    @property
+    def matrix(self):
+        """Todas as linhas do arquivo (inclusive as mortas), sem cópia"""
+        return self._view[1]
+
+    def _index_for_write(self):
+        """Cópia do índice atual para uma escrita (com o lock de escrita já adquirido)"""
+        self.refresh()
+        index = self._view[0]
+        return dict(index, persons=dict(index["persons"]))
+
+    def _append_rows(self, index, block):
+        start = index["rows"]
+        with open(self._data_file(index), "ab") as f:
+            # Descarta restos de uma escrita interrompida: o índice é a fonte da verdade
+            f.truncate(start * self.row_bytes)
+            f.write(np.ascontiguousarray(block, dtype=self.dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        index["rows"] = start + len(block)
+        return start
+
+    def _as_block(self, encodings):
+        if len(encodings) == 0:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        block = np.stack([np.asarray(e).ravel() for e in encodings])
+        if block.shape[1] != self.dim:
+            raise ValueError(f"Encoding size {block.shape[1]} does not match store dim {self.dim}")
+        return block
+
+    def put_person(self, person_id, encodings, metadata=None):
+        """Grava (ou substitui) os encodings de uma pessoa"""
+        self.put_many({person_id: (encodings, metadata)})
+
+    def put_many(self, persons, only_if_empty=False):
+        """Grava várias pessoas de uma vez: {person_id: (encodings, metadata)}; encodings vazio remove"""
+        blocks = {person_id: self._as_block(encodings) for person_id, (encodings, _) in persons.items()}
+
+        with self._write_lock():
+            index = self._index_for_write()
+
+            if only_if_empty and index["persons"]:
+                return False
+
+            changes = {}
+            for person_id, (_, metadata) in persons.items():
+                block = blocks[person_id]
+                if len(block) == 0:
+                    if index["persons"].pop(person_id, None) is not None:
+                        changes[person_id] = None
+                    continue
+                start = self._append_rows(index, block)
+                index["persons"][person_id] = changes[person_id] = {
+                    "start": start,
+                    "count": len(block),
+                    "metadata": list(metadata or []),
+                }
+
+            if changes:
+                self._commit_index(index, changes)
+
+        self.refresh()
+        return True
+
+    def remove_person(self, person_id):
+        self.put_person(person_id, [])
+
+    def has_person(self, person_id):
+        return person_id in self._view[0]["persons"]
+
+    def person_ids(self):
+        return list(self._view[0]["persons"].keys())
+
+    def get_person(self, person_id):
+        """Retorna (encodings, metadata) da pessoa; encodings é uma view do memmap"""
+        index, matrix = self.state()
+        entry = index["persons"].get(person_id)
+        if entry is None:
+            return np.empty((0, self.dim), dtype=self.dtype), []
+        start = entry["start"]
+        return matrix[start:start + entry["count"]], entry["metadata"]
+
+    def segments(self, index=None):
+        """Segmentos contíguos que cobrem todas as linhas do arquivo.
+
+        Retorna (starts, labels): label é o person_id dono do segmento ou None
+        para linhas mortas (substituídas por um retreino).
+        """
+        if index is None:
+            index = self._view[0]
+        entries = sorted((e["start"], e["count"], p) for p, e in index["persons"].items())
+        starts, labels = [], []
+        position = 0
+
+        for start, count, person_id in entries:
+            if start > position:
+                starts.append(position)
+                labels.append(None)
+            starts.append(start)
+            labels.append(person_id)
+            position = start + count
+
+        if position < index["rows"]:
+            starts.append(position)
+            labels.append(None)
+
+        return np.array(starts, dtype=np.intp), labels
+
+    @staticmethod
+    def _dead_rows(index):
+        return index["rows"] - sum(e["count"] for e in index["persons"].values())
+
+    def dead_rows(self):
+        return self._dead_rows(self._view[0])
+
+    def _commit_index(self, index, changes):
+        """Publica uma escrita no journal; compacta se o espaço morto passou do limite"""
+        dead = self._dead_rows(index)
+        if dead > 0 and dead >= COMPACT_DEAD_RATIO * (index["rows"] - dead):
+            self._compact_locked(index)
+            return
+
+        if index["journal"] is None:
+            # Índice de antes do journal (ou store novo): começa com um base
+            self._write_base(index)
+            return
+
+        journal_size = self._append_journal(index, self._view[3], changes)
+        if journal_size >= max(JOURNAL_CHECKPOINT_BYTES, os.path.getsize(self.index_path)):
+            self._write_base(index)
+
+    def compact(self):
+        """Reescreve as linhas vivas num novo arquivo, eliminando o espaço morto.
+
+        O arquivo compactado recebe um nome novo e só passa a valer quando o
+        índice é trocado, então workers que ainda mapeiam o arquivo antigo
+        continuam lendo dados consistentes até o próximo refresh().
+        """
+        with self._write_lock():
+            self._compact_locked(self._index_for_write())
+
+        self.refresh()
+
+    def _compact_locked(self, index):
+        """Compacta e publica o índice (com o lock de escrita já adquirido)"""
+        current = self._map_rows(index)
+        old_file = self._data_file(index)
+
+        new_name = f"{os.path.basename(self.data_path)}.{index['generation'] + 1}"
+        new_file = os.path.join(os.path.dirname(old_file), new_name)
+        new_persons = {}
+        position = 0
+
+        with open(new_file, "wb") as f:
+            for person_id, entry in index["persons"].items():
+                start, count = entry["start"], entry["count"]
+                f.write(np.ascontiguousarray(current[start:start + count]).tobytes())
+                new_persons[person_id] = dict(entry, start=position)
+                position += count
+            f.flush()
+            os.fsync(f.fileno())
+
+        del current
+
+        index["persons"] = new_persons
+        index["rows"] = position
+        index["data_file"] = new_name
+        self._write_base(index)
+
+        # Mapeamentos existentes mantêm o inode antigo vivo até serem descartados
+        if os.path.exists(old_file) and old_file != new_file:
+            os.remove(old_file)
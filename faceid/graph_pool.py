@@ -0,0 +1,75 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class GraphPool:
+    """Pool de instâncias pré-criadas (ex.: grafos do MediaPipe) com checkout/checkin.
+
+    Os grafos do MediaPipe não podem processar dois frames ao mesmo tempo,
+    e criar um por requisição é lento. O pool cria `size` instâncias no
+    startup; cada requisição pega uma emprestada e devolve ao terminar,
+    esperando se todas estiverem em uso.
+    """
+
+    def __init__(self, factory, size, name="graph"):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+
+        self.name = name
+        self.size = size
+        self._instances = [factory() for _ in range(size)]
+        self._available = queue.LifoQueue()
+        for instance in self._instances:
+            self._available.put(instance)
+
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+
+    def checkout(self, timeout=None):
+        """Retira uma instância do pool (bloqueia até haver uma livre)"""
+        try:
+            instance = self._available.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.waits += 1
+            try:
+                instance = self._available.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No {self.name} available in pool after {timeout}s")
+
+        with self._lock:
+            self.checkouts += 1
+        return instance
+
+    def checkin(self, instance):
+        self._available.put(instance)
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """with pool.acquire() as graph: ... (devolve a instância mesmo com erro)"""
+        instance = self.checkout(timeout)
+        try:
+            yield instance
+        finally:
+            self.checkin(instance)
+
+    def warm_up(self, frame, run):
+        """Roda `run(instance, frame)` em todas as instâncias para inicializar os grafos"""
+        for instance in self._instances:
+            run(instance, frame)
+
+    def close(self):
+        for instance in self._instances:
+            close = getattr(instance, "close", None)
+            if close is not None:
+                close()
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "available": self._available.qsize(),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+        }
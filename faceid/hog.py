@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+
+# Versão do layout das features do fallback HOG, gravada no metadata de cada
+# encoding. v1 calculava o Sobel célula por célula (bordas erradas em cada
+# célula); encodings sem versão são recodificados no próximo treino incremental.
+HOG_FEATURE_VERSION = 2
+
+HOG_FACE_SIZE = 64
+HOG_CELL_SIZE = 8
+HOG_STATS = 6
+
+# 8x8 células x 6 estatísticas
+HOG_FEATURE_SIZE = (HOG_FACE_SIZE // HOG_CELL_SIZE) ** 2 * HOG_STATS
+
+
+def _cells(array, cell_size):
+    """View (linhas, colunas, cell_size * cell_size) com os pixels de cada célula"""
+    rows, cols = array.shape[0] // cell_size, array.shape[1] // cell_size
+    return array.reshape(rows, cell_size, cols, cell_size).swapaxes(1, 2).reshape(rows, cols, -1)
+
+
+def hog_cell_features(face_gray, cell_size=HOG_CELL_SIZE):
+    """Features HOG-like do rosto 64x64 em escala de cinza.
+
+    Os gradientes são calculados uma vez na imagem inteira e as estatísticas
+    de cada célula saem de um reshape, sem laço em Python. O layout é o mesmo
+    de antes: células em ordem de linha e, para cada uma, média/desvio do
+    pixel, da magnitude e do ângulo do gradiente.
+    """
+    face = face_gray.astype(np.float32)
+
+    gx = cv2.Sobel(face, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(face, cv2.CV_32F, 0, 1, ksize=3)
+
+    mag = cv2.magnitude(gx, gy)
+    angle = np.arctan2(gy, gx)
+
+    stats = []
+    for values in (face, mag, angle):
+        cells = _cells(values, cell_size)
+        stats.append(cells.mean(axis=2))
+        stats.append(cells.std(axis=2))
+
+    return np.stack(stats, axis=2).ravel().astype(np.float32)
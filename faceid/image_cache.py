@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Resultado da análise de uma imagem: encoding, caixa do rosto (x, y, w, h) e,
+# se já foi gerado, o crop 180x180 em JPEG. box None = nenhum rosto detectado.
+AnalyzedImage = namedtuple("AnalyzedImage", ["encoding", "box", "crop_jpeg"])
+
+
+class ImageCache:
+    """LRU limitado por quantidade e por idade, indexado pelo hash dos bytes da imagem.
+
+    Clientes repetem o /verify com a mesma imagem após timeouts e o /register
+    reenvia imagens já cadastradas; com o cache, decode, detecção e encoding
+    só rodam uma vez por imagem. Imagens sem rosto também entram no cache.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(image_data, padding):
+        """Hash dos bytes crus da imagem (o base64 já decodificado) e do padding do crop"""
+        digest = hashlib.blake2b(image_data, digest_size=16)
+        digest.update(b"padding=%d" % padding)
+        return digest.digest()
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            item = self._entries.get(key)
+
+            if item is not None and now - item[0] > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                item = None
+
+            if item is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,105 @@
+import base64
+import cv2
+import numpy as np
+from PIL import Image
+from .metrics import span
+
+# Tamanho padrão (quadrado) dos rostos cropados
+STANDARD_FACE_SIZE = 180
+
+# Margem (pixels) em volta do rosto detectado no crop quadrado
+DEFAULT_PADDING = 50
+
+
+def base64_to_bytes(image_base64):
+    """Bytes crus da imagem base64 (None se o base64 for inválido ou vazio)"""
+    try:
+        with span("base64_decode"):
+            image_data = base64.b64decode(image_base64)
+    except Exception:
+        return None
+
+    return image_data or None
+
+
+def decode_base64_image(image_base64):
+    """Decodifica uma imagem base64 direto da memória para um array RGB (sem arquivo temporário)"""
+    image_data = base64_to_bytes(image_base64)
+    return decode_image_bytes(image_data) if image_data is not None else None
+
+
+def decode_image_bytes(image_data):
+    """Decodifica os bytes de uma imagem (JPEG/PNG) para um array RGB"""
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+
+    with span("image_decode"):
+        image_bgr = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if image_bgr is None:
+            return None
+
+        return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+
+def square_crop_box(x, y, w, h, width, height, padding=DEFAULT_PADDING):
+    """Calcula um quadrado centrado no rosto (com padding) dentro dos limites da imagem"""
+    # Calcular centro do rosto
+    face_center_x = x + w // 2
+    face_center_y = y + h // 2
+
+    # Usar a maior dimensão para criar um quadrado
+    face_size = max(w, h)
+
+    # Adicionar padding
+    square_size = face_size + (2 * padding)
+    half_square = square_size // 2
+
+    # Calcular coordenadas do quadrado centrado no rosto
+    x1 = max(0, face_center_x - half_square)
+    y1 = max(0, face_center_y - half_square)
+    x2 = min(width, face_center_x + half_square)
+    y2 = min(height, face_center_y + half_square)
+
+    # Ajustar para garantir que seja quadrado
+    actual_width = x2 - x1
+    actual_height = y2 - y1
+
+    if actual_width != actual_height:
+        # Usar a menor dimensão para manter dentro da imagem
+        min_size = min(actual_width, actual_height)
+
+        # Recentrar
+        half_min = min_size // 2
+        x1 = face_center_x - half_min
+        y1 = face_center_y - half_min
+        x2 = face_center_x + half_min
+        y2 = face_center_y + half_min
+
+        # Garantir que está dentro dos limites
+        x1 = max(0, x1)
+        y1 = max(0, y1)
+        x2 = min(width, x2)
+        y2 = min(height, y2)
+
+    return x1, y1, x2, y2
+
+
+def crop_square(image_rgb, box, size=STANDARD_FACE_SIZE):
+    """Recorta a caixa e redimensiona para o tamanho padrão (mesmo filtro LANCZOS de antes)"""
+    x1, y1, x2, y2 = box
+    cropped_pil = Image.fromarray(image_rgb[y1:y2, x1:x2])
+    cropped_pil = cropped_pil.resize((size, size), Image.Resampling.LANCZOS)
+    return np.array(cropped_pil)
+
+
+def encode_jpeg(image_rgb, quality=95):
+    """Codifica um array RGB em bytes JPEG"""
+    ok, buffer = cv2.imencode('.jpg', cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode JPEG")
+    return buffer.tobytes()
+
+
+def encode_jpeg_base64(image_rgb, quality=95):
+    return base64.b64encode(encode_jpeg(image_rgb, quality)).decode()
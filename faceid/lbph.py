@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import cv2
+import numpy as np
+from .locking import replace_file
+
+# Arquivo padrão do recognizer LBPH, salvo junto com os modelos
+LBPH_FILE = "lbph_model.yml"
+
+logger = logging.getLogger(__name__)
+
+
+class LBPHMatcher:
+    """Um único LBPHFaceRecognizer treinado com todas as pessoas da galeria.
+
+    Cada pessoa recebe um label inteiro; o person_id fica guardado no próprio
+    arquivo do recognizer via setLabelInfo, então write/read preservam o
+    mapeamento. Novos cadastros entram com update() (só adiciona amostras);
+    como o LBPH não permite remover amostras, alterações/remoções de imagens
+    exigem um rebuild a partir da galeria.
+
+    Os encodings da galeria são os pixels 100x100 do rosto, então o
+    recognizer pode ser (re)construído sem reler o dataset.
+    """
+
+    def __init__(self, path=LBPH_FILE, face_size=(100, 100)):
+        self.path = path
+        self.face_size = face_size
+        self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+        self._labels = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _faces(self, encodings):
+        """Encodings (pixels achatados) -> lista de imagens uint8 em escala de cinza"""
+        height, width = self.face_size[1], self.face_size[0]
+        return [np.asarray(e, dtype=np.uint8).reshape(height, width) for e in encodings]
+
+    def _label_for(self, person_id):
+        label = self._labels.get(person_id)
+        if label is None:
+            label = max(self._labels.values(), default=-1) + 1
+            self._labels[person_id] = label
+            self.recognizer.setLabelInfo(label, person_id)
+        return label
+
+    def rebuild(self, encodings_by_person):
+        """Treina o recognizer do zero com {person_id: encodings}"""
+        faces = []
+        labels = []
+
+        with self._lock:
+            self.recognizer = cv2.face.LBPHFaceRecognizer_create()
+            self._labels = {}
+            self._counts = {}
+
+            for person_id, encodings in encodings_by_person.items():
+                if len(encodings) == 0:
+                    continue
+                label = self._label_for(person_id)
+                person_faces = self._faces(encodings)
+                faces.extend(person_faces)
+                labels.extend([label] * len(person_faces))
+                self._counts[person_id] = len(person_faces)
+
+            if faces:
+                self.recognizer.train(faces, np.array(labels, dtype=np.int32))
+
+        logger.info("LBPH recognizer trained: %d persons, %d faces", len(self._counts), len(faces))
+
+    def update(self, person_id, encodings):
+        """Adiciona novas amostras de uma pessoa sem retreinar as demais"""
+        if len(encodings) == 0:
+            return
+
+        with self._lock:
+            label = self._label_for(person_id)
+            faces = self._faces(encodings)
+            labels = np.full(len(faces), label, dtype=np.int32)
+
+            if self._counts:
+                self.recognizer.update(faces, labels)
+            else:
+                self.recognizer.train(faces, labels)
+
+            self._counts[person_id] = self._counts.get(person_id, 0) + len(faces)
+
+    def is_empty(self):
+        return not self._counts
+
+    def face_counts(self):
+        return dict(self._counts)
+
+    def min_distances(self, face):
+        """Menor distância LBPH (chi-quadrado dos histogramas) para cada pessoa"""
+        face = np.asarray(face, dtype=np.uint8).reshape(self.face_size[1], self.face_size[0])
+
+        with self._lock:
+            if not self._counts:
+                return {}
+
+            collector = cv2.face.StandardCollector_create()
+            self.recognizer.predict_collect(face, collector)
+            results = collector.getResults(True)
+            names = {label: person_id for person_id, label in self._labels.items()}
+
+        distances = {}
+        for label, distance in results:
+            person_id = names.get(label)
+            if person_id is not None and (person_id not in distances or distance < distances[person_id]):
+                distances[person_id] = distance
+
+        return distances
+
+    def save(self):
+        """Grava num arquivo temporário e publica com fsync + os.replace (leitores nunca veem o arquivo pela metade)"""
+        with self._lock:
+            if self._counts:
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp.yml"
+                self.recognizer.write(tmp_path)
+                replace_file(tmp_path, self.path)
+
+    def load(self):
+        """Lê o recognizer salvo; retorna False se o arquivo não existir ou for inválido"""
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.read(self.path)
+
+            labels, counts = np.unique(recognizer.getLabels().ravel(), return_counts=True)
+            names = {int(label): recognizer.getLabelInfo(int(label)) for label in labels}
+        except Exception as e:
+            logger.error("Error loading LBPH recognizer from %s: %s", self.path, e)
+            return False
+
+        with self._lock:
+            self.recognizer = recognizer
+            self._labels = {names[label]: label for label in names}
+            self._counts = {names[int(label)]: int(count) for label, count in zip(labels, counts)}
+
+        logger.info("LBPH recognizer loaded from %s: %d persons", self.path, len(self._counts))
+        return True
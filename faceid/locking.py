@@ -0,0 +1,89 @@
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Diretório (ao lado dos modelos) onde ficam os arquivos de lock por pessoa
+LOCK_DIR = ".locks"
+
+
+def atomic_write(path, data, overwrite=True):
+    """Grava `data` (bytes) em `path` de forma atômica.
+
+    Escreve num arquivo temporário no mesmo diretório, faz fsync e troca com
+    os.replace. Leitores veem o arquivo antigo inteiro ou o novo inteiro,
+    nunca um arquivo truncado, e não precisam de lock. Com overwrite=False o
+    arquivo é publicado com os.link, que falha com FileExistsError se o nome
+    já existir (mesmo com outro processo gravando ao mesmo tempo).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if overwrite:
+            os.replace(tmp_path, path)
+        else:
+            os.link(tmp_path, path)
+            os.remove(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Persistir também a entrada do diretório (o rename)
+    _fsync_directory(directory)
+
+
+def replace_file(tmp_path, path):
+    """Publica um arquivo temporário já escrito por outra biblioteca (ex.: recognizer.write).
+
+    Mesmas garantias do atomic_write: fsync do conteúdo, os.replace e fsync
+    do diretório. Em caso de erro o temporário é removido.
+    """
+    try:
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def _fsync_directory(directory):
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Lock exclusivo entre processos (fcntl.flock) num arquivo de lock.
+
+    Cada chamada abre o arquivo de novo, então threads do mesmo processo
+    também se excluem mutuamente.
+    """
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def person_lock(model_path):
+    """Lock do ciclo leitura-treino-escrita do modelo de uma pessoa.
+
+    Só quem escreve usa o lock; leitores contam com a escrita atômica.
+    """
+    lock_dir = os.path.join(os.path.dirname(os.path.abspath(model_path)), LOCK_DIR)
+    os.makedirs(lock_dir, exist_ok=True)
+    return file_lock(os.path.join(lock_dir, os.path.basename(model_path) + ".lock"))
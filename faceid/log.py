@@ -0,0 +1,14 @@
+import logging
+import os
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+
+
+def configure_logging(level=None):
+    """Logging da API e dos scripts; o nível vem de LOG_LEVEL (padrão INFO).
+
+    Em INFO sai uma linha por decisão (match / no match, treino, carga de
+    modelos); distâncias, thresholds e durações de cada etapa só em DEBUG.
+    """
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    logging.basicConfig(level=level.upper() if isinstance(level, str) else level, format=LOG_FORMAT)
@@ -1,21 +1,48 @@
+import logging
 import os
 import numpy as np
-import pickle
+from .distance import as_matrix, euclidean_distances, squared_norms
+from .model_format import read_model_file, write_model_file
+from .metrics import span
+
+logger = logging.getLogger(__name__)
 
 class MediaPipeFaceModel:
+    # Threshold otimizado para MediaPipe (landmarks têm distâncias menores)
+    DISTANCE_THRESHOLD = 0.6  # Muito mais baixo que OpenCV
+
     def __init__(self, model_path="facial_recognition_model.pkl"):
         self.known_face_encodings = []
         self.known_face_metadata = []
+        # Imagens da pasta sem rosto detectado {image_file: assinatura}, para o
+        # treino incremental não decodificá-las de novo enquanto não mudarem
+        self.no_face_images = {}
         self.model_path = model_path
-        # Threshold otimizado para MediaPipe (landmarks têm distâncias menores)
-        self.distance_threshold = 0.6  # Muito mais baixo que OpenCV
+        self.distance_threshold = self.DISTANCE_THRESHOLD
+        self._matrix_cache = None
         
         if model_path and os.path.exists(model_path):
             self.load_model()
     
+    @classmethod
+    def from_store(cls, store, person_id, model_path=None):
+        """Cria o modelo a partir da galeria mapeada em memória, sem copiar os encodings.
+        
+        model_path é o caminho do modelo no registry (registry.model_path(person_id));
+        sem ele o modelo é só leitura e save_model não grava nada.
+        """
+        model = cls(None)
+        encodings, metadata = store.get_person(person_id)
+        model.model_path = model_path
+        model.known_face_encodings = list(encodings)
+        model.known_face_metadata = list(metadata)
+        model._matrix_cache = (encodings, squared_norms(encodings))
+        return model
+    
     def add_face(self, face_encoding, metadata):
         self.known_face_encodings.append(face_encoding)
         self.known_face_metadata.append(metadata)
+        self._matrix_cache = None
         return len(self.known_face_encodings) - 1
     
     def calculate_distance(self, encoding1, encoding2):
@@ -36,74 +63,105 @@ class MediaPipeFaceModel:
             
             return normalized_distance
         except Exception as e:
-            print(f"Error calculating distance: {e}")
+            logger.error("Error calculating distance: %s", e)
             return float('inf')
     
+    def get_encoding_matrix(self):
+        """Encodings empilhados em float32 com as normas em cache.
+        
+        Retorna None se os encodings têm tamanhos diferentes (modelos legados),
+        caso em que só o cálculo item a item com truncamento se aplica.
+        """
+        if self._matrix_cache is None:
+            if len({len(e) for e in self.known_face_encodings}) != 1:
+                return None
+            matrix = as_matrix(self.known_face_encodings)
+            self._matrix_cache = (matrix, squared_norms(matrix))
+        return self._matrix_cache
+    
+    def calculate_distances(self, face_encoding):
+        """Distâncias normalizadas do encoding para todos os encodings conhecidos"""
+        face_encoding = np.asarray(face_encoding).ravel()
+        cached = self.get_encoding_matrix()
+        
+        if cached is None or cached[0].shape[1] != len(face_encoding):
+            # Tamanhos incompatíveis: manter o comportamento de truncamento
+            return np.array([self.calculate_distance(face_encoding, e) for e in self.known_face_encodings])
+        
+        matrix, sq_norms = cached
+        return euclidean_distances(face_encoding, matrix, sq_norms) / np.sqrt(len(face_encoding))
+    
     def identify_face(self, face_encoding):
         if len(self.known_face_encodings) == 0:
-            print("No known faces in model")
+            logger.debug("No known faces in model")
             return None, 1.0
             
-        distances = []
-        for known_encoding in self.known_face_encodings:
-            distance = self.calculate_distance(face_encoding, known_encoding)
-            distances.append(distance)
+        distances = self.calculate_distances(face_encoding)
         
         best_match_index = np.argmin(distances)
         best_distance = distances[best_match_index]
         
-        print(f"Best distance (MediaPipe): {best_distance}, threshold: {self.distance_threshold}")
-        print(f"All distances: {distances}")
+        # Lazy: o array inteiro só é formatado com DEBUG ligado
+        logger.debug("Best distance (MediaPipe): %s, threshold: %s", best_distance, self.distance_threshold)
+        logger.debug("All distances: %s", distances)
         
         if best_distance <= self.distance_threshold:
             metadata = self.known_face_metadata[best_match_index]
-            print(f"Match found (MediaPipe): {metadata}")
+            logger.debug("Match found (MediaPipe): %s", metadata)
             # Converter distância para similaridade (ajustado para MediaPipe)
             similarity = max(0, 1 - (best_distance / 2.0))
             return metadata, similarity
         else:
-            print(f"No match - distance {best_distance} above threshold {self.distance_threshold}")
+            logger.debug("No match - distance %s above threshold %s", best_distance, self.distance_threshold)
             similarity = max(0, 1 - (best_distance / 2.0))
             return None, similarity
     
     def save_model(self):
-        data = {
-            "encodings": self.known_face_encodings,
-            "metadata": self.known_face_metadata,
-            "model_type": "mediapipe"
-        }
+        if not self.model_path:
+            logger.warning("MediaPipe model has no path (read-only), not saved")
+            return False
         
         try:
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(data, f)
-            print(f"MediaPipe model saved successfully to {self.model_path}")
+            with span("model_save"):
+                write_model_file(self.model_path, self.known_face_encodings, self.known_face_metadata,
+                                 model_type="mediapipe", no_face_images=self.no_face_images)
+            logger.debug("MediaPipe model saved successfully to %s", self.model_path)
             return True
         except Exception as e:
-            print(f"Error saving MediaPipe model to {self.model_path}: {e}")
+            logger.error("Error saving MediaPipe model to %s: %s", self.model_path, e)
             return False
             
     def load_model(self):
         try:
-            with open(self.model_path, 'rb') as f:
-                data = pickle.load(f)
+            data = read_model_file(self.model_path)
                 
-            self.known_face_encodings = data["encodings"]
+            self.known_face_encodings = list(data["encodings"])
             self.known_face_metadata = data["metadata"]
+            self.no_face_images = data["no_face_images"]
+            self._matrix_cache = None
             
             # Verificar se é modelo MediaPipe
             if data.get("model_type") == "mediapipe":
-                print(f"MediaPipe model loaded successfully from {self.model_path}")
+                logger.debug("MediaPipe model loaded successfully from %s", self.model_path)
             else:
-                print(f"Legacy model loaded from {self.model_path}, converting to MediaPipe format")
+                logger.info("Legacy model loaded from %s, converting to MediaPipe format", self.model_path)
                 
             return True
         except Exception as e:
-            print(f"Error loading model from {self.model_path}: {e}")
+            logger.error("Error loading model from %s: %s", self.model_path, e)
             return False
 
+    def keep_faces(self, indices):
+        """Mantém apenas os encodings nos índices informados (remoção incremental)"""
+        self.known_face_encodings = [self.known_face_encodings[i] for i in indices]
+        self.known_face_metadata = [self.known_face_metadata[i] for i in indices]
+        self._matrix_cache = None
+
     def clear_model(self):
         self.known_face_encodings = []
         self.known_face_metadata = []
+        self.no_face_images = {}
+        self._matrix_cache = None
 
     def get_face_count(self):
         return len(self.known_face_encodings)
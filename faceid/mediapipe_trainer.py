@@ -1,149 +1,194 @@
 import cv2
+import logging
 import numpy as np
 import os
-import base64
-from PIL import Image
-import io
+import threading
 import mediapipe as mp
 from .mediapipe_model import MediaPipeFaceModel
+from .dataset import IMAGE_EXTENSIONS, plan_incremental_update, save_person_image, scan_person_images, unchanged_images
+from .locking import person_lock
+from .image_utils import DEFAULT_PADDING, STANDARD_FACE_SIZE, decode_base64_image, encode_jpeg, encode_jpeg_base64
+from .detection import DetectionResult
+from .gallery import get_gallery
+from .hog import HOG_FACE_SIZE, HOG_FEATURE_SIZE, HOG_FEATURE_VERSION, hog_cell_features
+from .graph_pool import GraphPool
+from .registry import ModelRegistry
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Namespace dos modelos: landmarks do Face Mesh + fallback HOG na versão atual
+MEDIAPIPE_FEATURES = f"landmarks-hog-v{HOG_FEATURE_VERSION}"
+
+# Threshold efetivo = DISTANCE_THRESHOLD do modelo x THRESHOLD_FACTOR (mais rigoroso)
+THRESHOLD_FACTOR = 0.8
+
+# Margem mínima entre a melhor e a segunda melhor pessoa
+MATCH_MARGIN = 0.25
+
+# Landmarks chave do Face Mesh usados no encoding (pontos importantes para identificação)
+KEY_LANDMARKS = [
+    # Contorno do rosto
+    10, 151, 9, 175, 136, 172, 58, 132, 93, 234, 127, 162, 21, 54, 103, 67, 109,
+    # Olhos
+    33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246,
+    # Nariz
+    1, 2, 5, 4, 6, 168, 8, 9, 10, 151, 195, 197, 196, 3, 51, 48, 115, 131, 134, 102,
+    # Boca
+    11, 12, 13, 14, 15, 16, 17, 18, 200, 199, 175, 0, 269, 270, 267, 271, 272, 408, 415, 310, 311, 312, 13, 82, 81, 80, 78
+]
+
+# (x, y) de cada landmark chave
+LANDMARK_ENCODING_SIZE = 2 * len(KEY_LANDMARKS)
+
+# Intervalo (s) em que a galeria relê os modelos gravados por outros processos
+GALLERY_RELOAD_INTERVAL = float(os.environ.get("MEDIAPIPE_GALLERY_RELOAD", 2.0))
 
 class MediaPipeFaceTrainer:
-    def __init__(self):
+    def __init__(self, pool_size=None):
         # Inicializar MediaPipe
         self.mp_face_detection = mp.solutions.face_detection
         self.mp_face_mesh = mp.solutions.face_mesh
         self.mp_drawing = mp.solutions.drawing_utils
         
+        # Modelos em models/mediapipe/<versão das features>/, separados dos do OpenCV
+        self.registry = ModelRegistry("mediapipe", MEDIAPIPE_FEATURES)
+        self.registry.ensure(accept=self._accept_legacy_model)
+        
+        # Os grafos não podem ser usados por duas threads ao mesmo tempo: cada
+        # requisição pega um detector/mesh emprestado de um pool pré-criado,
+        # do tamanho do número de threads do worker
+        if pool_size is None:
+            pool_size = int(os.environ.get("MEDIAPIPE_POOL_SIZE", min(os.cpu_count() or 1, 4)))
+        
         # Configurar detecção de rostos (otimizada para qualidade)
-        self.face_detection = self.mp_face_detection.FaceDetection(
+        self.detection_pool = GraphPool(lambda: self.mp_face_detection.FaceDetection(
             model_selection=1,  # 1 para melhor qualidade (0 para velocidade)
             min_detection_confidence=0.7
-        )
+        ), pool_size, name="FaceDetection")
         
         # Configurar face mesh para landmarks faciais
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
+        self.mesh_pool = GraphPool(lambda: self.mp_face_mesh.FaceMesh(
             static_image_mode=True,
             max_num_faces=1,
             refine_landmarks=True,
             min_detection_confidence=0.7,
             min_tracking_confidence=0.5
+        ), pool_size, name="FaceMesh")
+        
+        # Galerias (uma por tamanho de encoding: landmarks e HOG), carregadas
+        # na primeira verificação; o retreino offline nunca as carrega
+        self._galleries = None
+        self._galleries_lock = threading.Lock()
+        
+        self.warm_up()
+    
+    def warm_up(self):
+        """Processa um frame vazio em todos os grafos para a primeira requisição não pagar a inicialização"""
+        dummy_frame = np.zeros((STANDARD_FACE_SIZE, STANDARD_FACE_SIZE, 3), dtype=np.uint8)
+        self.detection_pool.warm_up(dummy_frame, lambda graph, frame: graph.process(frame))
+        self.mesh_pool.warm_up(dummy_frame, lambda graph, frame: graph.process(frame))
+        logger.info("MediaPipe graphs warmed up (pool size %d)", self.detection_pool.size)
+    
+    def create_tracking_mesh(self, min_tracking_confidence=0.5):
+        """FaceMesh em modo vídeo (tracking) para uma sessão de stream; não vem do pool"""
+        return self.mp_face_mesh.FaceMesh(
+            static_image_mode=False,
+            max_num_faces=1,
+            refine_landmarks=True,
+            min_detection_confidence=0.7,
+            min_tracking_confidence=min_tracking_confidence
         )
     
-    def crop_face_from_base64(self, image_base64, padding=50):
+    def detect_face(self, image_rgb, padding=DEFAULT_PADDING):
+        """Roda o FaceDetection uma única vez e retorna o DetectionResult (ou None)"""
+        # Processar com MediaPipe
+        with span("detect"), self.detection_pool.acquire() as face_detection:
+            results = face_detection.process(image_rgb)
+        
+        if not results.detections:
+            return None
+        
+        # Usar a primeira detecção
+        bbox = results.detections[0].location_data.relative_bounding_box
+        
+        height, width = image_rgb.shape[:2]
+        
+        # Converter coordenadas relativas para absolutas
+        x = int(bbox.xmin * width)
+        y = int(bbox.ymin * height)
+        w = int(bbox.width * width)
+        h = int(bbox.height * height)
+        
+        detection = DetectionResult(image_rgb, (x, y, w, h), padding)
+        return None if detection.is_empty else detection
+    
+    def crop_face(self, image_rgb, padding=DEFAULT_PADDING):
+        """Detecta o rosto com MediaPipe e retorna o crop quadrado 180x180 (RGB) em memória"""
+        detection = self.detect_face(image_rgb, padding)
+        
+        if detection is None:
+            return None
+        
+        w, h = detection.original_size
+        logger.debug("Face cropped (MediaPipe): original face %dx%d -> square %dx%d", w, h, STANDARD_FACE_SIZE, STANDARD_FACE_SIZE)
+        
+        return detection.crop
+    
+    def crop_face_from_base64(self, image_base64, padding=DEFAULT_PADDING):
         """Extrai e cropa o rosto de uma imagem base64 usando MediaPipe"""
         try:
-            image_data = base64.b64decode(image_base64)
-            image = Image.open(io.BytesIO(image_data))
-            image_rgb = np.array(image.convert('RGB'))
-            
-            # Processar com MediaPipe
-            results = self.face_detection.process(image_rgb)
-            
-            if not results.detections:
+            image_rgb = decode_base64_image(image_base64)
+            if image_rgb is None:
                 return None
             
-            # Usar a primeira detecção
-            detection = results.detections[0]
-            bbox = detection.location_data.relative_bounding_box
-            
-            height, width = image_rgb.shape[:2]
-            
-            # Converter coordenadas relativas para absolutas
-            x = int(bbox.xmin * width)
-            y = int(bbox.ymin * height)
-            w = int(bbox.width * width)
-            h = int(bbox.height * height)
-            
-            # Calcular centro do rosto
-            face_center_x = x + w // 2
-            face_center_y = y + h // 2
-            
-            # Usar a maior dimensão para criar um quadrado
-            face_size = max(w, h)
-            
-            # Adicionar padding
-            square_size = face_size + (2 * padding)
-            half_square = square_size // 2
-            
-            # Calcular coordenadas do quadrado centrado no rosto
-            x1 = max(0, face_center_x - half_square)
-            y1 = max(0, face_center_y - half_square)
-            x2 = min(width, face_center_x + half_square)
-            y2 = min(height, face_center_y + half_square)
-            
-            # Ajustar para garantir que seja quadrado
-            actual_width = x2 - x1
-            actual_height = y2 - y1
-            
-            if actual_width != actual_height:
-                # Usar a menor dimensão para manter dentro da imagem
-                min_size = min(actual_width, actual_height)
-                
-                # Recentrar
-                half_min = min_size // 2
-                x1 = face_center_x - half_min
-                y1 = face_center_y - half_min
-                x2 = face_center_x + half_min
-                y2 = face_center_y + half_min
-                
-                # Garantir que está dentro dos limites
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(width, x2)
-                y2 = min(height, y2)
-            
-            # Cropar o rosto
-            cropped_face = image_rgb[y1:y2, x1:x2]
-            
-            # Converter de volta para PIL Image
-            cropped_pil = Image.fromarray(cropped_face)
-            
-            # Redimensionar para tamanho padrão (quadrado)
-            standard_size = 180
-            cropped_pil = cropped_pil.resize((standard_size, standard_size), Image.Resampling.LANCZOS)
-            
-            # Converter para base64
-            buffer = io.BytesIO()
-            cropped_pil.save(buffer, format='JPEG', quality=95)
-            cropped_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            print(f"Face cropped (MediaPipe): original face {w}x{h} -> square {standard_size}x{standard_size}")
+            detection = self.detect_face(image_rgb, padding)
+            if detection is None:
+                return None
             
-            return cropped_base64
+            with span("crop"):
+                return encode_jpeg_base64(detection.crop, quality=95)
             
         except Exception as e:
-            print(f"Error cropping face with MediaPipe: {e}")
+            logger.error("Error cropping face with MediaPipe: %s", e)
             return None
     
-    def extract_face_landmarks(self, image):
-        """Extrai landmarks faciais usando MediaPipe Face Mesh"""
+    def find_face_landmarks(self, image, face_mesh=None):
+        """Roda o Face Mesh e retorna os landmarks crus do primeiro rosto (ou None).
+        
+        face_mesh permite usar um grafo próprio (ex.: o de uma sessão de stream
+        em modo tracking) em vez de um do pool estático.
+        """
+        if face_mesh is not None:
+            results = face_mesh.process(image)
+        else:
+            with self.mesh_pool.acquire() as face_mesh:
+                results = face_mesh.process(image)
+        
+        if not results.multi_face_landmarks:
+            return None
+        
+        # Usar os landmarks do primeiro rosto detectado
+        return results.multi_face_landmarks[0]
+    
+    def extract_face_landmarks(self, image, face_mesh=None, face_landmarks=None):
+        """Extrai landmarks faciais usando MediaPipe Face Mesh.
+        
+        face_landmarks evita rodar o Face Mesh de novo quando os landmarks
+        crus da imagem já foram obtidos (ex.: pela sessão de stream).
+        """
         try:
-            results = self.face_mesh.process(image)
-            
-            if not results.multi_face_landmarks:
-                return None
-            
-            # Usar os landmarks do primeiro rosto detectado
-            face_landmarks = results.multi_face_landmarks[0]
+            if face_landmarks is None:
+                face_landmarks = self.find_face_landmarks(image, face_mesh)
+                if face_landmarks is None:
+                    return None
             
             # Extrair coordenadas dos landmarks importantes
             height, width = image.shape[:2]
             landmarks = []
             
             # Selecionar landmarks chave para reconhecimento facial
-            # Estes são pontos importantes do rosto para identificação
-            key_landmarks = [
-                # Contorno do rosto
-                10, 151, 9, 175, 136, 172, 58, 132, 93, 234, 127, 162, 21, 54, 103, 67, 109,
-                # Olhos
-                33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246,
-                # Nariz
-                1, 2, 5, 4, 6, 168, 8, 9, 10, 151, 195, 197, 196, 3, 51, 48, 115, 131, 134, 102,
-                # Boca
-                11, 12, 13, 14, 15, 16, 17, 18, 200, 199, 175, 0, 269, 270, 267, 271, 272, 408, 415, 310, 311, 312, 13, 82, 81, 80, 78
-            ]
-            
-            for idx in key_landmarks:
+            for idx in KEY_LANDMARKS:
                 if idx < len(face_landmarks.landmark):
                     landmark = face_landmarks.landmark[idx]
                     x = int(landmark.x * width)
@@ -159,310 +204,370 @@ class MediaPipeFaceTrainer:
             return np.array(landmarks, dtype=np.float32)
             
         except Exception as e:
-            print(f"Error extracting face landmarks: {e}")
+            logger.error("Error extracting face landmarks: %s", e)
             return None
     
-    def extract_face_encoding(self, image):
-        """Extrai encoding facial usando MediaPipe"""
+    def extract_face_encoding(self, image, detection=None):
+        """Extrai encoding facial usando MediaPipe.
+        
+        Com uma detecção já feita, o Face Mesh roda sobre o crop 180x180 dela
+        e o fallback usa a mesma caixa, sem rodar o detector de novo.
+        """
         try:
-            # Primeiro tentar com landmarks do Face Mesh
-            landmarks = self.extract_face_landmarks(image)
-            
-            if landmarks is not None:
-                # Normalizar os landmarks
-                landmarks = landmarks / np.linalg.norm(landmarks)
-                return landmarks
-            
-            # Fallback: usar detecção simples + HOG-like features
-            results = self.face_detection.process(image)
-            
-            if not results.detections:
-                return None
-            
-            detection = results.detections[0]
-            bbox = detection.location_data.relative_bounding_box
-            
-            height, width = image.shape[:2]
-            
-            x = int(bbox.xmin * width)
-            y = int(bbox.ymin * height)
-            w = int(bbox.width * width)
-            h = int(bbox.height * height)
-            
-            # Extrair ROI do rosto
-            face_roi = image[y:y+h, x:x+w]
-            
-            if face_roi.size == 0:
-                return None
-            
-            # Converter para grayscale e redimensionar
-            gray = cv2.cvtColor(face_roi, cv2.COLOR_RGB2GRAY)
-            face_resized = cv2.resize(gray, (64, 64))
-            
-            # Calcular HOG features para melhor representação
-            # Dividir a face em células e calcular gradientes
-            features = []
-            cell_size = 8
-            for i in range(0, 64, cell_size):
-                for j in range(0, 64, cell_size):
-                    cell = face_resized[i:i+cell_size, j:j+cell_size]
-                    
-                    # Calcular gradientes
-                    gx = cv2.Sobel(cell.astype(np.float32), cv2.CV_32F, 1, 0, ksize=3)
-                    gy = cv2.Sobel(cell.astype(np.float32), cv2.CV_32F, 0, 1, ksize=3)
-                    
-                    # Magnitude e direção
-                    mag = np.sqrt(gx**2 + gy**2)
-                    angle = np.arctan2(gy, gx)
-                    
-                    # Estatísticas da célula
-                    features.extend([
-                        np.mean(cell),
-                        np.std(cell),
-                        np.mean(mag),
-                        np.std(mag),
-                        np.mean(angle),
-                        np.std(angle)
-                    ])
-            
-            return np.array(features, dtype=np.float32)
-            
+            with span("encode"):
+                return self._extract_face_encoding(image, detection)
         except Exception as e:
-            print(f"Error extracting face encoding: {e}")
+            logger.error("Error extracting face encoding: %s", e)
+            return None
+    
+    def landmarks_encoding(self, face_image, face_landmarks=None):
+        """Encoding de landmarks normalizado do rosto cropado (None se o Face Mesh não achar o rosto).
+        
+        Verificação, treino e stream passam por aqui com o crop 180x180 da
+        detecção, então as distâncias são comparáveis entre eles.
+        """
+        landmarks = self.extract_face_landmarks(face_image, face_landmarks=face_landmarks)
+        
+        if landmarks is None:
+            return None
+        
+        # Normalizar os landmarks
+        return landmarks / np.linalg.norm(landmarks)
+    
+    def _extract_face_encoding(self, image, detection):
+        # Primeiro tentar com landmarks do Face Mesh
+        landmarks = self.landmarks_encoding(detection.crop if detection is not None else image)
+        
+        if landmarks is not None:
+            return landmarks
+        
+        # Fallback: usar detecção simples + HOG-like features
+        if detection is None:
+            detection = self.detect_face(image)
+        
+        if detection is None:
             return None
+        
+        # ROI do rosto já em escala de cinza, redimensionada
+        face_resized = cv2.resize(detection.gray_roi, (HOG_FACE_SIZE, HOG_FACE_SIZE))
+        
+        # HOG features vetorizadas (gradientes da imagem inteira, estatísticas por célula)
+        return hog_cell_features(face_resized)
+    
+    @staticmethod
+    def _is_stale_hog(encoding, metadata):
+        """Encoding do fallback HOG gravado com um layout de features anterior"""
+        return len(encoding) == HOG_FEATURE_SIZE and metadata.get("feature_version") != HOG_FEATURE_VERSION
+    
+    def _is_own_encoding(self, encoding, metadata):
+        """Encoding do MediaPipe (float, sem projeção do OpenCV) no layout atual do HOG"""
+        return (np.asarray(encoding).dtype.kind == 'f' and "projection" not in metadata
+                and not self._is_stale_hog(encoding, metadata))
+    
+    def _accept_legacy_model(self, data):
+        """Índices dos encodings de um *_model.pkl legado que pertencem a este namespace"""
+        if data["model_type"] not in (None, "mediapipe"):
+            return []
+        
+        return [
+            i for i, (e, m) in enumerate(zip(data["encodings"], data["metadata"]))
+            if self._is_own_encoding(e, m)
+        ]
+    
+    def train_person(self, person_id, dataset_path="dataset", incremental=True, images=None):
+        """Treina o modelo da pessoa; no modo incremental só codifica imagens novas.
+        
+        images: cache opcional de decode {image_file: RGB}, como no OpenCVFaceTrainer.
+        """
+        # Ciclo ler-treinar-salvar exclusivo por pessoa, entre threads e processos
+        with person_lock(self.registry.model_path(person_id)):
+            return self._train_person(person_id, dataset_path, incremental, images)
     
-    def train_person(self, person_id, dataset_path="dataset"):
+    def _train_person(self, person_id, dataset_path, incremental, images=None):
         person_path = os.path.join(dataset_path, person_id)
         
         if not os.path.exists(person_path):
-            print(f"Person folder does not exist: {person_path}")
+            logger.warning("Person folder does not exist: %s", person_path)
             return False
             
-        face_model = MediaPipeFaceModel(f"{person_id}_model.pkl")
-        face_model.clear_model()
+        face_model = MediaPipeFaceModel(self.registry.model_path(person_id))
+        current_images = scan_person_images(person_path)
+        no_face_before = face_model.no_face_images
         
-        print(f"Training person {person_id} from folder: {person_path} (MediaPipe)")
+        if incremental:
+            total_before = face_model.get_face_count()
+            
+            # Descartar encodings do OpenCV e encodings HOG de versões anteriores
+            # vindos de modelos migrados (são recodificados abaixo)
+            valid = [
+                i for i, (e, m) in enumerate(zip(face_model.known_face_encodings, face_model.known_face_metadata))
+                if self._is_own_encoding(e, m)
+            ]
+            face_model.keep_faces(valid)
+            
+            keep_indices, image_files = plan_incremental_update(
+                face_model.known_face_metadata, current_images, face_model.no_face_images)
+            faces_removed = total_before - len(keep_indices)
+            face_model.keep_faces(keep_indices)
+            # Imagens sem rosto só continuam registradas enquanto não mudarem
+            face_model.no_face_images = unchanged_images(face_model.no_face_images, current_images)
+        else:
+            face_model.clear_model()
+            image_files = list(current_images)
+            faces_removed = 0
+        
+        logger.info("Training person %s from folder: %s (MediaPipe, %d new images, %d removed)",
+                    person_id, person_path, len(image_files), faces_removed)
         
         faces_added = 0
         
-        for image_file in os.listdir(person_path):
-            if not image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                continue
-                
+        for image_file in image_files:
             image_path = os.path.join(person_path, image_file)
             
             try:
-                image = cv2.imread(image_path)
-                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                image_rgb = images.get(image_file) if images is not None else None
+                
+                if image_rgb is None:
+                    image = cv2.imread(image_path)
+                    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                    if images is not None:
+                        images[image_file] = image_rgb
                 
                 face_encoding = self.extract_face_encoding(image_rgb)
                 
                 if face_encoding is not None:
                     metadata = {"person_id": person_id, "image_file": image_file}
+                    metadata.update(current_images[image_file])
+                    if len(face_encoding) == HOG_FEATURE_SIZE:
+                        metadata["feature_version"] = HOG_FEATURE_VERSION
                     face_model.add_face(face_encoding, metadata)
                     faces_added += 1
                     
-                    print(f"   Added face from {image_file} for person {person_id} (MediaPipe)")
+                    logger.debug("Added face from %s for person %s (MediaPipe)", image_file, person_id)
                 else:
-                    print(f"   No face detected in {image_file}")
+                    logger.info("No face detected in %s", image_file)
+                    face_model.no_face_images[image_file] = current_images[image_file]
                 
             except Exception as e:
-                print(f"   Error processing {image_file}: {e}")
+                logger.warning("Error processing %s: %s", image_file, e)
                 continue
         
-        print(f"Total faces added for {person_id}: {faces_added}")
+        logger.debug("Total faces added for %s: %d", person_id, faces_added)
         
-        if faces_added > 0:
-            success = face_model.save_model()
-            print(f"Model saved for {person_id}: {success}")
-            return success
-        else:
-            print(f"No faces to save for {person_id}")
+        if face_model.get_face_count() == 0:
+            logger.warning("No faces to save for %s", person_id)
+            if faces_removed > 0:
+                face_model.save_model()
+                self._update_galleries(person_id, face_model)
             return False
+        
+        if faces_added == 0 and faces_removed == 0 and os.path.exists(face_model.model_path):
+            if face_model.no_face_images != no_face_before:
+                # Só mudaram as imagens sem rosto: os encodings (e as galerias) continuam iguais
+                face_model.save_model()
+            logger.info("Model for %s is up to date (MediaPipe)", person_id)
+            return True
+        
+        success = face_model.save_model()
+        logger.info("Model saved for %s: %s", person_id, success)
+        
+        if success:
+            self._update_galleries(person_id, face_model)
+        
+        return success
     
     def save_base64_images(self, person_id, images_base64, dataset_path="dataset"):
         person_path = os.path.join(dataset_path, person_id)
         os.makedirs(person_path, exist_ok=True)
         
-        existing_count = len([f for f in os.listdir(person_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]) if os.path.exists(person_path) else 0
+        existing_count = len([f for f in os.listdir(person_path) if f.lower().endswith(IMAGE_EXTENSIONS)]) if os.path.exists(person_path) else 0
         saved_images = []
+        next_number = existing_count + 1
         
         for i, img_base64 in enumerate(images_base64):
             try:
+                image_rgb = decode_base64_image(img_base64)
+                
                 # Cropar o rosto antes de salvar
-                cropped_base64 = self.crop_face_from_base64(img_base64)
+                detection = self.detect_face(image_rgb) if image_rgb is not None else None
                 
-                if cropped_base64 is None:
-                    print(f"No face detected in image {i+1}, skipping...")
+                if detection is None:
+                    logger.info("No face detected in image %d, skipping", i + 1)
                     continue
                 
                 # Usar a imagem cropada
-                image_data = base64.b64decode(cropped_base64)
-                image_filename = f"{person_id}_{existing_count + i + 1}_cropped.jpg"
+                with span("crop"):
+                    image_data = encode_jpeg(detection.crop, quality=95)
+                image_filename, next_number = save_person_image(person_path, person_id, image_data, next_number)
                 image_path = os.path.join(person_path, image_filename)
                 
-                with open(image_path, 'wb') as f:
-                    f.write(image_data)
-                
                 saved_images.append(image_path)
-                print(f"Saved cropped face (MediaPipe): {image_filename}")
+                logger.debug("Saved cropped face (MediaPipe): %s", image_filename)
                 
             except Exception as e:
-                print(f"Error processing image {i+1}: {e}")
+                logger.warning("Error processing image %d: %s", i + 1, e)
                 continue
         
         return saved_images
     
-    def verify_face(self, person_id, image_base64):
-        try:
-            model_path = f"{person_id}_model.pkl"
-            print(f"Loading model for person {person_id}: {model_path} (MediaPipe)")
+    def load_models(self):
+        """Carrega todos os modelos do namespace do MediaPipe: {person_id: modelo}"""
+        models = {}
+        
+        for model_person_id, model_path in self.registry.model_files():
+            test_model = MediaPipeFaceModel(model_path)
             
-            if not os.path.exists(model_path):
-                print(f"Model file does not exist: {model_path}")
-                return False, 0.0
-                
-            face_model = MediaPipeFaceModel(model_path)
+            if test_model.get_face_count() > 0:
+                models[model_person_id] = test_model
+        
+        return models
+    
+    def get_galleries(self):
+        """Galerias compartilhadas do processo: {tamanho do encoding: Gallery}.
+        
+        Landmarks e HOG têm tamanhos diferentes e não são comparáveis entre
+        si, então cada tipo de encoding tem a sua matriz empilhada.
+        """
+        with self._galleries_lock:
+            if self._galleries is None:
+                self._galleries = {
+                    dim: get_gallery(self.registry.path, MediaPipeFaceModel, dim, reload_interval=GALLERY_RELOAD_INTERVAL)
+                    for dim in (LANDMARK_ENCODING_SIZE, HOG_FEATURE_SIZE)
+                }
+            return self._galleries
+    
+    def _update_galleries(self, person_id, face_model):
+        """Atualiza as galerias já carregadas após o treino (encodings vazios removem a pessoa)"""
+        if self._galleries is None:
+            return
+        
+        for gallery in self._galleries.values():
+            gallery.update_person(person_id, face_model.known_face_encodings, face_model.known_face_metadata)
+    
+    def has_person(self, person_id):
+        return any(gallery.has_person(person_id) for gallery in self.get_galleries().values())
+    
+    def distances_by_person(self, face_encoding):
+        """Menor distância normalizada do encoding para cada pessoa (um produto de matrizes na galeria)"""
+        with span("gallery_scan"):
+            face_encoding = np.asarray(face_encoding, dtype=np.float32).ravel()
+            gallery = self.get_galleries().get(len(face_encoding))
             
-            if face_model.get_face_count() == 0:
-                print(f"No faces in model for person_id: {person_id}")
-                return False, 0.0
+            if gallery is None:
+                logger.warning("Unexpected encoding size %d (MediaPipe)", len(face_encoding))
+                return {}
+            
+            logger.debug("Found %d persons to compare against", gallery.get_person_count())
             
-            print(f"Model loaded with {face_model.get_face_count()} faces")
-            print(f"Model threshold: {face_model.distance_threshold}")
+            # Mesma normalização de MediaPipeFaceModel.calculate_distances
+            scale = 1.0 / np.sqrt(len(face_encoding))
+            distances_by_person = {p: d * scale for p, d in gallery.min_distances(face_encoding).items()}
+            
+            logger.debug("Distances by person: %s", distances_by_person)
+            return distances_by_person
+    
+    def decide_match(self, person_id, distances_by_person, distance_threshold=MediaPipeFaceModel.DISTANCE_THRESHOLD):
+        """Aplica threshold (ajustado para MediaPipe) e margem sobre as menores distâncias por pessoa"""
+        if not distances_by_person:
+            logger.info("No models to compare against")
+            return False, 0.0
+        
+        # Encontrar a menor distância geral
+        best_person_id = min(distances_by_person, key=distances_by_person.get)
+        best_distance = distances_by_person[best_person_id]
+        
+        logger.debug("Best match: %s with distance %s, requested person: %s, threshold: %s",
+                     best_person_id, best_distance, person_id, distance_threshold)
+        
+        # Mesma lógica de verificação do OpenCV, mas com threshold ajustado para MediaPipe
+        # MediaPipe tende a ter distâncias menores, então ajustamos o threshold
+        adjusted_threshold = distance_threshold * THRESHOLD_FACTOR
+        
+        if len(distances_by_person) == 1:
+            if best_person_id == person_id and best_distance <= adjusted_threshold:
+                logger.info("MATCH (single model, MediaPipe): person %s verified", person_id)
+                similarity = max(0, 1 - (best_distance / 20000))  # Ajustado para MediaPipe
+                return True, similarity
+            else:
+                logger.info("NO MATCH (single model, MediaPipe): best %s at distance %s, threshold %s", best_person_id, best_distance, adjusted_threshold)
+                similarity = max(0, 1 - (best_distance / 20000))
+                return False, similarity
+        
+        # Para múltiplos modelos
+        sorted_distances = sorted(distances_by_person.items(), key=lambda x: x[1])
+        
+        if len(sorted_distances) >= 2:
+            second_best_distance = sorted_distances[1][1]
+            margin = (second_best_distance - best_distance) / second_best_distance if second_best_distance > 0 else 0
+            
+            logger.debug("Best: %s, second best: %s, margin: %.2f%%", best_distance, second_best_distance, margin * 100)
+            
+            # Critérios ainda mais rigorosos para MediaPipe devido à maior precisão
+            if (best_person_id == person_id and 
+                best_distance <= adjusted_threshold and margin >= MATCH_MARGIN):
+                
+                logger.info("MATCH (MediaPipe): person %s verified with margin %.2f%%", person_id, margin * 100)
+                similarity = max(0, 1 - (best_distance / 20000))
+                return True, similarity
+            else:
+                logger.info("NO MATCH (MediaPipe): best match was %s, margin %.2f%%, distance %s", best_person_id, margin * 100, best_distance)
+                similarity = max(0, 1 - (best_distance / 20000))
+                return False, similarity
+        else:
+            # Fallback
+            if best_person_id == person_id and best_distance <= adjusted_threshold:
+                logger.info("MATCH (fallback, MediaPipe): person %s verified", person_id)
+                similarity = max(0, 1 - (best_distance / 20000))
+                return True, similarity
+            else:
+                logger.info("NO MATCH (fallback, MediaPipe): distance too high")
+                similarity = max(0, 1 - (best_distance / 20000))
+                return False, similarity
+    
+    def verify_face(self, person_id, image_base64):
+        try:
+            # A pessoa alegada vem da galeria em memória, sem reler o modelo do disco
+            if not self.has_person(person_id):
+                logger.info("No faces in model for person_id: %s", person_id)
+                return False, 0.0
             
             # Processar imagem de verificação
             try:
-                image_data = base64.b64decode(image_base64)
-                temp_path = f"temp_{person_id}_verify.jpg"
-                
-                with open(temp_path, 'wb') as f:
-                    f.write(image_data)
-                
-                # Carregar imagem
-                test_img = cv2.imread(temp_path)
-                if test_img is None:
-                    print(f"Failed to load temporary image")
+                # Decodificar direto da memória (sem arquivo temporário)
+                image_rgb = decode_base64_image(image_base64)
+                if image_rgb is None:
+                    logger.info("Failed to decode verification image")
                     return False, 0.0
                 
-                height, width = test_img.shape[:2]
+                height, width = image_rgb.shape[:2]
                 
                 if width <= 200 and height <= 200:
-                    print(f"Image appears to be pre-cropped ({width}x{height}), using directly")
-                    image_rgb = cv2.cvtColor(test_img, cv2.COLOR_BGR2RGB)
+                    logger.debug("Image appears to be pre-cropped (%dx%d), using directly", width, height)
+                    detection = None
                 else:
-                    print(f"Image is large ({width}x{height}), attempting to crop face")
-                    # Cropar o rosto da imagem
-                    cropped_base64 = self.crop_face_from_base64(image_base64)
+                    logger.debug("Image is large (%dx%d), attempting to crop face", width, height)
+                    # Detectar uma única vez; crop e ROI saem da mesma detecção
+                    detection = self.detect_face(image_rgb)
                     
-                    if cropped_base64 is None:
-                        print(f"No face detected in verification image for person_id: {person_id}")
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
+                    if detection is None:
+                        logger.info("No face detected in verification image for person_id: %s", person_id)
                         return False, 0.0
-                    
-                    # Usar a imagem cropada
-                    image_data = base64.b64decode(cropped_base64)
-                    
-                    with open(temp_path, 'wb') as f:
-                        f.write(image_data)
-                    
-                    test_img = cv2.imread(temp_path)
-                    image_rgb = cv2.cvtColor(test_img, cv2.COLOR_BGR2RGB)
-                
-                face_encoding = self.extract_face_encoding(image_rgb)
                 
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+                face_encoding = self.extract_face_encoding(image_rgb, detection)
                 
                 if face_encoding is None:
-                    print(f"No face detected in processed image for person_id: {person_id}")
+                    logger.info("No face detected in processed image for person_id: %s", person_id)
                     return False, 0.0
                 
             except Exception as e:
-                print(f"Error processing image: {e}")
+                logger.warning("Error processing image: %s", e)
                 return False, 0.0
             
             # Verificar contra todos os modelos (mesmo algoritmo do OpenCV)
-            all_models = [f for f in os.listdir('.') if f.endswith('_model.pkl')]
-            print(f"Found {len(all_models)} models to compare against")
-            
-            distances_by_person = {}
-            
-            # Testar contra todos os modelos
-            for model_file in all_models:
-                test_person_id = model_file.replace('_model.pkl', '')
-                test_model = MediaPipeFaceModel(model_file)
-                
-                if test_model.get_face_count() == 0:
-                    continue
-                
-                # Calcular menor distância para este modelo
-                min_distance = float('inf')
-                for known_encoding in test_model.known_face_encodings:
-                    distance = test_model.calculate_distance(face_encoding, known_encoding)
-                    min_distance = min(min_distance, distance)
-                
-                distances_by_person[test_person_id] = min_distance
-                print(f"Distance to {test_person_id}: {min_distance}")
-            
-            if not distances_by_person:
-                print("No models to compare against")
-                return False, 0.0
-            
-            # Encontrar a menor distância geral
-            best_person_id = min(distances_by_person, key=distances_by_person.get)
-            best_distance = distances_by_person[best_person_id]
-            
-            print(f"Best match: {best_person_id} with distance {best_distance}")
-            print(f"Requested person: {person_id}")
-            print(f"Threshold: {face_model.distance_threshold}")
+            distances_by_person = self.distances_by_person(face_encoding)
             
-            # Mesma lógica de verificação do OpenCV, mas com threshold ajustado para MediaPipe
-            # MediaPipe tende a ter distâncias menores, então ajustamos o threshold
-            adjusted_threshold = face_model.distance_threshold * 0.8  # Mais rigoroso
-            
-            if len(distances_by_person) == 1:
-                if best_person_id == person_id and best_distance <= adjusted_threshold:
-                    print(f"MATCH (single model, MediaPipe): Person {person_id} verified")
-                    similarity = max(0, 1 - (best_distance / 20000))  # Ajustado para MediaPipe
-                    return True, similarity
-                else:
-                    print(f"NO MATCH (single model, MediaPipe): distance {best_distance} > threshold {adjusted_threshold}")
-                    similarity = max(0, 1 - (best_distance / 20000))
-                    return False, similarity
-            
-            # Para múltiplos modelos
-            sorted_distances = sorted(distances_by_person.items(), key=lambda x: x[1])
-            
-            if len(sorted_distances) >= 2:
-                second_best_distance = sorted_distances[1][1]
-                margin = (second_best_distance - best_distance) / second_best_distance if second_best_distance > 0 else 0
-                
-                print(f"Best: {best_distance}, Second best: {second_best_distance}, Margin: {margin:.2%}")
-                
-                # Critérios ainda mais rigorosos para MediaPipe devido à maior precisão
-                if (best_person_id == person_id and 
-                    best_distance <= adjusted_threshold and margin >= 0.25):  # 25% de margem
-                    
-                    print(f"MATCH (MediaPipe): Person {person_id} verified with margin {margin:.2%}")
-                    similarity = max(0, 1 - (best_distance / 20000))
-                    return True, similarity
-                else:
-                    print(f"NO MATCH (MediaPipe): Best match was {best_person_id}, margin {margin:.2%}, distance {best_distance}")
-                    similarity = max(0, 1 - (best_distance / 20000))
-                    return False, similarity
-            else:
-                # Fallback
-                if best_person_id == person_id and best_distance <= adjusted_threshold:
-                    print(f"MATCH (fallback, MediaPipe): Person {person_id} verified")
-                    similarity = max(0, 1 - (best_distance / 20000))
-                    return True, similarity
-                else:
-                    print(f"NO MATCH (fallback, MediaPipe): distance too high")
-                    similarity = max(0, 1 - (best_distance / 20000))
-                    return False, similarity
+            return self.decide_match(person_id, distances_by_person)
             
         except Exception as e:
-            print(f"Error in verify_face for {person_id} (MediaPipe): {e}")
+            logger.exception("Error in verify_face for %s (MediaPipe): %s", person_id, e)
             return False, 0.0
@@ -0,0 +1,271 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Limites dos buckets em segundos: de 0,5 ms (decode de um crop) a 10 s (retreino)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+class Histogram:
+    """Histograma com labels no formato do Prometheus (buckets cumulativos, _sum e _count).
+
+    Guarda a contagem de cada bucket separadamente e só acumula na hora de
+    exportar, então observe() é uma busca binária e um incremento sob lock.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+
+        # Bucket "le": o primeiro limite >= value; o último é o +Inf
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        """{"labelnames", "buckets", "series": [[labelvalues, contagens, soma]]}, serializável em JSON"""
+        with self._lock:
+            series = [[list(labels), list(counts), total] for labels, (counts, total) in self._series.items()]
+
+        return {"labelnames": list(self.labelnames), "buckets": list(self.buckets), "series": series}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class MetricsRegistry:
+    """Conjunto de histogramas do processo, exportados juntos pelo /metrics.
+
+    Sob o gunicorn cada worker tem o próprio registry. Com FACEID_METRICS_DIR
+    definido, uma thread de cada processo grava um snapshot nesse diretório a
+    cada flush_interval e o /metrics soma os snapshots de todos os workers
+    (collect), então a resposta não depende de qual worker atendeu o scrape.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._process = None
+        self._flusher = None
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Retorna o histograma `name`, criando-o na primeira chamada"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+            return metric
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return {metric.name: dict(metric.snapshot(), help=metric.documentation) for metric in metrics}
+
+    def reset(self):
+        """Zera as observações (no worker recém-criado, para não repetir as do master)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+            metric.reset()
+
+    def _snapshot_path(self):
+        # Um arquivo por processo; o token evita reaproveitar o arquivo de um
+        # worker morto que tinha o mesmo pid
+        pid = os.getpid()
+        if self._process is None or self._process[0] != pid:
+            self._process = (pid, uuid.uuid4().hex[:8])
+        return os.path.join(self.directory, f"metrics-{pid}-{self._process[1]}.json")
+
+    def flush(self):
+        """Grava o snapshot deste processo em `directory`"""
+        if not self.directory:
+            return False
+
+        path = self._snapshot_path()
+        tmp_path = f"{path}.tmp"
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write metrics snapshot to %s: %s", path, e)
+            return False
+
+        return True
+
+    def start_flusher(self):
+        """Inicia a thread de flush deste processo (idempotente; sem `directory` não faz nada).
+
+        Criada sob demanda, como as demais threads: não sobrevive ao fork dos workers.
+        """
+        if not self.directory or (self._flusher is not None and self._flusher.is_alive()):
+            return
+
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._run_flusher, name="metrics-flush", daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def collect(self):
+        """Snapshot somado de todos os processos (ou só deste, sem `directory`)"""
+        if not self.directory:
+            return self.snapshot()
+
+        self.flush()
+
+        snapshots = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "metrics-*.json"))):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Arquivo sendo trocado ou de um processo que morreu no meio da escrita
+                continue
+
+        return merge_snapshots(snapshots)
+
+    def render(self):
+        return render_snapshot(self.collect())
+
+
+def merge_snapshots(snapshots):
+    """Soma snapshots de vários processos, série a série"""
+    merged = {}
+
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = dict(metric, series=[])
+                target["_index"] = {}
+            elif target["buckets"] != metric["buckets"]:
+                # Processo com outra versão do código: buckets incompatíveis
+                continue
+
+            for labels, counts, total in metric["series"]:
+                key = tuple(labels)
+                series = target["_index"].get(key)
+                if series is None:
+                    series = target["_index"][key] = [list(labels), [0] * len(counts), 0.0]
+                    target["series"].append(series)
+                series[1] = [a + b for a, b in zip(series[1], counts)]
+                series[2] += total
+
+    for metric in merged.values():
+        del metric["_index"]
+    return merged
+
+
+def render_snapshot(snapshot):
+    """Snapshot -> texto no formato de exposição do Prometheus (text/plain; version=0.0.4)"""
+    lines = []
+
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        labelnames = metric["labelnames"]
+        bounds = [_format_bound(b) for b in metric["buckets"]] + ["+Inf"]
+
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} histogram")
+
+        for labels, counts, total in sorted(metric["series"], key=lambda s: s[0]):
+            pairs = list(zip(labelnames, labels))
+            cumulative = 0
+
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+
+            lines.append(f"{name}_sum{_format_labels(pairs)} {total!r}")
+            lines.append(f"{name}_count{_format_labels(pairs)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry(
+    os.environ.get("FACEID_METRICS_DIR") or None,
+    float(os.environ.get("FACEID_METRICS_FLUSH_INTERVAL", 1.0)),
+)
+
+# Duração de cada etapa do pipeline: base64_decode, image_decode, detect, crop,
+# encode, gallery_scan, model_save, retrain (e pool_wait com o EncodePool)
+STAGE_SECONDS = REGISTRY.histogram(
+    "faceid_stage_duration_seconds", "Duration of each face pipeline stage in seconds", ("stage",)
+)
+
+# Duração total das requisições HTTP, por rota e status
+REQUEST_SECONDS = REGISTRY.histogram(
+    "faceid_request_duration_seconds", "HTTP request duration in seconds", ("method", "endpoint", "status")
+)
+
+
+@contextmanager
+def span(stage, timings=None):
+    """Mede o bloco como a etapa `stage`.
+
+    Sem `timings` a duração vai para o histograma de etapas (e para o log em
+    DEBUG); com um dict, é somada em timings[stage] — usado nos processos do
+    EncodePool, que devolvem as durações para o processo da requisição.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+        else:
+            observe_stage(stage, elapsed)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    logger.debug("span stage=%s duration_ms=%.3f", stage, seconds * 1000)
+
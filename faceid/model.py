@@ -1,85 +1,136 @@
-import os
-import numpy as np
-import pickle
-
-class FaceModel:
-    def __init__(self, model_path="facial_recognition_model.pkl"):
-        self.known_face_encodings = []
-        self.known_face_metadata = []
-        self.model_path = model_path
-        self.distance_threshold = 12000  # Threshold entre 11.312 e 13.141 para calibração correta
-        
-        if model_path and os.path.exists(model_path):
-            self.load_model()
-    
-    def add_face(self, face_encoding, metadata):
-        self.known_face_encodings.append(face_encoding)
-        self.known_face_metadata.append(metadata)
-        return len(self.known_face_encodings) - 1
-    
-    def calculate_distance(self, encoding1, encoding2):
-        """Calcula distância euclidiana entre dois encodings"""
-        return np.linalg.norm(np.array(encoding1) - np.array(encoding2))
-    
-    def identify_face(self, face_encoding):
-        if len(self.known_face_encodings) == 0:
-            print("No known faces in model")
-            return None, 1.0
-            
-        distances = []
-        for known_encoding in self.known_face_encodings:
-            distance = self.calculate_distance(face_encoding, known_encoding)
-            distances.append(distance)
-        
-        best_match_index = np.argmin(distances)
-        best_distance = distances[best_match_index]
-        
-        print(f"Best distance: {best_distance}, threshold: {self.distance_threshold}")
-        print(f"All distances: {distances}")
-        
-        # Menor distância = maior similaridade (invertido)
-        if best_distance <= self.distance_threshold:
-            metadata = self.known_face_metadata[best_match_index]
-            print(f"Match found: {metadata}")
-            # Converter distância para similaridade (normalizada para OpenCV LBPH)
-            similarity = max(0, 1 - (best_distance / 25000))
-            return metadata, similarity
-        else:
-            print(f"No match - distance {best_distance} above threshold {self.distance_threshold}")
-            similarity = max(0, 1 - (best_distance / 25000))
-            return None, similarity
-    
-    def save_model(self):
-        data = {
-            "encodings": self.known_face_encodings,
-            "metadata": self.known_face_metadata
-        }
-        
-        try:
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(data, f)
-            print(f"Model saved successfully to {self.model_path}")
-            return True
-        except Exception as e:
-            print(f"Error saving model to {self.model_path}: {e}")
-            return False
-            
-    def load_model(self):
-        try:
-            with open(self.model_path, 'rb') as f:
-                data = pickle.load(f)
-                
-            self.known_face_encodings = data["encodings"]
-            self.known_face_metadata = data["metadata"]
-            print(f"Model loaded successfully from {self.model_path}")
-            return True
-        except Exception as e:
-            print(f"Error loading model from {self.model_path}: {e}")
-            return False
-
-    def clear_model(self):
-        self.known_face_encodings = []
-        self.known_face_metadata = []
-
-    def get_face_count(self):
-        return len(self.known_face_encodings)
+import logging
+import os
+import numpy as np
+from .distance import as_matrix, euclidean_distances, squared_norms
+from .model_format import read_model_file, write_model_file
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+class FaceModel:
+    # Distância euclidiana real entre os pixels: nos *_model.pkl do repositório o
+    # vizinho genuíno mais distante está a 4.940 e o impostor mais próximo a 7.076.
+    # O antigo 12000 foi calibrado na subtração uint8, que estourava módulo 256.
+    DISTANCE_THRESHOLD = 6000
+    # Similaridade = 1 - distância / SIMILARITY_DIVISOR (0,52 no threshold, como antes)
+    SIMILARITY_DIVISOR = 12500
+
+    def __init__(self, model_path="facial_recognition_model.pkl"):
+        self.known_face_encodings = []
+        self.known_face_metadata = []
+        # Imagens da pasta sem rosto detectado {image_file: assinatura}, para o
+        # treino incremental não decodificá-las de novo enquanto não mudarem
+        self.no_face_images = {}
+        self.model_path = model_path
+        self.distance_threshold = self.DISTANCE_THRESHOLD
+        self._matrix_cache = None
+        
+        if model_path and os.path.exists(model_path):
+            self.load_model()
+    
+    @classmethod
+    def from_store(cls, store, person_id, model_path=None):
+        """Cria o modelo a partir da galeria mapeada em memória, sem copiar os encodings.
+        
+        model_path é o caminho do modelo no registry (registry.model_path(person_id));
+        sem ele o modelo é só leitura e save_model não grava nada.
+        """
+        model = cls(None)
+        encodings, metadata = store.get_person(person_id)
+        model.model_path = model_path
+        model.known_face_encodings = list(encodings)
+        model.known_face_metadata = list(metadata)
+        model._matrix_cache = (encodings, squared_norms(encodings))
+        return model
+    
+    def add_face(self, face_encoding, metadata):
+        self.known_face_encodings.append(face_encoding)
+        self.known_face_metadata.append(metadata)
+        self._matrix_cache = None
+        return len(self.known_face_encodings) - 1
+    
+    def calculate_distance(self, encoding1, encoding2):
+        """Calcula distância euclidiana entre dois encodings"""
+        return np.linalg.norm(np.array(encoding1) - np.array(encoding2))
+    
+    def get_encoding_matrix(self):
+        """Encodings empilhados em float32 (n, dim) com as normas em cache"""
+        if self._matrix_cache is None:
+            matrix = as_matrix(self.known_face_encodings)
+            self._matrix_cache = (matrix, squared_norms(matrix))
+        return self._matrix_cache
+    
+    def calculate_distances(self, face_encoding):
+        """Distâncias do encoding para todos os encodings conhecidos numa única chamada"""
+        matrix, sq_norms = self.get_encoding_matrix()
+        return euclidean_distances(np.asarray(face_encoding).ravel(), matrix, sq_norms)
+    
+    def identify_face(self, face_encoding):
+        if len(self.known_face_encodings) == 0:
+            logger.debug("No known faces in model")
+            return None, 1.0
+            
+        distances = self.calculate_distances(face_encoding)
+        
+        best_match_index = np.argmin(distances)
+        best_distance = distances[best_match_index]
+        
+        # Lazy: o array inteiro só é formatado com DEBUG ligado
+        logger.debug("Best distance: %s, threshold: %s", best_distance, self.distance_threshold)
+        logger.debug("All distances: %s", distances)
+        
+        # Menor distância = maior similaridade (invertido)
+        if best_distance <= self.distance_threshold:
+            metadata = self.known_face_metadata[best_match_index]
+            logger.debug("Match found: %s", metadata)
+            # Converter distância para similaridade (normalizada para OpenCV LBPH)
+            similarity = max(0, 1 - (best_distance / self.SIMILARITY_DIVISOR))
+            return metadata, similarity
+        else:
+            logger.debug("No match - distance %s above threshold %s", best_distance, self.distance_threshold)
+            similarity = max(0, 1 - (best_distance / self.SIMILARITY_DIVISOR))
+            return None, similarity
+    
+    def save_model(self):
+        if not self.model_path:
+            logger.warning("Model has no path (read-only), not saved")
+            return False
+        
+        try:
+            with span("model_save"):
+                write_model_file(self.model_path, self.known_face_encodings, self.known_face_metadata,
+                                 model_type="opencv", no_face_images=self.no_face_images)
+            logger.debug("Model saved successfully to %s", self.model_path)
+            return True
+        except Exception as e:
+            logger.error("Error saving model to %s: %s", self.model_path, e)
+            return False
+            
+    def load_model(self):
+        try:
+            data = read_model_file(self.model_path)
+            
+            self.known_face_encodings = list(data["encodings"])
+            self.known_face_metadata = data["metadata"]
+            self.no_face_images = data["no_face_images"]
+            self._matrix_cache = None
+            logger.debug("Model loaded successfully from %s", self.model_path)
+            return True
+        except Exception as e:
+            logger.error("Error loading model from %s: %s", self.model_path, e)
+            return False
+
+    def keep_faces(self, indices):
+        """Mantém apenas os encodings nos índices informados (remoção incremental)"""
+        self.known_face_encodings = [self.known_face_encodings[i] for i in indices]
+        self.known_face_metadata = [self.known_face_metadata[i] for i in indices]
+        self._matrix_cache = None
+
+    def clear_model(self):
+        self.known_face_encodings = []
+        self.known_face_metadata = []
+        self.no_face_images = {}
+        self._matrix_cache = None
+
+    def get_face_count(self):
+        return len(self.known_face_encodings)
@@ -0,0 +1,152 @@
+"""Formato binário versionado para os modelos por pessoa.
+
+Layout do arquivo (little-endian):
+
+    header      magic "FIDM", versão, dtype, quantidade, dimensão, tamanho dos metadados
+    lengths     uint32[count] com o tamanho real de cada encoding
+    encodings   dtype[count, dim], preenchido com zeros quando os tamanhos variam
+    metadata    JSON em formato de tabela (colunas), utf-8, mais as imagens da
+                pasta em que nenhum rosto foi detectado (no_face_images)
+
+A leitura é feita num único read() e os encodings viram uma view via
+np.frombuffer, sem desserializar objetos Python um a um. Arquivos antigos
+em pickle continuam sendo lidos por read_model_file.
+"""
+import json
+import pickle
+import struct
+import numpy as np
+from .locking import atomic_write
+
+MAGIC = b"FIDM"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIII")
+
+_DTYPE_CODES = {
+    1: np.dtype(np.uint8),
+    2: np.dtype(np.float32),
+    3: np.dtype(np.float64),
+}
+_CODES_BY_DTYPE = {dtype: code for code, dtype in _DTYPE_CODES.items()}
+
+
+class ModelFormatError(ValueError):
+    pass
+
+
+def _metadata_to_table(metadata):
+    """Converte a lista de dicts em colunas, guardando cada chave uma única vez"""
+    columns = {}
+    for key in dict.fromkeys(k for item in metadata for k in item):
+        columns[key] = [item.get(key) for item in metadata]
+    return columns
+
+
+def _table_to_metadata(columns, count):
+    metadata = [{} for _ in range(count)]
+    for key, values in columns.items():
+        for item, value in zip(metadata, values):
+            if value is not None:
+                item[key] = value
+    return metadata
+
+
+def serialize_model(encodings, metadata, model_type=None, no_face_images=None):
+    """Gera os bytes do modelo no formato binário"""
+    rows = [np.asarray(e).ravel() for e in encodings]
+    count = len(rows)
+
+    if count:
+        dtype = np.result_type(*rows)
+        if dtype not in _CODES_BY_DTYPE:
+            dtype = np.dtype(np.float32)
+    else:
+        dtype = np.dtype(np.float32)
+
+    lengths = np.array([len(r) for r in rows], dtype="<u4")
+    dim = int(lengths.max()) if count else 0
+
+    block = np.zeros((count, dim), dtype=dtype.newbyteorder("<"))
+    for i, row in enumerate(rows):
+        block[i, :len(row)] = row
+
+    meta = {"model_type": model_type, "columns": _metadata_to_table(metadata)}
+    if no_face_images:
+        meta["no_face_images"] = no_face_images
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, _CODES_BY_DTYPE[dtype], count, dim, len(meta_bytes))
+    return b"".join([header, lengths.tobytes(), block.tobytes(), meta_bytes])
+
+
+def deserialize_model(buffer):
+    """Lê os bytes do formato binário; encodings é uma matriz (n, dim) ou lista se os tamanhos variam"""
+    if len(buffer) < _HEADER.size:
+        raise ModelFormatError("truncated model header")
+
+    magic, version, dtype_code, count, dim, meta_len = _HEADER.unpack_from(buffer, 0)
+
+    if magic != MAGIC:
+        raise ModelFormatError("not a binary face model")
+    if version > FORMAT_VERSION:
+        raise ModelFormatError(f"unsupported model format version {version}")
+    if dtype_code not in _DTYPE_CODES:
+        raise ModelFormatError(f"unknown dtype code {dtype_code}")
+
+    dtype = _DTYPE_CODES[dtype_code].newbyteorder("<")
+    offset = _HEADER.size
+
+    lengths = np.frombuffer(buffer, dtype="<u4", count=count, offset=offset)
+    offset += lengths.nbytes
+
+    block_size = count * dim * dtype.itemsize
+    if len(buffer) < offset + block_size + meta_len:
+        raise ModelFormatError("truncated model data")
+
+    block = np.frombuffer(buffer, dtype=dtype, count=count * dim, offset=offset).reshape(count, dim)
+    offset += block_size
+
+    meta = json.loads(bytes(buffer[offset:offset + meta_len]).decode("utf-8"))
+
+    if count and np.all(lengths == dim):
+        encodings = block
+    else:
+        encodings = [block[i, :lengths[i]] for i in range(count)]
+
+    return {
+        "encodings": encodings,
+        "metadata": _table_to_metadata(meta.get("columns", {}), count),
+        "model_type": meta.get("model_type"),
+        "no_face_images": meta.get("no_face_images", {}),
+        "format_version": version,
+    }
+
+
+def is_binary_model(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_model_file(path, encodings, metadata, model_type=None, no_face_images=None):
+    # Escrita atômica: leitores em outros workers nunca veem um modelo pela metade
+    atomic_write(path, serialize_model(encodings, metadata, model_type, no_face_images))
+
+
+def read_model_file(path):
+    """Lê um modelo no formato binário ou, se for um arquivo antigo, em pickle"""
+    with open(path, "rb") as f:
+        buffer = f.read()
+
+    if buffer[:len(MAGIC)] == MAGIC:
+        return deserialize_model(buffer)
+
+    # Formato legado: pickle com listas de arrays
+    data = pickle.loads(buffer)
+    return {
+        "encodings": data["encodings"],
+        "metadata": data["metadata"],
+        "model_type": data.get("model_type"),
+        "no_face_images": {},
+        "format_version": 0,
+    }
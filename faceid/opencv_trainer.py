@@ -1,343 +1,641 @@
-import cv2
-import numpy as np
-import os
-import base64
-from PIL import Image
-import io
-from .model import FaceModel
-
-class OpenCVFaceTrainer:
-    def __init__(self):
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
-    
-    def crop_face_from_base64(self, image_base64, padding=50):
-        """Extrai e cropa o rosto de uma imagem base64 em formato quadrado usando OpenCV"""
-        try:
-            image_data = base64.b64decode(image_base64)
-            image = Image.open(io.BytesIO(image_data))
-            image_rgb = np.array(image.convert('RGB'))
-            
-            gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-            
-            if len(faces) == 0:
-                return None
-            
-            # Usar o primeiro rosto detectado
-            x, y, w, h = faces[0]
-            
-            # Calcular centro do rosto
-            face_center_x = x + w // 2
-            face_center_y = y + h // 2
-            
-            # Usar a maior dimensão para criar um quadrado
-            face_size = max(w, h)
-            
-            # Adicionar padding
-            square_size = face_size + (2 * padding)
-            half_square = square_size // 2
-            
-            # Calcular coordenadas do quadrado centrado no rosto
-            height, width = image_rgb.shape[:2]
-            
-            x1 = max(0, face_center_x - half_square)
-            y1 = max(0, face_center_y - half_square)
-            x2 = min(width, face_center_x + half_square)
-            y2 = min(height, face_center_y + half_square)
-            
-            # Ajustar para garantir que seja quadrado
-            actual_width = x2 - x1
-            actual_height = y2 - y1
-            
-            if actual_width != actual_height:
-                # Usar a menor dimensão para manter dentro da imagem
-                min_size = min(actual_width, actual_height)
-                
-                # Recentrar
-                half_min = min_size // 2
-                x1 = face_center_x - half_min
-                y1 = face_center_y - half_min
-                x2 = face_center_x + half_min
-                y2 = face_center_y + half_min
-                
-                # Garantir que está dentro dos limites
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(width, x2)
-                y2 = min(height, y2)
-            
-            # Cropar o rosto
-            cropped_face = image_rgb[y1:y2, x1:x2]
-            
-            # Converter de volta para PIL Image
-            cropped_pil = Image.fromarray(cropped_face)
-            
-            # Redimensionar para tamanho padrão (quadrado)
-            standard_size = 180
-            cropped_pil = cropped_pil.resize((standard_size, standard_size), Image.Resampling.LANCZOS)
-            
-            # Converter para base64
-            buffer = io.BytesIO()
-            cropped_pil.save(buffer, format='JPEG', quality=95)
-            cropped_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            print(f"Face cropped: original face {w}x{h} -> square {standard_size}x{standard_size}")
-            
-            return cropped_base64
-            
-        except Exception as e:
-            print(f"Error cropping face: {e}")
-            return None
-    
-    def extract_face_encoding(self, image):
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-        
-        if len(faces) == 0:
-            return None
-            
-        x, y, w, h = faces[0]
-        face_roi = gray[y:y+h, x:x+w]
-        face_resized = cv2.resize(face_roi, (100, 100))
-        
-        return face_resized.flatten()
-    
-    def train_person(self, person_id, dataset_path="dataset"):
-        person_path = os.path.join(dataset_path, person_id)
-        
-        if not os.path.exists(person_path):
-            print(f"Person folder does not exist: {person_path}")
-            return False
-            
-        face_model = FaceModel(f"{person_id}_model.pkl")
-        face_model.clear_model()
-        
-        print(f"Training person {person_id} from folder: {person_path}")
-        
-        faces_added = 0
-        
-        for image_file in os.listdir(person_path):
-            if not image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                continue
-                
-            image_path = os.path.join(person_path, image_file)
-            
-            try:
-                image = cv2.imread(image_path)
-                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                
-                face_encoding = self.extract_face_encoding(image_rgb)
-                
-                if face_encoding is not None:
-                    # IMPORTANTE: Garantir que o metadata tenha o person_id correto
-                    metadata = {"person_id": person_id, "image_file": image_file}
-                    face_model.add_face(face_encoding, metadata)
-                    faces_added += 1
-                    
-                    print(f"   Added face from {image_file} for person {person_id}")
-                else:
-                    print(f"   No face detected in {image_file}")
-                
-            except Exception as e:
-                print(f"   Error processing {image_file}: {e}")
-                continue
-        
-        print(f"Total faces added for {person_id}: {faces_added}")
-        
-        if faces_added > 0:
-            success = face_model.save_model()
-            print(f"Model saved for {person_id}: {success}")
-            return success
-        else:
-            print(f"No faces to save for {person_id}")
-            return False
-    
-    def save_base64_images(self, person_id, images_base64, dataset_path="dataset"):
-        person_path = os.path.join(dataset_path, person_id)
-        os.makedirs(person_path, exist_ok=True)
-        
-        existing_count = len([f for f in os.listdir(person_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]) if os.path.exists(person_path) else 0
-        saved_images = []
-        
-        for i, img_base64 in enumerate(images_base64):
-            try:
-                # Cropar o rosto antes de salvar
-                cropped_base64 = self.crop_face_from_base64(img_base64)
-                
-                if cropped_base64 is None:
-                    print(f"No face detected in image {i+1}, skipping...")
-                    continue
-                
-                # Usar a imagem cropada
-                image_data = base64.b64decode(cropped_base64)
-                image_filename = f"{person_id}_{existing_count + i + 1}_cropped.jpg"
-                image_path = os.path.join(person_path, image_filename)
-                
-                with open(image_path, 'wb') as f:
-                    f.write(image_data)
-                
-                saved_images.append(image_path)
-                print(f"Saved cropped face: {image_filename}")
-                
-            except Exception as e:
-                print(f"Error processing image {i+1}: {e}")
-                continue
-        
-        return saved_images
-    
-    def verify_face(self, person_id, image_base64):
-        try:
-            model_path = f"{person_id}_model.pkl"
-            print(f"Loading model for person {person_id}: {model_path}")
-            
-            if not os.path.exists(model_path):
-                print(f"Model file does not exist: {model_path}")
-                return False, 0.0
-                
-            face_model = FaceModel(model_path)
-            
-            if face_model.get_face_count() == 0:
-                print(f"No faces in model for person_id: {person_id}")
-                return False, 0.0
-            
-            print(f"Model loaded with {face_model.get_face_count()} faces")
-            print(f"Model threshold: {face_model.distance_threshold}")
-            
-            # Verificar se a imagem já está cropada (do dataset)
-            # Se for do dataset, usar diretamente, senão cropar
-            try:
-                image_data = base64.b64decode(image_base64)
-                temp_path = f"temp_{person_id}_verify.jpg"
-                
-                with open(temp_path, 'wb') as f:
-                    f.write(image_data)
-                
-                # Carregar imagem para verificar se precisa de crop
-                test_img = cv2.imread(temp_path)
-                if test_img is None:
-                    print(f"Failed to load temporary image")
-                    return False, 0.0
-                
-                # Se a imagem é pequena (180x180 ou similar), provavelmente já está cropada
-                height, width = test_img.shape[:2]
-                
-                if width <= 200 and height <= 200:
-                    print(f"Image appears to be pre-cropped ({width}x{height}), using directly")
-                    image_rgb = cv2.cvtColor(test_img, cv2.COLOR_BGR2RGB)
-                else:
-                    print(f"Image is large ({width}x{height}), attempting to crop face")
-                    # Cropar o rosto da imagem
-                    cropped_base64 = self.crop_face_from_base64(image_base64)
-                    
-                    if cropped_base64 is None:
-                        print(f"No face detected in verification image for person_id: {person_id}")
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
-                        return False, 0.0
-                    
-                    # Usar a imagem cropada
-                    image_data = base64.b64decode(cropped_base64)
-                    
-                    with open(temp_path, 'wb') as f:
-                        f.write(image_data)
-                    
-                    test_img = cv2.imread(temp_path)
-                    image_rgb = cv2.cvtColor(test_img, cv2.COLOR_BGR2RGB)
-                
-                face_encoding = self.extract_face_encoding(image_rgb)
-                
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                
-                if face_encoding is None:
-                    print(f"No face detected in processed image for person_id: {person_id}")
-                    return False, 0.0
-                
-            except Exception as e:
-                print(f"Error processing image: {e}")
-                return False, 0.0
-            
-            # Verificar se há outros modelos para comparação
-            all_models = [f for f in os.listdir('.') if f.endswith('_model.pkl')]
-            print(f"Found {len(all_models)} models to compare against")
-            
-            distances_by_person = {}
-            
-            # Testar contra todos os modelos
-            for model_file in all_models:
-                test_person_id = model_file.replace('_model.pkl', '')
-                test_model = FaceModel(model_file)
-                
-                if test_model.get_face_count() == 0:
-                    continue
-                
-                # Calcular menor distância para este modelo
-                min_distance = float('inf')
-                for known_encoding in test_model.known_face_encodings:
-                    distance = test_model.calculate_distance(face_encoding, known_encoding)
-                    min_distance = min(min_distance, distance)
-                
-                distances_by_person[test_person_id] = min_distance
-                print(f"Distance to {test_person_id}: {min_distance}")
-            
-            if not distances_by_person:
-                print("No models to compare against")
-                return False, 0.0
-            
-            # Encontrar a menor distância geral
-            best_person_id = min(distances_by_person, key=distances_by_person.get)
-            best_distance = distances_by_person[best_person_id]
-            
-            print(f"Best match: {best_person_id} with distance {best_distance}")
-            print(f"Requested person: {person_id}")
-            print(f"Threshold: {face_model.distance_threshold}")
-            
-            # Se só há um modelo, usa o threshold normal
-            if len(distances_by_person) == 1:
-                if best_person_id == person_id and best_distance <= face_model.distance_threshold:
-                    print(f"MATCH (single model): Person {person_id} verified")
-                    similarity = max(0, 1 - (best_distance / 25000))
-                    return True, similarity
-                else:
-                    print(f"NO MATCH (single model): distance {best_distance} > threshold {face_model.distance_threshold}")
-                    similarity = max(0, 1 - (best_distance / 25000))
-                    return False, similarity
-            
-            # Se há múltiplos modelos, verifica se a pessoa correta tem a menor distância
-            # E se há uma diferença significativa (pelo menos 30% menor que a segunda melhor)
-            sorted_distances = sorted(distances_by_person.items(), key=lambda x: x[1])
-            
-            if len(sorted_distances) >= 2:
-                second_best_distance = sorted_distances[1][1]
-                margin = (second_best_distance - best_distance) / second_best_distance if second_best_distance > 0 else 0
-                
-                print(f"Best: {best_distance}, Second best: {second_best_distance}, Margin: {margin:.2%}")
-                
-                # Critérios MUITO rigorosos para match:
-                # 1. A menor distância é para a pessoa solicitada
-                # 2. A distância está dentro do threshold E há uma margem significativa (30%)
-                if (best_person_id == person_id and 
-                    best_distance <= face_model.distance_threshold and margin >= 0.30):
-                    
-                    print(f"MATCH: Person {person_id} verified with margin {margin:.2%}")
-                    similarity = max(0, 1 - (best_distance / 25000))
-                    return True, similarity
-                else:
-                    print(f"NO MATCH: Best match was {best_person_id}, margin {margin:.2%}, distance {best_distance}")
-                    similarity = max(0, 1 - (best_distance / 25000))
-                    return False, similarity
-            else:
-                # Fallback para caso com apenas uma comparação
-                if best_person_id == person_id and best_distance <= face_model.distance_threshold:
-                    print(f"MATCH (fallback): Person {person_id} verified")
-                    similarity = max(0, 1 - (best_distance / 25000))
-                    return True, similarity
-                else:
-                    print(f"NO MATCH (fallback): distance too high")
-                    similarity = max(0, 1 - (best_distance / 25000))
-                    return False, similarity
-            
-        except Exception as e:
-            print(f"Error in verify_face for {person_id}: {e}")
-            return False, 0.0
+import base64
+import logging
+import cv2
+import numpy as np
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .model import FaceModel
+from .gallery import get_gallery
+from .gallery_store import GalleryStore
+from .dataset import IMAGE_EXTENSIONS, plan_incremental_update, save_person_image, scan_person_images, unchanged_images
+from .locking import person_lock
+from .image_utils import DEFAULT_PADDING, STANDARD_FACE_SIZE, base64_to_bytes, decode_image_bytes
+from .detection import DetectionResult, detect_in_face_crop
+from .encode_pool import EncodePoolError
+from .image_cache import AnalyzedImage, ImageCache
+from .graph_pool import GraphPool
+from .projection import PROJECTION_FILE, Projection, default_projection_path
+from .lbph import LBPH_FILE, LBPHMatcher
+from .registry import ModelRegistry, migrate_legacy_file
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Tamanho do rosto usado no encoding (pixels em escala de cinza)
+ENCODING_SIZE = (100, 100)
+
+# Namespace dos modelos sem projeção; com projeção o namespace é o fingerprint dela
+PIXEL_FEATURES = f"pixels-{ENCODING_SIZE[0]}x{ENCODING_SIZE[1]}"
+
+# Similaridade = 1 - distância / SIMILARITY_DIVISOR (no espaço de pixels)
+SIMILARITY_DIVISOR = FaceModel.SIMILARITY_DIVISOR
+
+# Threshold da distância chi-quadrado do LBPH (FACEID_MATCHER=lbph)
+LBPH_DISTANCE_THRESHOLD = 80
+
+# Com várias pessoas na galeria, a melhor distância precisa ser pelo menos
+# MATCH_MARGIN menor que a da segunda melhor pessoa
+MATCH_MARGIN = 0.30
+
+class OpenCVFaceTrainer:
+    def __init__(self, gallery=None, projection=None):
+        # O CascadeClassifier não pode ser usado por duas threads ao mesmo tempo
+        # (sem o EncodePool a detecção roda nas threads das requisições e do
+        # batch): cada detecção pega um emprestado do pool
+        cascade_pool_size = int(os.environ.get("OPENCV_CASCADE_POOL_SIZE", os.cpu_count() or 4))
+        self.cascade_pool = GraphPool(
+            lambda: cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'),
+            cascade_pool_size, name="CascadeClassifier"
+        )
+        
+        # Projeção opcional (PCA / aleatória) salva junto com os modelos:
+        # reduz os 10.000 pixels para poucas centenas de dimensões float32
+        if projection is None:
+            projection_path = default_projection_path()
+            if "FACEID_PROJECTION" not in os.environ:
+                migrate_legacy_file(PROJECTION_FILE, projection_path)
+            if os.path.exists(projection_path):
+                projection = Projection.load(projection_path)
+                logger.info("Using %s projection %d -> %d dims from %s", projection.kind,
+                            ENCODING_SIZE[0] * ENCODING_SIZE[1], projection.n_components, projection_path)
+        self.projection = projection
+        
+        if projection is not None:
+            self.encoding_dim = projection.n_components
+            encoding_dtype = np.float32
+            scale = projection.distance_scale
+        else:
+            self.encoding_dim = ENCODING_SIZE[0] * ENCODING_SIZE[1]
+            encoding_dtype = np.uint8
+            scale = 1.0
+        
+        # Thresholds calibrados no espaço de pixels, convertidos para o espaço projetado
+        self.distance_threshold = FaceModel.DISTANCE_THRESHOLD * scale
+        self.similarity_divisor = SIMILARITY_DIVISOR * scale
+        
+        # Modelos em models/opencv/<pixels ou projeção>/; na primeira execução
+        # os *_model.pkl legados do diretório de trabalho são importados
+        self.registry = ModelRegistry("opencv", projection.fingerprint if projection is not None else PIXEL_FEATURES)
+        self.registry.ensure(accept=self._accept_legacy_model)
+        
+        # Galeria em memória compartilhada por todas as verificações do processo.
+        # Com FACEID_GALLERY_STORE definido, os encodings ficam num arquivo
+        # mapeado em memória e compartilhado entre os workers. O arquivo fica
+        # no namespace do registry: trocar a projeção usa outro store.
+        if gallery is None:
+            store_name = os.environ.get("FACEID_GALLERY_STORE")
+            store = None
+            if store_name:
+                store_path = self.registry.file_path(os.path.basename(store_name))
+                store = GalleryStore(store_path, self.encoding_dim, encoding_dtype)
+            gallery = get_gallery(model_dir=self.registry.path, encoding_dim=self.encoding_dim, store=store)
+        self.gallery = gallery
+        
+        # Modo LBPH: um único recognizer com todas as pessoas, no lugar da
+        # distância entre pixels. Precisa dos encodings crus (sem projeção).
+        self.lbph = None
+        self.verification_method = 'OpenCV pixel distance'
+        if os.environ.get("FACEID_MATCHER", "pixels") == "lbph":
+            if projection is not None:
+                logger.warning("LBPH matcher needs raw pixel encodings, ignoring FACEID_MATCHER=lbph with a projection")
+            else:
+                self.lbph = LBPHMatcher(os.environ.get("FACEID_LBPH_FILE", self.registry.file_path(LBPH_FILE)), ENCODING_SIZE)
+                self.verification_method = 'OpenCV LBPH'
+                
+                # Mesma similaridade no limite do threshold que o modo por pixels
+                lbph_threshold = float(os.environ.get("LBPH_DISTANCE_THRESHOLD", LBPH_DISTANCE_THRESHOLD))
+                self.similarity_divisor = lbph_threshold * SIMILARITY_DIVISOR / FaceModel.DISTANCE_THRESHOLD
+                self.distance_threshold = lbph_threshold
+                
+                self._sync_lbph()
+        
+        # Índice aproximado (IVF-PQ) para galerias grandes, ligado por FACEID_ANN_MIN_ROWS;
+        # a galeria constrói (e retreina) o índice quando atinge o mínimo de linhas
+        ann_min_rows = os.environ.get("FACEID_ANN_MIN_ROWS")
+        if ann_min_rows and self.gallery.ann is None:
+            self.gallery.enable_ann(
+                min_rows=int(ann_min_rows),
+                n_lists=int(os.environ.get("FACEID_ANN_LISTS", 64)),
+                nprobe=int(os.environ.get("FACEID_ANN_NPROBE", 8)),
+            )
+        # Executor do /verify/batch, criado no primeiro uso (um só, mesmo com requisições simultâneas)
+        self._batch_executor = None
+        self._batch_executor_lock = threading.Lock()
+        
+        # Pool de processos opcional (EncodePool) para decode -> detecção -> encoding
+        # das imagens base64; sem ele tudo roda na thread da requisição
+        self.encode_pool = None
+        
+        # Imagens já analisadas (hash dos bytes -> encoding e caixa do rosto);
+        # FACEID_IMAGE_CACHE_SIZE=0 desliga
+        cache_size = int(os.environ.get("FACEID_IMAGE_CACHE_SIZE", 1024))
+        self.image_cache = ImageCache(
+            cache_size, float(os.environ.get("FACEID_IMAGE_CACHE_TTL", 300))
+        ) if cache_size > 0 else None
+    
+    def detect_face(self, image_rgb, padding=DEFAULT_PADDING):
+        """Roda o Haar cascade uma única vez e retorna o DetectionResult (ou None)"""
+        with span("detect"):
+            gray = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2GRAY)
+            with self.cascade_pool.acquire() as face_cascade:
+                faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        
+        if len(faces) == 0:
+            return None
+        
+        # Usar o primeiro rosto detectado
+        return DetectionResult(image_rgb, faces[0], padding)
+    
+    def crop_face(self, image_rgb, padding=DEFAULT_PADDING):
+        """Detecta o rosto e retorna o crop quadrado 180x180 (RGB) em memória"""
+        detection = self.detect_face(image_rgb, padding)
+        
+        if detection is None:
+            return None
+        
+        w, h = detection.original_size
+        logger.debug("Face cropped: original face %dx%d -> square %dx%d", w, h, STANDARD_FACE_SIZE, STANDARD_FACE_SIZE)
+        
+        return detection.crop
+    
+    def crop_face_from_base64(self, image_base64, padding=DEFAULT_PADDING):
+        """Extrai e cropa o rosto de uma imagem base64 em formato quadrado usando OpenCV"""
+        try:
+            # O crop vem do cache de imagens (a chave inclui o padding)
+            analyzed = self.analyze_base64_image(image_base64, crop=True, padding=padding)
+            if analyzed is None or analyzed.box is None:
+                return None
+            return base64.b64encode(analyzed.crop_jpeg).decode()
+            
+        except EncodePoolError:
+            raise
+        except Exception as e:
+            logger.error("Error cropping face: %s", e)
+            return None
+    
+    def extract_face_encoding(self, image, detection=None, project=True):
+        """Encoding do rosto; reaproveita a detecção em `image` se ela já foi feita.
+        
+        O encoding sai do crop 180x180 do rosto, como no treino sobre o
+        dataset (detect_in_face_crop). Com project=False retorna sempre os
+        pixels crus (usado para ajustar a projeção).
+        """
+        detection = detect_in_face_crop(image, self.detect_face, detection)
+        
+        if detection is None:
+            return None
+        
+        with span("encode"):
+            face_resized = cv2.resize(detection.gray_roi, ENCODING_SIZE)
+            
+            if project and self.projection is not None:
+                return self.projection.transform(face_resized.flatten())
+            
+            return face_resized.flatten()
+    
+    def train_person(self, person_id, dataset_path="dataset", incremental=True, images=None):
+        """Treina o modelo da pessoa a partir da pasta do dataset.
+        
+        No modo incremental só as imagens novas ou alteradas são codificadas e
+        os encodings de imagens removidas saem do modelo, então o custo é
+        proporcional às mudanças e não ao tamanho da pasta.
+        
+        images é um dict opcional {image_file: RGB} usado como cache de
+        decode: imagens já presentes não são lidas do disco e as lidas são
+        guardadas nele (o retreino em massa compartilha o dict entre backends).
+        """
+        # Ciclo ler-treinar-salvar exclusivo por pessoa, entre threads e processos
+        with person_lock(self.registry.model_path(person_id)):
+            return self._train_person(person_id, dataset_path, incremental, images)
+    
+    def _train_person(self, person_id, dataset_path, incremental, images=None):
+        person_path = os.path.join(dataset_path, person_id)
+        
+        if not os.path.exists(person_path):
+            logger.warning("Person folder does not exist: %s", person_path)
+            return False
+            
+        face_model = FaceModel(self.registry.model_path(person_id))
+        current_images = scan_person_images(person_path)
+        no_face_before = face_model.no_face_images
+        
+        if incremental:
+            total_before = face_model.get_face_count()
+            
+            # Descartar encodings de outro backend ou de outra projeção (modelos migrados)
+            valid = [
+                i for i, (e, m) in enumerate(zip(face_model.known_face_encodings, face_model.known_face_metadata))
+                if self._is_own_encoding(e, m)
+            ]
+            face_model.keep_faces(valid)
+            
+            keep_indices, image_files = plan_incremental_update(
+                face_model.known_face_metadata, current_images, face_model.no_face_images)
+            faces_removed = total_before - len(keep_indices)
+            face_model.keep_faces(keep_indices)
+            # Imagens sem rosto só continuam registradas enquanto não mudarem
+            face_model.no_face_images = unchanged_images(face_model.no_face_images, current_images)
+        else:
+            face_model.clear_model()
+            image_files = list(current_images)
+            faces_removed = 0
+        
+        logger.info("Training person %s from folder: %s (%d new images, %d removed)",
+                    person_id, person_path, len(image_files), faces_removed)
+        
+        faces_added = 0
+        
+        for image_file in image_files:
+            image_path = os.path.join(person_path, image_file)
+            
+            try:
+                image_rgb = images.get(image_file) if images is not None else None
+                
+                if image_rgb is None:
+                    image = cv2.imread(image_path)
+                    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                    if images is not None:
+                        images[image_file] = image_rgb
+                
+                face_encoding = self.extract_face_encoding(image_rgb)
+                
+                if face_encoding is not None:
+                    # IMPORTANTE: Garantir que o metadata tenha o person_id correto
+                    metadata = {"person_id": person_id, "image_file": image_file}
+                    metadata.update(current_images[image_file])
+                    if self.projection is not None:
+                        metadata["projection"] = self.projection.fingerprint
+                    face_model.add_face(face_encoding, metadata)
+                    faces_added += 1
+                    
+                    logger.debug("Added face from %s for person %s", image_file, person_id)
+                else:
+                    logger.info("No face detected in %s", image_file)
+                    face_model.no_face_images[image_file] = current_images[image_file]
+                
+            except Exception as e:
+                logger.warning("Error processing %s: %s", image_file, e)
+                continue
+        
+        logger.debug("Total faces added for %s: %d", person_id, faces_added)
+        
+        if face_model.get_face_count() == 0:
+            logger.warning("No faces to save for %s", person_id)
+            if faces_removed > 0:
+                # Todas as imagens sumiram: o modelo não pode manter encodings antigos
+                face_model.save_model()
+                self.gallery.remove_person(person_id)
+                if self.lbph is not None:
+                    self._sync_lbph(force_rebuild=True)
+            return False
+        
+        if faces_added == 0 and faces_removed == 0 and os.path.exists(face_model.model_path):
+            if face_model.no_face_images != no_face_before:
+                # Só mudaram as imagens sem rosto: os encodings (e a galeria) continuam iguais
+                face_model.save_model()
+            
+            # O arquivo do modelo já está atualizado; só falta a galeria, se ela não tiver a pessoa
+            if not self.gallery.has_person(person_id):
+                self.gallery.update_person(person_id, face_model.known_face_encodings, face_model.known_face_metadata)
+                if self.lbph is not None:
+                    self._sync_lbph()
+            logger.info("Model for %s is up to date", person_id)
+            return True
+        
+        success = face_model.save_model()
+        logger.info("Model saved for %s: %s", person_id, success)
+        
+        if success:
+            self.gallery.update_person(person_id, face_model.known_face_encodings, face_model.known_face_metadata)
+            
+            if self.lbph is not None:
+                self._update_lbph(person_id, face_model, faces_added, faces_removed)
+        
+        return success
+    
+    def _is_own_encoding(self, encoding, metadata):
+        """Encoding gerado por este trainer: mesma dimensão e mesma projeção"""
+        fingerprint = self.projection.fingerprint if self.projection is not None else None
+        return np.asarray(encoding).size == self.encoding_dim and metadata.get("projection") == fingerprint
+    
+    def _accept_legacy_model(self, data):
+        """Índices dos encodings de um *_model.pkl legado que pertencem a este namespace"""
+        if data["model_type"] not in (None, "opencv"):
+            return []
+        
+        return [
+            i for i, (e, m) in enumerate(zip(data["encodings"], data["metadata"]))
+            if self._is_own_encoding(e, m)
+        ]
+    
+    def _sync_lbph(self, force_rebuild=False):
+        """Garante que o recognizer LBPH tenha as mesmas faces da galeria.
+        
+        Tenta primeiro o arquivo salvo; se ele não bater com a galeria (ou não
+        existir), reconstrói a partir dos encodings da galeria e salva.
+        """
+        expected = {p: self.gallery.get_face_count(p) for p in self.gallery.get_person_ids()}
+        
+        if not force_rebuild and self.lbph.face_counts() == expected:
+            return
+        
+        if not force_rebuild and self.lbph.load() and self.lbph.face_counts() == expected:
+            return
+        
+        self.lbph.rebuild({p: self.gallery.get_encodings(p) for p in expected})
+        self.lbph.save()
+    
+    def _update_lbph(self, person_id, face_model, faces_added, faces_removed):
+        """Após o treino: update() incremental quando só houve imagens novas, senão rebuild"""
+        known = self.lbph.face_counts().get(person_id, 0)
+        
+        if faces_removed == 0 and known + faces_added == face_model.get_face_count():
+            self.lbph.update(person_id, face_model.known_face_encodings[known:])
+            self.lbph.save()
+        else:
+            self._sync_lbph(force_rebuild=True)
+    
+    def _distances_by_person(self, face_encoding, person_id=None):
+        """Menores distâncias por pessoa: LBPH ou distância entre pixels na galeria"""
+        if self.lbph is None:
+            with span("gallery_scan"):
+                return self.gallery.min_distances(face_encoding, include=(person_id,) if person_id else ())
+        
+        # Outro worker pode ter treinado pessoas novas (galeria compartilhada)
+        if person_id is not None and self.lbph.face_counts().get(person_id) != self.gallery.get_face_count(person_id):
+            self._sync_lbph()
+        
+        with span("gallery_scan"):
+            return self.lbph.min_distances(face_encoding)
+    
+    def save_base64_images(self, person_id, images_base64, dataset_path="dataset"):
+        person_path = os.path.join(dataset_path, person_id)
+        os.makedirs(person_path, exist_ok=True)
+        
+        existing_count = len([f for f in os.listdir(person_path) if f.lower().endswith(IMAGE_EXTENSIONS)]) if os.path.exists(person_path) else 0
+        saved_images = []
+        next_number = existing_count + 1
+        
+        for i, img_base64 in enumerate(images_base64):
+            try:
+                # Cropar o rosto antes de salvar
+                analyzed = self.analyze_base64_image(img_base64, crop=True)
+                image_data = analyzed.crop_jpeg if analyzed is not None and analyzed.box is not None else None
+                
+                if image_data is None:
+                    logger.info("No face detected in image %d, skipping", i + 1)
+                    continue
+                
+                # Usar a imagem cropada
+                image_filename, next_number = save_person_image(person_path, person_id, image_data, next_number)
+                image_path = os.path.join(person_path, image_filename)
+                
+                saved_images.append(image_path)
+                logger.debug("Saved cropped face: %s", image_filename)
+                
+            except EncodePoolError:
+                raise
+            except Exception as e:
+                logger.warning("Error processing image %d: %s", i + 1, e)
+                continue
+        
+        return saved_images
+    
+    def analyze_base64_image(self, image_base64, crop=False, padding=DEFAULT_PADDING):
+        """Detecção + encoding (e crop JPEG, se pedido) de uma imagem base64.
+        
+        O resultado fica no cache de imagens pelo hash dos bytes, então
+        retries do /verify e imagens reenviadas ao /register não passam de
+        novo por decode, detecção e encoding. Retorna AnalyzedImage (box None
+        se não houver rosto) ou None se o base64 for inválido. O padding só
+        muda o crop, mas entra na chave do cache junto com os bytes.
+        """
+        image_data = base64_to_bytes(image_base64)
+        if image_data is None:
+            return None
+        
+        cached = None
+        if self.image_cache is not None:
+            key = ImageCache.key(image_data, padding)
+            cached = self.image_cache.get(key)
+            
+            if cached is not None and (not crop or cached.box is None or cached.crop_jpeg is not None):
+                return cached
+        
+        analyzed = self._analyze_image_bytes(image_data, crop, cached, padding)
+        
+        if self.image_cache is not None:
+            self.image_cache.put(key, analyzed)
+        return analyzed
+    
+    def _analyze_image_bytes(self, image_data, crop, known=None, padding=DEFAULT_PADDING):
+        """Roda o pipeline (no EncodePool, se houver); `known` é uma análise em cache sem o crop"""
+        if self.encode_pool is not None:
+            result = self.encode_pool.process(image_data, encoding=known is None, crop=crop, padding=padding)
+            
+            if known is not None:
+                return known._replace(crop_jpeg=result[2] if result is not None else None)
+            if result is None:
+                return AnalyzedImage(None, None, None)
+            return AnalyzedImage(*result)
+        
+        # Decodificar direto da memória (sem arquivo temporário)
+        image_rgb = decode_image_bytes(image_data)
+        if image_rgb is None:
+            return AnalyzedImage(None, None, None)
+        
+        # Uma única detecção (ou a caixa já conhecida): a ROI vai direto para o encoding
+        detection = DetectionResult(image_rgb, known.box, padding) if known is not None else self.detect_face(image_rgb, padding)
+        if detection is None:
+            return AnalyzedImage(None, None, None)
+        
+        encoding = known.encoding if known is not None else self.extract_face_encoding(image_rgb, detection)
+        crop_jpeg = None
+        if crop:
+            with span("crop"):
+                crop_jpeg = detection.crop_jpeg
+        
+        return AnalyzedImage(encoding, detection.box, crop_jpeg)
+    
+    def encode_base64_image(self, image_base64, person_id=None):
+        """Decodifica, detecta e codifica uma imagem base64 (None se não houver rosto)"""
+        try:
+            analyzed = self.analyze_base64_image(image_base64)
+            
+        except EncodePoolError:
+            raise
+        except Exception as e:
+            logger.warning("Error processing image: %s", e)
+            return None
+        
+        if analyzed is None:
+            logger.info("Failed to decode verification image")
+            return None
+        
+        if analyzed.box is None:
+            logger.info("No face detected in verification image for person_id: %s", person_id)
+            return None
+        
+        return analyzed.encoding
+    
+    def decide_match(self, person_id, distances_by_person):
+        """Aplica threshold e margem sobre as menores distâncias por pessoa"""
+        distance_threshold = self.distance_threshold
+        
+        if not distances_by_person:
+            logger.info("No models to compare against")
+            return False, 0.0
+        
+        # Encontrar a menor distância geral
+        best_person_id = min(distances_by_person, key=distances_by_person.get)
+        best_distance = distances_by_person[best_person_id]
+        
+        logger.debug("Best match: %s with distance %s, requested person: %s, threshold: %s",
+                     best_person_id, best_distance, person_id, distance_threshold)
+        
+        # Se só há um modelo, usa o threshold normal
+        if len(distances_by_person) == 1:
+            if best_person_id == person_id and best_distance <= distance_threshold:
+                logger.info("MATCH (single model): person %s verified", person_id)
+                similarity = max(0, 1 - (best_distance / self.similarity_divisor))
+                return True, similarity
+            else:
+                logger.info("NO MATCH (single model): best %s at distance %s, threshold %s", best_person_id, best_distance, distance_threshold)
+                similarity = max(0, 1 - (best_distance / self.similarity_divisor))
+                return False, similarity
+        
+        # Se há múltiplos modelos, verifica se a pessoa correta tem a menor distância
+        # E se há uma diferença significativa (pelo menos 30% menor que a segunda melhor)
+        sorted_distances = sorted(distances_by_person.items(), key=lambda x: x[1])
+        
+        second_best_distance = sorted_distances[1][1]
+        margin = (second_best_distance - best_distance) / second_best_distance if second_best_distance > 0 else 0
+        
+        logger.debug("Best: %s, second best: %s, margin: %.2f%%", best_distance, second_best_distance, margin * 100)
+        
+        # Critérios MUITO rigorosos para match:
+        # 1. A menor distância é para a pessoa solicitada
+        # 2. A distância está dentro do threshold E há uma margem significativa (30%)
+        if (best_person_id == person_id and 
+            best_distance <= distance_threshold and margin >= MATCH_MARGIN):
+            
+            logger.info("MATCH: person %s verified with margin %.2f%%", person_id, margin * 100)
+            similarity = max(0, 1 - (best_distance / self.similarity_divisor))
+            return True, similarity
+        else:
+            logger.info("NO MATCH: best match was %s, margin %.2f%%, distance %s", best_person_id, margin * 100, best_distance)
+            similarity = max(0, 1 - (best_distance / self.similarity_divisor))
+            return False, similarity
+    
+    def verify_face(self, person_id, image_base64):
+        try:
+            if not self.gallery.has_person(person_id):
+                logger.info("No model in gallery for person_id: %s", person_id)
+                return False, 0.0
+            
+            logger.debug("Gallery has %d faces for %s, threshold: %s",
+                         self.gallery.get_face_count(person_id), person_id, self.distance_threshold)
+            
+            face_encoding = self.encode_base64_image(image_base64, person_id)
+            
+            if face_encoding is None:
+                return False, 0.0
+            
+            # Comparar contra todas as pessoas da galeria em memória
+            logger.debug("Comparing against %d persons in gallery", self.gallery.get_person_count())
+            
+            distances_by_person = self._distances_by_person(face_encoding, person_id)
+            
+            return self.decide_match(person_id, distances_by_person)
+            
+        except EncodePoolError:
+            raise
+        except Exception as e:
+            logger.exception("Error in verify_face for %s: %s", person_id, e)
+            return False, 0.0
+    
+    def identify_face(self, image_base64, k=5):
+        """Identificação 1:N: quem está na imagem, sem person_id informado.
+        
+        Retorna (person_id ou None, similarity, candidatos), onde candidatos é
+        a lista top-k de (person_id, distância). O match usa o mesmo threshold
+        e margem de 30% do verify_face, aplicados ao melhor candidato.
+        """
+        try:
+            face_encoding = self.encode_base64_image(image_base64)
+            
+            if face_encoding is None:
+                logger.info("No face detected in identification image")
+                return None, 0.0, []
+            
+            # Pelo menos 2 candidatos para poder calcular a margem
+            if self.lbph is not None:
+                distances_by_person = self._distances_by_person(face_encoding)
+                candidates = sorted(distances_by_person.items(), key=lambda item: item[1])[:max(k, 2)]
+            else:
+                with span("gallery_scan"):
+                    candidates = self.gallery.search(face_encoding, k=max(k, 2))
+            
+            if not candidates:
+                logger.info("No models to compare against")
+                return None, 0.0, []
+            
+            best_person_id = candidates[0][0]
+            is_match, similarity = self.decide_match(best_person_id, dict(candidates[:2]))
+            
+            return (best_person_id if is_match else None), similarity, candidates[:k]
+            
+        except EncodePoolError:
+            raise
+        except Exception as e:
+            logger.exception("Error in identify_face: %s", e)
+            return None, 0.0, []
+    
+    def verify_faces_batch(self, items):
+        """Verifica vários pares (person_id, image_base64) de uma vez.
+        
+        Decodificação e detecção rodam em paralelo (o OpenCV libera o GIL) e
+        todos os encodings são comparados com a galeria num único produto de
+        matrizes. Retorna uma lista de (is_match, similarity) na mesma ordem.
+        """
+        results = [(False, 0.0)] * len(items)
+        
+        # Só processar imagens de pessoas que existem na galeria
+        pending = [i for i, (person_id, _) in enumerate(items) if self.gallery.has_person(person_id)]
+        
+        if not pending:
+            return results
+        
+        executor = self._get_batch_executor()
+        encodings = list(executor.map(
+            lambda i: self.encode_base64_image(items[i][1], items[i][0]), pending
+        ))
+        
+        valid = [(i, e) for i, e in zip(pending, encodings) if e is not None]
+        
+        if not valid:
+            return results
+        
+        if self.lbph is not None:
+            distances_list = [self._distances_by_person(e, items[i][0]) for i, e in valid]
+        else:
+            with span("gallery_scan"):
+                distances_list = self.gallery.min_distances_batch(
+                    [e for _, e in valid], include=[items[i][0] for i, _ in valid]
+                )
+        
+        for (i, _), distances_by_person in zip(valid, distances_list):
+            try:
+                results[i] = self.decide_match(items[i][0], distances_by_person)
+            except Exception as e:
+                logger.exception("Error in batch verification for %s: %s", items[i][0], e)
+        
+        return results
+    
+    def _get_batch_executor(self):
+        with self._batch_executor_lock:
+            if self._batch_executor is None:
+                workers = int(os.environ.get("VERIFY_BATCH_WORKERS", os.cpu_count() or 4))
+                self._batch_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verify-batch")
+            return self._batch_executor
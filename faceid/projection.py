@@ -0,0 +1,107 @@
+import hashlib
+import io
+import os
+import numpy as np
+from .distance import as_matrix
+from .locking import atomic_write
+from .registry import backend_dir
+
+# Arquivo da projeção, salvo no diretório do backend OpenCV (models/opencv/)
+PROJECTION_FILE = "opencv_projection.npz"
+
+
+def default_projection_path():
+    """FACEID_PROJECTION ou o arquivo padrão em models/opencv/"""
+    return os.environ.get("FACEID_PROJECTION", os.path.join(backend_dir("opencv"), PROJECTION_FILE))
+
+
+class Projection:
+    """Projeção linear dos encodings para uma dimensão menor.
+
+    `pca` (Eigenfaces) é ajustada a partir dos encodings do dataset; `random`
+    é uma projeção gaussiana com seed, que preserva distâncias em média
+    (Johnson-Lindenstrauss). Em ambos os casos transform() é um único produto
+    de matrizes e o resultado é float32.
+
+    distance_scale é a razão mediana entre a distância projetada e a original,
+    usada para converter os thresholds calibrados no espaço de pixels.
+    """
+
+    KINDS = ("pca", "random")
+
+    def __init__(self, kind, mean, components, distance_scale=1.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown projection kind: {kind}")
+
+        self.kind = kind
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.distance_scale = float(distance_scale)
+        self.fingerprint = f"{kind}-{self.n_components}-" + hashlib.sha1(self.components.tobytes()).hexdigest()[:12]
+
+    @property
+    def input_dim(self):
+        return self.components.shape[0]
+
+    @property
+    def n_components(self):
+        return self.components.shape[1]
+
+    @classmethod
+    def fit_pca(cls, encodings, n_components=256):
+        """Ajusta a PCA (SVD dos encodings centralizados)"""
+        data = as_matrix(encodings)
+        n_components = min(n_components, len(data), data.shape[1])
+
+        mean = data.mean(axis=0)
+        _, _, vt = np.linalg.svd(data - mean, full_matrices=False)
+
+        projection = cls("pca", mean, vt[:n_components].T)
+        projection.distance_scale = projection.measure_distance_scale(data)
+        return projection
+
+    @classmethod
+    def random(cls, input_dim, n_components=256, seed=0, encodings=None):
+        """Projeção gaussiana com seed; encodings (opcional) calibram o distance_scale"""
+        rng = np.random.default_rng(seed)
+        components = rng.standard_normal((input_dim, n_components)) / np.sqrt(n_components)
+
+        projection = cls("random", np.zeros(input_dim), components)
+        if encodings is not None and len(encodings) > 1:
+            projection.distance_scale = projection.measure_distance_scale(as_matrix(encodings))
+        return projection
+
+    def measure_distance_scale(self, data, n_pairs=2000, seed=0):
+        """Mediana de (distância projetada / distância original) em pares aleatórios"""
+        rng = np.random.default_rng(seed)
+        a = rng.integers(0, len(data), n_pairs)
+        b = rng.integers(0, len(data), n_pairs)
+        a, b = a[a != b], b[a != b]
+
+        if len(a) == 0:
+            return 1.0
+
+        raw = np.linalg.norm(data[a] - data[b], axis=1)
+        projected = np.linalg.norm(self.transform(data[a]) - self.transform(data[b]), axis=1)
+        valid = raw > 0
+
+        return float(np.median(projected[valid] / raw[valid])) if valid.any() else 1.0
+
+    def transform(self, encodings):
+        """Projeta um encoding (retorna vetor) ou uma matriz de encodings (n, k)"""
+        encodings = np.asarray(encodings, dtype=np.float32)
+        if encodings.ndim == 1:
+            return (encodings - self.mean) @ self.components
+        return (encodings.reshape(len(encodings), -1) - self.mean) @ self.components
+
+    def save(self, path):
+        buffer = io.BytesIO()
+        np.savez(buffer, kind=self.kind, mean=self.mean, components=self.components,
+                 distance_scale=self.distance_scale)
+        atomic_write(path, buffer.getvalue())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data["kind"]), data["mean"], data["components"], float(data["distance_scale"]))
+
@@ -0,0 +1,142 @@
+import logging
+import os
+import shutil
+import tempfile
+from .locking import atomic_write, file_lock
+from .model_format import read_model_file, write_model_file
+
+# Diretório raiz dos modelos (FACEID_MODELS_DIR), fora do diretório de trabalho
+MODELS_DIR = "models"
+MODEL_SUFFIX = "_model.pkl"
+
+logger = logging.getLogger(__name__)
+
+
+def models_root():
+    return os.environ.get("FACEID_MODELS_DIR", MODELS_DIR)
+
+
+def backend_dir(backend, root=None):
+    """Diretório de um backend, onde ficam também arquivos comuns a todas as versões (ex.: a projeção)"""
+    return os.path.join(root or models_root(), backend)
+
+
+class ModelRegistry:
+    """Namespace de modelos de um backend numa versão de features.
+
+        models/<backend>/<feature_version>/<person_id>_model.pkl
+
+    Cada backend só enxerga os próprios modelos: OpenCV e MediaPipe não
+    gravam mais no mesmo arquivo, e uma mudança de features (outra projeção,
+    outra versão do HOG) começa um namespace novo em vez de misturar vetores
+    incompatíveis no antigo, que continua lá para rollback.
+    """
+
+    def __init__(self, backend, feature_version, root=None):
+        self.backend = backend
+        self.feature_version = feature_version
+        self.backend_dir = backend_dir(backend, root)
+        self.path = os.path.join(self.backend_dir, feature_version)
+
+    def model_path(self, person_id):
+        return os.path.join(self.path, f"{person_id}{MODEL_SUFFIX}")
+
+    def file_path(self, name):
+        """Arquivo auxiliar do namespace (ex.: o recognizer LBPH)"""
+        return os.path.join(self.path, name)
+
+    def model_files(self):
+        """[(person_id, caminho)] de todos os modelos do namespace"""
+        if not os.path.isdir(self.path):
+            return []
+
+        return [
+            (f[:-len(MODEL_SUFFIX)], os.path.join(self.path, f))
+            for f in sorted(os.listdir(self.path)) if f.endswith(MODEL_SUFFIX)
+        ]
+
+    def person_ids(self):
+        return [person_id for person_id, _ in self.model_files()]
+
+    def ensure(self, legacy_dir=".", accept=None):
+        """Cria o namespace; na criação importa os modelos legados de `legacy_dir`.
+
+        accept(data) recebe o conteúdo de cada *_model.pkl legado (como
+        read_model_file) e retorna os índices dos encodings que pertencem a
+        este namespace. O namespace é montado num diretório temporário e
+        publicado com um rename, sob lock: entre processos só um migra e
+        ninguém vê o namespace pela metade. Os arquivos legados não são
+        alterados. Retorna o número de modelos importados.
+        """
+        if os.path.isdir(self.path):
+            return 0
+
+        os.makedirs(self.backend_dir, exist_ok=True)
+
+        with file_lock(os.path.join(self.backend_dir, f".{self.feature_version}.lock")):
+            if os.path.isdir(self.path):
+                return 0
+
+            staging = tempfile.mkdtemp(dir=self.backend_dir, prefix=f".{self.feature_version}.")
+            try:
+                os.chmod(staging, 0o755)
+                migrated = self._migrate_legacy(staging, legacy_dir, accept) if accept is not None else 0
+                os.rename(staging, self.path)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+        if migrated:
+            logger.info("Migrated %d legacy models from %s to %s", migrated, os.path.abspath(legacy_dir), self.path)
+        return migrated
+
+    def _migrate_legacy(self, staging, legacy_dir, accept):
+        if not os.path.isdir(legacy_dir):
+            return 0
+
+        migrated = 0
+
+        for model_file in sorted(os.listdir(legacy_dir)):
+            if not model_file.endswith(MODEL_SUFFIX):
+                continue
+
+            try:
+                data = read_model_file(os.path.join(legacy_dir, model_file))
+            except Exception as e:
+                logger.warning("Skipping legacy model %s: %s", model_file, e)
+                continue
+
+            indices = accept(data)
+            if not indices:
+                continue
+
+            write_model_file(
+                os.path.join(staging, model_file),
+                [data["encodings"][i] for i in indices],
+                [data["metadata"][i] for i in indices],
+                model_type=self.backend,
+            )
+            migrated += 1
+
+        return migrated
+
+
+def migrate_legacy_file(name, destination, legacy_dir="."):
+    """Copia um arquivo auxiliar legado (ex.: a projeção) do diretório de trabalho para o registry"""
+    legacy_path = os.path.join(legacy_dir, name)
+
+    if os.path.exists(destination) or not os.path.exists(legacy_path):
+        return False
+
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    with open(legacy_path, "rb") as f:
+        data = f.read()
+
+    try:
+        atomic_write(destination, data, overwrite=False)
+    except FileExistsError:
+        # Outro processo migrou primeiro
+        return False
+
+    logger.info("Copied legacy %s to %s", legacy_path, destination)
+    return True
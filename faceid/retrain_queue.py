@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+class RetrainQueue:
+    """Fila limitada de retreinos executados por uma thread em background.
+
+    Pedidos repetidos para o mesmo person_id enquanto ele ainda está na fila
+    são agrupados num único retreino. Quando a fila está cheia o pedido é
+    rejeitado (o próximo match da pessoa tenta de novo).
+    """
+
+    QUEUED = "queued"
+    COALESCED = "coalesced"
+    REJECTED = "rejected"
+
+    def __init__(self, train_fn, maxsize=100):
+        self.train_fn = train_fn
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def _ensure_worker(self):
+        # Iniciada sob demanda: threads não sobrevivem a um fork do processo
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="retrain-worker", daemon=True)
+            self._thread.start()
+
+    def submit(self, person_id):
+        """Agenda o retreino da pessoa e retorna queued, coalesced ou rejected"""
+        with self._lock:
+            if person_id in self._pending:
+                self.coalesced += 1
+                return self.COALESCED
+
+            try:
+                self._queue.put_nowait(person_id)
+            except queue.Full:
+                self.rejected += 1
+                logger.warning("Retrain queue full, rejecting retrain for %s", person_id)
+                return self.REJECTED
+
+            self._pending.add(person_id)
+            self._ensure_worker()
+
+        return self.QUEUED
+
+    def _run(self):
+        while True:
+            person_id = self._queue.get()
+
+            # Sai do conjunto antes de treinar: imagens salvas durante o treino
+            # precisam de um novo retreino, então novos pedidos voltam a entrar
+            with self._lock:
+                self._pending.discard(person_id)
+
+            try:
+                with span("retrain"):
+                    success = self.train_fn(person_id)
+                if success:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                logger.info("Background retrain for %s: %s", person_id, "ok" if success else "failed")
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Error in background retrain for %s: %s", person_id, e)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Bloqueia até que todos os retreinos agendados terminem"""
+        self._queue.join()
+
+    def pending_count(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "pending": self.pending_count(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,386 @@
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager
+import numpy as np
+from .detection import DetectionResult
+from .image_utils import decode_image_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidFrame(ValueError):
+    """Os bytes recebidos como frame não são uma imagem decodificável"""
+
+
+class StreamSession:
+    """Sessão de verificação sobre frames consecutivos da mesma câmera.
+
+    Os encodings saem do mesmo crop 180x180 usado no cadastro e no /verify:
+    o primeiro frame (ou o frame em que o rosto se perdeu) passa pelo
+    detector, e nos seguintes a caixa do rosto é reposicionada a partir dos
+    landmarks do frame anterior, sem rodar o detector. O FaceMesh da sessão
+    (static_image_mode=False) roda sobre esse crop e rastreia os landmarks de
+    um frame para o outro. A decisão sai do acúmulo de evidência: a sessão
+    é verificada quando `required_matches` frames dão match e a proporção de
+    matches entre os frames com rosto é suficiente; é rejeitada quando chega
+    a `max_frames` frames com rosto sem atingir esse critério.
+    """
+
+    PENDING = "pending"
+    VERIFIED = "verified"
+    REJECTED = "rejected"
+
+    def __init__(self, session_id, person_id, face_mesh,
+                 required_matches=3, min_match_ratio=0.6, max_frames=10):
+        self.session_id = session_id
+        self.person_id = person_id
+        self.face_mesh = face_mesh
+        self.required_matches = required_matches
+        self.min_match_ratio = min_match_ratio
+        self.max_frames = max_frames
+
+        self.frames = 0
+        self.face_frames = 0
+        self.matches = 0
+        self.similarities = []
+        self.status = self.PENDING
+        self.last_seen = time.monotonic()
+
+        # Caixa do rosto (x, y, w, h) para o próximo frame e a posição da
+        # caixa do detector relativa à extensão dos landmarks
+        self._box = None
+        self._padding = None
+        self._anchor = None
+
+        # O grafo em modo tracking depende da ordem dos frames: um por vez
+        self._lock = threading.Lock()
+
+    def process_frame(self, trainer, image_rgb):
+        """Processa um frame e atualiza a decisão acumulada da sessão"""
+        with self._lock:
+            self.last_seen = time.monotonic()
+            self.frames += 1
+
+            if self.status != self.PENDING:
+                return self.summary()
+
+            face_encoding = self._encode_frame(trainer, image_rgb)
+
+            if face_encoding is not None:
+                distances_by_person = trainer.distances_by_person(face_encoding)
+                is_match, similarity = trainer.decide_match(self.person_id, distances_by_person)
+
+                self.face_frames += 1
+                self.matches += int(is_match)
+                self.similarities.append(similarity)
+                self._update_status()
+            else:
+                logger.debug("Stream session %s: no face in frame %d", self.session_id, self.frames)
+
+            return self.summary()
+
+    def _encode_frame(self, trainer, image_rgb):
+        """Encoding do rosto no frame pelo crop da caixa rastreada (ou de uma nova detecção)"""
+        tracked = self._box is not None
+
+        if tracked:
+            detection = DetectionResult(image_rgb, self._box, self._padding)
+        else:
+            detection = trainer.detect_face(image_rgb)
+
+        if detection is None or detection.is_empty:
+            self._box = None
+            return None
+
+        face_landmarks = trainer.find_face_landmarks(detection.crop, face_mesh=self.face_mesh)
+
+        if face_landmarks is None:
+            self._box = None
+            # A caixa rastreada perdeu o rosto: tentar de novo com o detector
+            return self._encode_frame(trainer, image_rgb) if tracked else None
+
+        extent = self._landmark_extent(detection, face_landmarks)
+
+        if not tracked:
+            self._padding = detection.padding
+            self._anchor = self._box_anchor(detection.box, extent)
+
+        self._box = self._box_from_extent(extent)
+        return trainer.landmarks_encoding(detection.crop, face_landmarks)
+
+    @staticmethod
+    def _landmark_extent(detection, face_landmarks):
+        """(x, y, largura, altura) dos landmarks do crop convertidos para coordenadas do frame"""
+        x1, y1, x2, y2 = detection.crop_box
+        points = np.array([(lm.x, lm.y) for lm in face_landmarks.landmark], dtype=np.float64)
+        xs = x1 + points[:, 0] * (x2 - x1)
+        ys = y1 + points[:, 1] * (y2 - y1)
+        return xs.min(), ys.min(), max(xs.max() - xs.min(), 1.0), max(ys.max() - ys.min(), 1.0)
+
+    @staticmethod
+    def _box_anchor(box, extent):
+        x, y, w, h = box
+        lx, ly, lw, lh = extent
+        return (x - lx) / lw, (y - ly) / lh, w / lw, h / lh
+
+    def _box_from_extent(self, extent):
+        """Caixa equivalente à do detector para o rosto na posição atual dos landmarks"""
+        lx, ly, lw, lh = extent
+        ax, ay, aw, ah = self._anchor
+        return (int(round(lx + ax * lw)), int(round(ly + ay * lh)),
+                int(round(aw * lw)), int(round(ah * lh)))
+
+    def _update_status(self):
+        ratio = self.matches / self.face_frames
+        if self.matches >= self.required_matches and ratio >= self.min_match_ratio:
+            self.status = self.VERIFIED
+        elif self.face_frames >= self.max_frames:
+            self.status = self.REJECTED
+
+    def summary(self):
+        return {
+            "session_id": self.session_id,
+            "person_id": self.person_id,
+            "status": self.status,
+            "verified": self.status == self.VERIFIED,
+            "frames": self.frames,
+            "face_frames": self.face_frames,
+            "matches": self.matches,
+            "similarity": float(np.mean(self.similarities)) if self.similarities else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self.face_mesh.close()
+
+
+class StreamSessionManager:
+    """Mantém as sessões de stream ativas, com limite de quantidade e expiração por inatividade.
+
+    start/step/finish recebem e retornam só valores simples (ids, bytes,
+    dicts), então funcionam igual através do servidor de sessões que
+    atende todos os workers do gunicorn (ver start_stream_server). Os frames
+    chegam como os bytes da imagem codificada (JPEG/PNG) e são decodificados
+    aqui: pelo socket passa a imagem comprimida, não o array RGB decodificado.
+    """
+
+    def __init__(self, trainer, mesh_factory, max_sessions=32, ttl=30.0, **session_options):
+        self.trainer = trainer
+        self.mesh_factory = mesh_factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.session_options = session_options
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [s for s in self._sessions.values() if now - s.last_seen > self.ttl]
+        for session in expired:
+            del self._sessions[session.session_id]
+        return expired
+
+    def create(self, person_id):
+        """Abre uma sessão nova; retorna None se o limite de sessões foi atingido"""
+        with self._lock:
+            expired = self._evict_expired()
+            full = len(self._sessions) >= self.max_sessions
+
+        for session in expired:
+            session.close()
+
+        if full:
+            return None
+
+        # Os frames comparam contra a galeria compartilhada do trainer
+        session = StreamSession(uuid.uuid4().hex, person_id, self.mesh_factory(), **self.session_options)
+
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                full = True
+            else:
+                self._sessions[session.session_id] = session
+
+        if full:
+            session.close()
+            return None
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session
+
+    def active_count(self):
+        with self._lock:
+            return len(self._sessions)
+
+    @staticmethod
+    def _decode_frame(image_data):
+        image_rgb = decode_image_bytes(image_data)
+        if image_rgb is None:
+            raise InvalidFrame("Failed to decode image")
+        return image_rgb
+
+    def start(self, person_id, image_data):
+        """Abre uma sessão e processa o primeiro frame; None se o limite de sessões foi atingido.
+
+        Levanta InvalidFrame se os bytes não forem uma imagem (sem abrir a sessão).
+        """
+        image_rgb = self._decode_frame(image_data)
+        session = self.create(person_id)
+        return session.process_frame(self.trainer, image_rgb) if session is not None else None
+
+    def step(self, session_id, image_data):
+        """Processa o próximo frame da sessão; None se ela não existe ou expirou.
+
+        Levanta InvalidFrame se os bytes não forem uma imagem.
+        """
+        session = self.get(session_id)
+        if session is None:
+            return None
+        return session.process_frame(self.trainer, self._decode_frame(image_data))
+
+    def finish(self, session_id):
+        """Encerra a sessão e retorna o resumo final; None se ela não existe ou expirou"""
+        session = self.close(session_id)
+        return session.summary() if session is not None else None
+
+
+def create_stream_manager():
+    """StreamSessionManager com o MediaPipe e os limites configurados por variáveis de ambiente"""
+    from .mediapipe_trainer import MediaPipeFaceTrainer
+
+    trainer = MediaPipeFaceTrainer()
+    return StreamSessionManager(
+        trainer,
+        trainer.create_tracking_mesh,
+        max_sessions=int(os.environ.get("STREAM_MAX_SESSIONS", "32")),
+        ttl=float(os.environ.get("STREAM_SESSION_TTL", "30")),
+        required_matches=int(os.environ.get("STREAM_REQUIRED_MATCHES", "3")),
+        max_frames=int(os.environ.get("STREAM_MAX_FRAMES", "10")),
+    )
+
+
+# Endereço (socket unix) e chave do servidor de sessões, herdados pelos workers
+STREAM_SERVER_ADDRESS = "STREAM_SERVER_ADDRESS"
+STREAM_SERVER_AUTHKEY = "STREAM_SERVER_AUTHKEY"
+
+# Segundos para o processo servidor começar a aceitar conexões
+STREAM_SERVER_START_TIMEOUT = 30.0
+
+_server_manager = None
+_server_manager_lock = threading.Lock()
+
+
+def _server_sessions():
+    """Gerenciador único do processo servidor, criado na primeira chamada de um worker"""
+    global _server_manager
+
+    with _server_manager_lock:
+        if _server_manager is None:
+            _server_manager = create_stream_manager()
+        return _server_manager
+
+
+class _StreamManager(BaseManager):
+    pass
+
+
+_StreamManager.register("sessions", callable=_server_sessions,
+                        exposed=("start", "step", "finish", "active_count"))
+
+
+def _connect(address, authkey):
+    client = _StreamManager(address, authkey)
+    client.connect()
+    return client
+
+
+def start_stream_server():
+    """Inicia o processo que guarda as sessões de stream de todos os workers.
+
+    O FaceMesh de uma sessão rastreia o rosto de um frame para o outro, então
+    os frames de uma sessão precisam chegar sempre ao mesmo processo. Com
+    vários workers do gunicorn, cada frame pode cair num worker diferente:
+    as sessões ficam num único processo à parte e os workers encaminham os
+    frames para ele. Endereço e chave vão para o ambiente, herdado pelos
+    workers. Retorna o subprocess.Popen do servidor (ver stop_stream_server).
+
+    É um processo comum, não um filho do multiprocessing: os workers
+    herdariam o filho e tentariam dar join nele ao sair.
+
+    Todas as sessões são processadas nesse único processo (uma thread por
+    conexão, disputando o mesmo GIL), então a vazão de frames do /verify/stream
+    não cresce com o número de workers: o teto é o que um processo decodifica
+    e passa pelo detector e pelo FaceMesh por segundo. Para mais vazão, rode
+    mais instâncias da API, cada uma com seu servidor, com roteamento sticky
+    por session_id no balanceador.
+    """
+    directory = tempfile.mkdtemp(prefix="faceid-stream-")
+    address = os.path.join(directory, "sessions.sock")
+    authkey = os.urandom(16)
+
+    os.environ[STREAM_SERVER_ADDRESS] = address
+    os.environ[STREAM_SERVER_AUTHKEY] = authkey.hex()
+
+    # O servidor importa o pacote pelos mesmos caminhos do processo atual
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    process = subprocess.Popen([sys.executable, "-m", "faceid.stream_session"], env=env)
+
+    deadline = time.monotonic() + STREAM_SERVER_START_TIMEOUT
+    while True:
+        try:
+            _connect(address, authkey)
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            if process.poll() is not None or time.monotonic() > deadline:
+                stop_stream_server(process)
+                raise RuntimeError(f"Stream session server did not start at {address}")
+            time.sleep(0.05)
+
+    logger.info("Stream session server started at %s (pid %d)", address, process.pid)
+    return process
+
+
+def stop_stream_server(process):
+    process.terminate()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+    address = os.environ.pop(STREAM_SERVER_ADDRESS, None)
+    os.environ.pop(STREAM_SERVER_AUTHKEY, None)
+    if address:
+        shutil.rmtree(os.path.dirname(address), ignore_errors=True)
+
+
+def connect_stream_server():
+    """Proxy do gerenciador de sessões do servidor, ou None se nenhum servidor foi iniciado"""
+    address = os.environ.get(STREAM_SERVER_ADDRESS)
+    if not address:
+        return None
+
+    return _connect(address, bytes.fromhex(os.environ[STREAM_SERVER_AUTHKEY])).sessions()
+
+
+if __name__ == "__main__":
+    from .log import configure_logging
+
+    configure_logging()
+    address = os.environ[STREAM_SERVER_ADDRESS]
+    _StreamManager(address, bytes.fromhex(os.environ[STREAM_SERVER_AUTHKEY])).get_server().serve_forever()
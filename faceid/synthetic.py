@@ -0,0 +1,94 @@
+import os
+import cv2
+import numpy as np
+
+# Tamanho das imagens sintéticas (o mesmo das imagens do dataset antes do crop)
+SYNTHETIC_IMAGE_SIZE = 400
+
+
+def random_identity(rng):
+    """Proporções fixas de uma "pessoa" sintética (formato do rosto, olhos, nariz, boca)"""
+    return {
+        "face_w": rng.uniform(0.19, 0.25),
+        "face_h": rng.uniform(0.27, 0.33),
+        "skin": rng.uniform(150, 210),
+        "eye_x": rng.uniform(0.36, 0.48),
+        "eye_y": rng.uniform(0.15, 0.25),
+        "eye_size": rng.uniform(0.18, 0.26),
+        "brow": rng.uniform(0.04, 0.07),
+        "nose": rng.uniform(0.14, 0.22),
+        "mouth_w": rng.uniform(0.3, 0.5),
+        "mouth_y": rng.uniform(0.45, 0.55),
+    }
+
+
+def draw_face(identity, rng, size=SYNTHETIC_IMAGE_SIZE):
+    """Desenha uma foto (RGB) da identidade com posição, escala, iluminação e ruído variando.
+
+    Não é um rosto realista, mas tem o contraste olhos/sobrancelhas/nariz
+    que o Haar cascade procura, então passa pelo mesmo caminho de detecção,
+    crop e encoding de uma foto real.
+    """
+    img = np.full((size, size), rng.uniform(100, 150), dtype=np.float32)
+
+    scale = rng.uniform(0.9, 1.1)
+    cx = size // 2 + int(rng.integers(-size // 20, size // 20 + 1))
+    cy = size // 2 + int(rng.integers(-size // 20, size // 20 + 1))
+    fw = int(size * identity["face_w"] * scale)
+    fh = int(size * identity["face_h"] * scale)
+    skin = identity["skin"] + rng.uniform(-15, 15)
+
+    cv2.ellipse(img, (cx, cy), (fw, fh), 0, 0, 360, skin, -1)
+
+    ex = int(fw * identity["eye_x"])
+    ey = cy - int(fh * identity["eye_y"])
+    for side in (-1, 1):
+        eye_center = (cx + side * ex, ey)
+        cv2.ellipse(img, (eye_center[0], ey - int(fh * 0.17)), (int(fw * 0.3), max(1, int(fh * identity["brow"]))),
+                    0, 180, 360, skin - 110, -1)
+        cv2.ellipse(img, eye_center, (int(fw * identity["eye_size"]), int(fh * 0.09)), 0, 0, 360, 245, -1)
+        cv2.circle(img, eye_center, int(fh * 0.07), 30, -1)
+
+    cv2.ellipse(img, (cx, cy + int(fh * 0.1)), (int(fw * 0.12), int(fh * identity["nose"])), 0, 0, 360, skin + 25, -1)
+    cv2.ellipse(img, (cx, cy + int(fh * identity["mouth_y"])), (int(fw * identity["mouth_w"]), int(fh * 0.08)),
+                0, 0, 360, skin - 80, -1)
+
+    img = cv2.GaussianBlur(img, (0, 0), size / 150)
+    img = np.clip(img + rng.normal(0, 6, img.shape), 0, 255).astype(np.uint8)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+
+
+def synthetic_faces(persons, images, seed=0, accept=None, max_attempts=20):
+    """{person_id: [RGB, ...]} com `images` fotos de cada uma de `persons` pessoas.
+
+    Com a mesma seed o resultado é sempre o mesmo. accept(image_rgb), se
+    informado, filtra as fotos (ex.: só as que o detector encontra); cada
+    foto tem até max_attempts tentativas.
+    """
+    rng = np.random.default_rng(seed)
+    faces = {}
+
+    for p in range(persons):
+        identity = random_identity(rng)
+        person_images = []
+
+        for _ in range(images * max_attempts):
+            if len(person_images) == images:
+                break
+            image_rgb = draw_face(identity, rng)
+            if accept is None or accept(image_rgb):
+                person_images.append(image_rgb)
+
+        faces[f"synthetic{p:05d}"] = person_images
+
+    return faces
+
+
+def write_synthetic_dataset(dataset_path, faces):
+    """Grava as fotos no layout do dataset (dataset/<person_id>/<person_id>_<n>.jpg)"""
+    for person_id, person_images in faces.items():
+        person_path = os.path.join(dataset_path, person_id)
+        os.makedirs(person_path, exist_ok=True)
+
+        for i, image_rgb in enumerate(person_images, start=1):
+            cv2.imwrite(os.path.join(person_path, f"{person_id}_{i}.jpg"), cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR))
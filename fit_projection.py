@@ -0,0 +1,119 @@
+"""
+Script para ajustar a projeção (PCA / aleatória) dos encodings OpenCV
+
+Extrai os encodings crus (100x100 pixels) de todas as imagens do dataset,
+ajusta a projeção, salva em models/opencv/opencv_projection.npz e retreina
+todas as pessoas no espaço projetado. Também imprime a troca
+velocidade/precisão: acurácia do vizinho mais próximo, latência de busca e
+memória por encoding, antes e depois da projeção.
+"""
+
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from faceid.dataset import scan_person_images
+from faceid.distance import as_matrix, euclidean_distances
+from faceid.gallery import Gallery
+from faceid.model import FaceModel
+from faceid.opencv_trainer import ENCODING_SIZE, OpenCVFaceTrainer
+from faceid.projection import Projection, default_projection_path
+
+def collect_raw_encodings(trainer, dataset_path="dataset"):
+    """Encodings crus de todas as imagens do dataset, com o person_id de cada um"""
+    encodings = []
+    labels = []
+
+    for person_id in sorted(os.listdir(dataset_path)):
+        person_path = os.path.join(dataset_path, person_id)
+        if not os.path.isdir(person_path):
+            continue
+
+        for image_file in scan_person_images(person_path):
+            image = cv2.imread(os.path.join(person_path, image_file))
+            if image is None:
+                continue
+
+            encoding = trainer.extract_face_encoding(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), project=False)
+            if encoding is not None:
+                encodings.append(encoding)
+                labels.append(person_id)
+
+    return encodings, labels
+
+def nearest_neighbor_accuracy(data, labels):
+    """Acurácia leave-one-out do vizinho mais próximo e latência média por busca (ms)"""
+    labels = np.asarray(labels, dtype=object)
+
+    start = time.perf_counter()
+    distances = euclidean_distances(data, data)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(data)
+
+    np.fill_diagonal(distances, np.inf)
+    nearest = np.argmin(distances, axis=1)
+
+    return float(np.mean(labels[nearest] == labels)), latency_ms
+
+def projection_report(projection, encodings, labels):
+    """Compara o espaço de pixels com o espaço projetado"""
+    raw = as_matrix(encodings)
+    projected = projection.transform(raw)
+
+    raw_accuracy, raw_ms = nearest_neighbor_accuracy(raw, labels)
+    projected_accuracy, projected_ms = nearest_neighbor_accuracy(projected, labels)
+
+    print(f"\n📊 TROCA VELOCIDADE / PRECISÃO ({len(raw)} encodings)")
+    print(f"   Pixels:    {raw.shape[1]:>6} dims, {raw.shape[1]:>6} bytes/encoding, "
+          f"NN acc {raw_accuracy:.1%}, {raw_ms:.3f} ms/busca")
+    print(f"   Projetado: {projected.shape[1]:>6} dims, {projected.shape[1] * 4:>6} bytes/encoding, "
+          f"NN acc {projected_accuracy:.1%}, {projected_ms:.3f} ms/busca")
+    print(f"   Threshold: {FaceModel.DISTANCE_THRESHOLD} -> {FaceModel.DISTANCE_THRESHOLD * projection.distance_scale:.1f} "
+          f"(distance_scale {projection.distance_scale:.4f})")
+
+def fit_projection(dataset_path="dataset", kind="pca", n_components=256, seed=0,
+                   output=None, retrain=True):
+    """Ajusta, salva e (opcionalmente) retreina todas as pessoas com a nova projeção"""
+
+    print(f"🔧 AJUSTE DA PROJEÇÃO ({kind}, {n_components} dims)")
+    print("=" * 50)
+
+    output = output or default_projection_path()
+    encoding_dim = ENCODING_SIZE[0] * ENCODING_SIZE[1]
+    raw_trainer = OpenCVFaceTrainer(gallery=Gallery(encoding_dim=encoding_dim, load=False))
+
+    encodings, labels = collect_raw_encodings(raw_trainer, dataset_path)
+    if len(encodings) < 2:
+        print("❌ Poucos encodings no dataset para ajustar a projeção")
+        return None
+
+    if kind == "pca":
+        projection = Projection.fit_pca(encodings, n_components)
+    else:
+        projection = Projection.random(encoding_dim, n_components, seed=seed, encodings=encodings)
+
+    projection.save(output)
+    print(f"✅ Projeção salva em {output} ({projection.fingerprint})")
+
+    projection_report(projection, encodings, labels)
+
+    if retrain:
+        # Cada projeção tem seu namespace de modelos: todas as pessoas são codificadas de novo
+        trainer = OpenCVFaceTrainer(gallery=Gallery(encoding_dim=projection.n_components, load=False), projection=projection)
+        persons = sorted(set(labels))
+        trained = sum(1 for person_id in persons if trainer.train_person(person_id, dataset_path))
+        print(f"\n🏁 {trained}/{len(persons)} pessoas retreinadas no espaço projetado")
+
+    return projection
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ajusta a projeção dos encodings OpenCV")
+    parser.add_argument("--dataset", default="dataset", help="Diretório do dataset")
+    parser.add_argument("--kind", choices=Projection.KINDS, default="pca", help="Tipo de projeção")
+    parser.add_argument("--components", type=int, default=256, help="Dimensões após a projeção (128-512)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed da projeção aleatória")
+    parser.add_argument("--output", default=None, help="Arquivo .npz da projeção (padrão: models/opencv/)")
+    parser.add_argument("--no-retrain", action="store_true", help="Não retreinar os modelos")
+    args = parser.parse_args()
+
+    fit_projection(args.dataset, args.kind, args.components, args.seed, args.output, retrain=not args.no_retrain)
@@ -0,0 +1,91 @@
+"""
+Configuração do gunicorn (pre-fork com preload_app)
+
+Variáveis de ambiente:
+    GUNICORN_WORKERS   número de processos (padrão: 2)
+    GUNICORN_THREADS   threads por processo (padrão: 4)
+    GUNICORN_TIMEOUT   timeout por requisição em segundos (padrão: 120)
+    PORT               porta HTTP (padrão: 3000)
+
+O pool de encoding de cada worker é configurado por ENCODE_POOL_WORKERS,
+ENCODE_POOL_QUEUE e ENCODE_TIMEOUT (ver api_opencv.py).
+
+Com FACEID_METRICS_DIR o /metrics soma os histogramas de todos os workers
+(padrão: metrics/ quando há mais de um worker).
+
+Com mais de um worker, as sessões do /verify/stream ficam num processo
+servidor iniciado pelo master: qualquer worker pode receber o próximo
+frame de uma sessão, sem roteamento sticky no balanceador.
+"""
+
+import glob
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '3000')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+# Carrega o app (modelos, galeria) uma vez no master, antes do fork
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+
+# Um grafo do MediaPipe por thread do worker (ver MediaPipeFaceTrainer)
+os.environ.setdefault("MEDIAPIPE_POOL_SIZE", str(threads))
+
+# Processos de encoding divididos entre os workers
+os.environ.setdefault("ENCODE_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) // workers)))
+
+# Snapshots das métricas de cada worker, somados pelo /metrics (ver faceid/metrics.py)
+if workers > 1:
+    os.environ.setdefault("FACEID_METRICS_DIR", "metrics")
+
+
+# Servidor das sessões de stream (iniciado em on_starting)
+_stream_server = None
+
+
+def on_starting(server):
+    global _stream_server
+
+    # Sem o GalleryStore cada worker tem uma galeria própria em memória e não
+    # enxerga cadastros feitos pelos outros workers
+    if workers > 1 and not os.environ.get("FACEID_GALLERY_STORE"):
+        server.log.warning("GUNICORN_WORKERS > 1 without FACEID_GALLERY_STORE: "
+                           "workers will not see persons registered by other workers")
+
+    # Contadores começam do zero a cada start do servidor (snapshots de workers
+    # que morreram durante a execução continuam somando até o próximo start)
+    metrics_dir = os.environ.get("FACEID_METRICS_DIR")
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json*")):
+            os.remove(path)
+
+    # Sessões de stream num processo único, compartilhado pelos workers
+    if workers > 1:
+        from faceid.stream_session import start_stream_server
+        _stream_server = start_stream_server()
+        server.log.info("Stream sessions served by pid %s", _stream_server.pid)
+
+
+def on_exit(server):
+    if _stream_server is not None:
+        from faceid.stream_session import stop_stream_server
+        stop_stream_server(_stream_server)
+
+
+def post_fork(server, worker):
+    # Threads não sobrevivem ao fork: fila de retreino e executores são
+    # criados sob demanda dentro de cada worker
+    server.log.info(f"Worker {worker.pid} forked from preloaded master")
+
+    # Cada worker tem seu próprio pool de processos de encoding
+    from api_opencv import start_encode_pool
+    start_encode_pool()
+
+    # O worker herda as observações do warm-up feito no master; sem zerar,
+    # elas seriam somadas uma vez por worker no /metrics
+    from faceid.metrics import REGISTRY
+    REGISTRY.reset()
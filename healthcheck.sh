@@ -13,7 +13,7 @@ if ! docker-compose ps | grep -q "facerecognition-api.*Up"; then
 fi
 
 # Fazer uma requisição simples para verificar se a API responde
-if curl -f -s "${API_URL}" > /dev/null 2>&1; then
+if curl -f -s "${API_URL}/health/ready" > /dev/null 2>&1; then
     echo "✅ API está respondendo em ${API_URL}"
     echo "📡 Status: Healthy"
 else
@@ -0,0 +1,113 @@
+"""
+Benchmark: LBPH x distância entre pixels
+
+Usa os encodings crus dos modelos OpenCV (pixels 100x100). Parte das faces
+de cada pessoa vira consulta e o resto vira galeria; para os dois métodos
+mede a acurácia top-1, a latência média por consulta e a memória por face.
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+from faceid.distance import as_matrix, euclidean_distances, min_by_segment
+from faceid.lbph import LBPHMatcher
+from faceid.model import FaceModel
+from faceid.opencv_trainer import ENCODING_SIZE, PIXEL_FEATURES
+from faceid.registry import MODEL_SUFFIX, ModelRegistry
+
+def load_raw_encodings(model_dir="."):
+    """{person_id: encodings} só com os encodings crus (10.000 pixels)"""
+    encoding_dim = ENCODING_SIZE[0] * ENCODING_SIZE[1]
+    persons = {}
+
+    for model_file in sorted(os.listdir(model_dir)):
+        if not model_file.endswith(MODEL_SUFFIX):
+            continue
+
+        model = FaceModel(os.path.join(model_dir, model_file))
+        encodings = [e for e in model.known_face_encodings if np.asarray(e).size == encoding_dim]
+        if encodings:
+            persons[model_file[:-len(MODEL_SUFFIX)]] = encodings
+
+    return persons
+
+def split_probes(persons, holdout_every=4):
+    """Separa uma a cada `holdout_every` faces como consulta (pessoas com 2+ faces)"""
+    gallery = {}
+    probes = []
+
+    for person_id, encodings in persons.items():
+        if len(encodings) < 2:
+            gallery[person_id] = encodings
+            continue
+
+        held = set(range(0, len(encodings), holdout_every))
+        if len(held) == len(encodings):
+            held = {0}
+
+        gallery[person_id] = [e for i, e in enumerate(encodings) if i not in held]
+        probes.extend((person_id, encodings[i]) for i in sorted(held))
+
+    return gallery, probes
+
+def benchmark_pixels(gallery, probes):
+    person_order = list(gallery)
+    matrix = as_matrix([e for p in person_order for e in gallery[p]])
+    starts = np.cumsum([0] + [len(gallery[p]) for p in person_order[:-1]])
+
+    hits = 0
+    start = time.perf_counter()
+    for person_id, probe in probes:
+        per_person = min_by_segment(euclidean_distances(np.asarray(probe, dtype=np.float32), matrix), starts)
+        hits += person_order[int(np.argmin(per_person))] == person_id
+    latency_ms = (time.perf_counter() - start) * 1000 / len(probes)
+
+    return hits / len(probes), latency_ms, matrix.shape[1]
+
+def benchmark_lbph(gallery, probes, path):
+    matcher = LBPHMatcher(path, ENCODING_SIZE)
+    matcher.rebuild(gallery)
+
+    hits = 0
+    start = time.perf_counter()
+    for person_id, probe in probes:
+        distances = matcher.min_distances(probe)
+        hits += min(distances, key=distances.get) == person_id
+    latency_ms = (time.perf_counter() - start) * 1000 / len(probes)
+
+    histogram_bytes = matcher.recognizer.getHistograms()[0].nbytes
+    return hits / len(probes), latency_ms, histogram_bytes
+
+def run_benchmark(model_dir=".", holdout_every=4):
+    print("🏁 BENCHMARK LBPH x PIXELS")
+    print("=" * 50)
+
+    persons = load_raw_encodings(model_dir)
+    gallery, probes = split_probes(persons, holdout_every)
+
+    if len(gallery) < 2 or not probes:
+        print("❌ São necessárias pelo menos 2 pessoas e alguma pessoa com 2+ faces")
+        return None
+
+    print(f"Galeria: {len(gallery)} pessoas, {sum(len(e) for e in gallery.values())} faces; {len(probes)} consultas")
+
+    pixel_acc, pixel_ms, pixel_bytes = benchmark_pixels(gallery, probes)
+    lbph_acc, lbph_ms, lbph_bytes = benchmark_lbph(gallery, probes, os.path.join(model_dir, "lbph_benchmark.yml"))
+
+    print(f"\n📊 Pixels: top-1 {pixel_acc:.1%}, {pixel_ms:.3f} ms/consulta, {pixel_bytes} bytes/face")
+    print(f"📊 LBPH:   top-1 {lbph_acc:.1%}, {lbph_ms:.3f} ms/consulta, {lbph_bytes} bytes/face")
+
+    return {
+        "pixels": {"top1": pixel_acc, "latency_ms": pixel_ms, "bytes_per_face": pixel_bytes},
+        "lbph": {"top1": lbph_acc, "latency_ms": lbph_ms, "bytes_per_face": lbph_bytes},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara LBPH com a distância entre pixels")
+    parser.add_argument("--model-dir", default=ModelRegistry("opencv", PIXEL_FEATURES).path,
+                        help="Diretório com os arquivos *_model.pkl (padrão: namespace de pixels do OpenCV)")
+    parser.add_argument("--holdout-every", type=int, default=4, help="Uma a cada N faces vira consulta")
+    args = parser.parse_args()
+
+    run_benchmark(args.model_dir, args.holdout_every)
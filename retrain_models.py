@@ -1,76 +1,233 @@
 """
-Script para retreinar todos os modelos com MediaPipe
+Script para retreinar todos os modelos (MediaPipe e OpenCV)
 
-Este script retreina todos os modelos existentes usando MediaPipe
-para aproveitar a maior precisão e detecção superior.
+Retreino em massa não interativo: as pessoas do dataset são distribuídas
+entre processos, cada imagem é decodificada uma única vez para os dois
+backends e o progresso (com imagens/s) é impresso a cada pessoa. O
+andamento fica registrado em .retrain_progress.jsonl; se o processo for
+interrompido, rodar de novo com os mesmos parâmetros continua de onde parou.
+
+Uso:
+    python retrain_models.py                  # incremental, todos os backends
+    python retrain_models.py --full           # recodifica tudo (ex.: após atualizar bibliotecas)
+    python retrain_models.py --workers 8 --backends opencv
+    python retrain_models.py --compare        # só compara a detecção dos dois sistemas
 """
 
+import argparse
+import json
 import os
-from faceid.mediapipe_trainer import MediaPipeFaceTrainer
-from faceid.opencv_trainer import OpenCVFaceTrainer
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from faceid.dataset import IMAGE_EXTENSIONS
+from faceid.log import configure_logging
+
+BACKENDS = ("mediapipe", "opencv")
+
+# Pessoas já concluídas com sucesso no retreino atual (uma linha JSON por pessoa)
+PROGRESS_FILE = ".retrain_progress.jsonl"
+
+# Trainers de cada processo do pool, criados pelo initializer
+_trainers = {}
 
-def retrain_all_models():
-    """Retreina todos os modelos usando MediaPipe"""
+def _init_worker(backends):
+    # Nos processos do pool o log dos trainers fica em WARNING (a linha de
+    # progresso por pessoa já resume o treino); LOG_LEVEL=INFO mostra tudo
+    configure_logging(os.environ.get("LOG_LEVEL", "WARNING"))
     
-    print("🔄 RETREINAMENTO DE MODELOS")
-    print("=" * 50)
+    # LBPH e índice ANN são reconstruídos uma vez no final pelo processo principal
+    os.environ["FACEID_MATCHER"] = "pixels"
+    os.environ.pop("FACEID_ANN_MIN_ROWS", None)
     
-    # Inicializar trainers
-    mediapipe_trainer = MediaPipeFaceTrainer()
-    opencv_trainer = OpenCVFaceTrainer()
+    if "mediapipe" in backends:
+        from faceid.mediapipe_trainer import MediaPipeFaceTrainer
+        _trainers["mediapipe"] = MediaPipeFaceTrainer(pool_size=1)
     
-    # Encontrar todas as pessoas no dataset
-    dataset_path = "dataset"
+    if "opencv" in backends:
+        from faceid.gallery import Gallery
+        from faceid.opencv_trainer import OpenCVFaceTrainer
+        
+        # Sem GalleryStore ninguém consulta a galeria deste processo: começa vazia
+        # (com o store, os workers da API enxergam os modelos novos)
+        gallery = None if os.environ.get("FACEID_GALLERY_STORE") else Gallery(load=False)
+        _trainers["opencv"] = OpenCVFaceTrainer(gallery=gallery)
+
+def _train_person(person_id, dataset_path, incremental):
+    """Roda no processo do pool: treina uma pessoa em todos os backends"""
+    start = time.perf_counter()
+    
+    # Cache de decode compartilhado: cada imagem é lida do disco uma vez só
+    images = {}
+    results = {}
+    
+    for backend, trainer in _trainers.items():
+        try:
+            results[backend] = bool(trainer.train_person(person_id, dataset_path, incremental, images=images))
+        except Exception as e:
+            print(f"❌ {backend} falhou para {person_id}: {e}")
+            results[backend] = False
+        
+        # A galeria privada do processo só serve ao treino: liberar a memória da pessoa
+        # (pessoas sem mudanças são reconhecidas pelo arquivo do modelo, não pela galeria)
+        if backend == "opencv" and trainer.gallery.store is None:
+            trainer.gallery.remove_person(person_id)
+    
+    return {
+        "person_id": person_id,
+        "images": len(images),
+        "results": results,
+        "seconds": time.perf_counter() - start,
+    }
+
+def list_persons(dataset_path="dataset"):
+    """Pessoas do dataset com o número de imagens, das maiores para as menores"""
+    persons = []
+    
+    for person_id in os.listdir(dataset_path):
+        person_path = os.path.join(dataset_path, person_id)
+        if os.path.isdir(person_path):
+            count = sum(1 for f in os.listdir(person_path) if f.lower().endswith(IMAGE_EXTENSIONS))
+            persons.append((person_id, count))
+    
+    # Pessoas grandes primeiro: os processos terminam mais perto um do outro
+    persons.sort(key=lambda item: (-item[1], item[0]))
+    return persons
+
+def load_progress(run, progress_path=PROGRESS_FILE):
+    """Pessoas já concluídas por uma execução anterior com os mesmos parâmetros"""
+    if not os.path.exists(progress_path):
+        return set()
+    
+    with open(progress_path) as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    
+    try:
+        header = json.loads(lines[0]) if lines else None
+    except ValueError:
+        header = None
+    
+    if header != run:
+        print(f"⚠️  {progress_path} é de um retreino com outros parâmetros, começando do zero")
+        return set()
+    
+    done = set()
+    for line in lines[1:]:
+        try:
+            done.add(json.loads(line)["person_id"])
+        except (ValueError, KeyError):
+            # Última linha cortada por uma interrupção
+            continue
+    return done
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def retrain_all_models(dataset_path="dataset", workers=None, backends=BACKENDS, full=False,
+                       restart=False, progress_path=PROGRESS_FILE):
+    """Retreina todas as pessoas em paralelo; retorna o número de pessoas com falha"""
+    
+    print("🔄 RETREINAMENTO DE MODELOS")
+    print("=" * 50)
     
     if not os.path.exists(dataset_path):
         print("❌ Dataset folder não encontrado!")
-        return
+        return 0
     
-    # Listar todas as pastas de pessoas
-    person_folders = [f for f in os.listdir(dataset_path) 
-                     if os.path.isdir(os.path.join(dataset_path, f))]
+    workers = workers or os.cpu_count() or 1
+    run = {"dataset": os.path.abspath(dataset_path), "backends": list(backends), "full": full}
     
-    print(f"📁 Encontradas {len(person_folders)} pessoas no dataset:")
-    for person_id in person_folders:
-        print(f"   • {person_id}")
+    if restart and os.path.exists(progress_path):
+        os.remove(progress_path)
     
-    print("\n" + "="*50)
+    persons = list_persons(dataset_path)
+    done = load_progress(run, progress_path)
+    pending = [(p, n) for p, n in persons if p not in done]
     
-    # Retreinar cada pessoa
-    for i, person_id in enumerate(person_folders, 1):
-        print(f"\n🔄 RETREINANDO PESSOA {i}/{len(person_folders)}: {person_id}")
-        print("-" * 40)
-        
-        # Contar imagens no dataset
-        person_path = os.path.join(dataset_path, person_id)
-        images = [f for f in os.listdir(person_path) 
-                 if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        print(f"📸 Imagens disponíveis: {len(images)}")
-        
-        # Treinar com MediaPipe
-        print("🚀 Treinando com MediaPipe...")
-        mediapipe_success = mediapipe_trainer.train_person(person_id)
-        
-        # Treinar com OpenCV (para comparação)
-        print("🔧 Treinando com OpenCV...")
-        opencv_success = opencv_trainer.train_person(person_id)
-        
-        # Resultados
-        print(f"✅ MediaPipe: {'Sucesso' if mediapipe_success else 'Falhou'}")
-        print(f"🔧 OpenCV: {'Sucesso' if opencv_success else 'Falhou'}")
+    total_images = sum(n for _, n in pending)
+    print(f"📁 {len(persons)} pessoas no dataset, {len(done)} já concluídas, "
+          f"{len(pending)} pendentes ({total_images} imagens)")
+    print(f"⚙️  Backends: {', '.join(backends)} | processos: {workers} | "
+          f"{'recodificação completa' if full else 'incremental'}")
+    print("=" * 50)
+    
+    if not pending:
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        print("🏁 Nada a fazer")
+        return 0
+    
+    # Sem progresso anterior válido: começar um arquivo novo com o cabeçalho da execução
+    mode = "a" if done else "w"
+    progress = open(progress_path, mode)
+    if not done:
+        progress.write(json.dumps(run) + "\n")
+        progress.flush()
+    
+    # Ritmo e ETA contam as imagens planejadas de cada pessoa concluída, inclusive
+    # as que o retreino incremental não precisou decodificar de novo
+    planned = dict(pending)
+    failed = 0
+    images_done = 0
+    images_decoded = 0
+    start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tuple(backends),))
+    
+    try:
+        futures = [executor.submit(_train_person, person_id, dataset_path, not full) for person_id, _ in pending]
         
-        if mediapipe_success and opencv_success:
-            print("🎉 Ambos os modelos treinados com sucesso!")
-        elif mediapipe_success:
-            print("⚠️  Apenas MediaPipe foi bem-sucedido")
-        elif opencv_success:
-            print("⚠️  Apenas OpenCV foi bem-sucedido")
-        else:
-            print("❌ Ambos falharam - verificar dataset")
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            images_done += planned[result["person_id"]]
+            images_decoded += result["images"]
+            
+            ok = all(result["results"].values())
+            failed += not ok
+            
+            # Só sucessos: pessoas com falha são tentadas de novo ao continuar
+            if ok:
+                progress.write(json.dumps(result) + "\n")
+                progress.flush()
+            
+            elapsed = time.perf_counter() - start
+            rate = images_done / elapsed if elapsed > 0 else 0.0
+            eta = (total_images - images_done) / rate if rate > 0 else 0.0
+            status = " ".join(f"{b} {'✅' if r else '❌'}" for b, r in result["results"].items())
+            
+            print(f"[{i}/{len(pending)}] {result['person_id']}: {planned[result['person_id']]} imagens "
+                  f"({result['images']} decodificadas) | {status} | "
+                  f"{rate:.1f} img/s | ETA {format_duration(eta)}")
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        progress.close()
+        print(f"\n⏸️  Interrompido. Rode de novo com os mesmos parâmetros para continuar "
+              f"({progress_path})")
+        raise
+    
+    executor.shutdown()
+    progress.close()
     
+    elapsed = time.perf_counter() - start
     print("\n" + "="*50)
-    print("🏁 RETREINAMENTO CONCLUÍDO!")
+    print(f"🏁 RETREINAMENTO CONCLUÍDO: {len(pending)} pessoas, {images_done} imagens "
+          f"({images_decoded} decodificadas) em {format_duration(elapsed)} "
+          f"({images_done / elapsed:.1f} img/s), {failed} com falha")
     print("="*50)
+    
+    if failed:
+        # O progresso fica: rodar de novo tenta só as pessoas com falha
+        print(f"🔁 Rode de novo com os mesmos parâmetros para tentar de novo só as pessoas com falha ({progress_path})")
+    else:
+        # Execução completa: a próxima começa do zero
+        os.remove(progress_path)
+    
+    if "opencv" in backends and os.environ.get("FACEID_MATCHER") == "lbph":
+        # O construtor reconstrói o recognizer LBPH a partir dos modelos novos
+        from faceid.opencv_trainer import OpenCVFaceTrainer
+        OpenCVFaceTrainer()
+    
+    return failed
 
 def compare_detection_results():
     """Compara quantas faces cada sistema detecta"""
@@ -82,6 +239,9 @@ def compare_detection_results():
     person_folders = [f for f in os.listdir(dataset_path) 
                      if os.path.isdir(os.path.join(dataset_path, f))]
     
+    from faceid.mediapipe_trainer import MediaPipeFaceTrainer
+    from faceid.opencv_trainer import OpenCVFaceTrainer
+    
     mediapipe_trainer = MediaPipeFaceTrainer()
     opencv_trainer = OpenCVFaceTrainer()
     
@@ -137,20 +297,29 @@ def compare_detection_results():
         print(f"   📊 Ambos detectaram o mesmo número de rostos")
 
 if __name__ == "__main__":
-    print("🎯 ANÁLISE E RETREINAMENTO DE MODELOS")
-    print("=" * 50)
-    
-    # Primeiro comparar detecção
-    compare_detection_results()
+    parser = argparse.ArgumentParser(description="Retreina os modelos de todas as pessoas do dataset")
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--workers", type=int, default=None, help="processos (padrão: número de CPUs)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="mediapipe,opencv")
+    parser.add_argument("--full", action="store_true", help="recodifica todas as imagens, não só as novas")
+    parser.add_argument("--restart", action="store_true", help="ignora o progresso de uma execução interrompida")
+    parser.add_argument("--compare", action="store_true", help="só compara a detecção dos dois sistemas")
+    args = parser.parse_args()
     
-    # Perguntar se quer retreinar
-    print(f"\n❓ Deseja retreinar todos os modelos? (y/n): ", end="")
-    choice = input().lower().strip()
+    configure_logging()
     
-    if choice in ['y', 'yes', 's', 'sim']:
-        retrain_all_models()
+    if args.compare:
+        print("🎯 ANÁLISE DE DETECÇÃO")
+        print("=" * 50)
+        compare_detection_results()
     else:
-        print("ℹ️  Retreinamento cancelado.")
-        print("💡 Você pode retreinar individualmente usando:")
-        print("   mediapipe_trainer.train_person('person_id')")
-        print("   opencv_trainer.train_person('person_id')")
+        backends = tuple(b.strip() for b in args.backends.split(",") if b.strip())
+        unknown = set(backends) - set(BACKENDS)
+        if unknown:
+            parser.error(f"backends desconhecidos: {', '.join(sorted(unknown))}")
+        
+        try:
+            failed = retrain_all_models(args.dataset, args.workers, backends, args.full, args.restart)
+        except KeyboardInterrupt:
+            raise SystemExit(130)
+        raise SystemExit(1 if failed else 0)
@@ -0,0 +1,50 @@
+from faceid.dataset import plan_incremental_update, unchanged_images
+
+
+def signature(mtime_ns, size):
+    return {"mtime_ns": mtime_ns, "size": size}
+
+
+def test_unchanged_images_are_kept_and_new_ones_encoded():
+    known = [{"image_file": "a.jpg", "mtime_ns": 1, "size": 10}]
+    current = {"a.jpg": signature(1, 10), "b.jpg": signature(2, 20)}
+
+    assert plan_incremental_update(known, current) == ([0], ["b.jpg"])
+
+
+def test_changed_and_removed_images():
+    known = [
+        {"image_file": "a.jpg", "mtime_ns": 1, "size": 10},
+        {"image_file": "b.jpg", "mtime_ns": 2, "size": 20},
+        {"image_file": "gone.jpg", "mtime_ns": 3, "size": 30},
+    ]
+    current = {"a.jpg": signature(1, 10), "b.jpg": signature(5, 20)}
+
+    keep, new_files = plan_incremental_update(known, current)
+
+    assert keep == [0]
+    assert new_files == ["b.jpg"]
+
+
+def test_legacy_entries_without_signature_are_reencoded_once():
+    known = [{"image_file": "a.jpg"}, {"image_file": "a.jpg"}]
+    current = {"a.jpg": signature(1, 10)}
+
+    assert plan_incremental_update(known, current) == ([], ["a.jpg"])
+
+
+def test_duplicate_entries_keep_only_the_first():
+    known = [
+        {"image_file": "a.jpg", "mtime_ns": 1, "size": 10},
+        {"image_file": "a.jpg", "mtime_ns": 1, "size": 10},
+    ]
+
+    assert plan_incremental_update(known, {"a.jpg": signature(1, 10)}) == ([0], [])
+
+
+def test_images_without_face_are_skipped_until_they_change():
+    no_face = {"blank.jpg": {"mtime_ns": 1, "size": 10}, "gone.jpg": {"mtime_ns": 2, "size": 20}}
+
+    assert plan_incremental_update([], {"blank.jpg": signature(1, 10)}, no_face) == ([], [])
+    assert plan_incremental_update([], {"blank.jpg": signature(3, 10)}, no_face) == ([], ["blank.jpg"])
+    assert unchanged_images(no_face, {"blank.jpg": signature(1, 10)}) == {"blank.jpg": {"mtime_ns": 1, "size": 10}}
@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pytest
+from faceid.gallery import Gallery
+from faceid.mediapipe_model import MediaPipeFaceModel
+from faceid.model import FaceModel
+from faceid.model_format import read_model_file
+from faceid.opencv_trainer import OpenCVFaceTrainer, SIMILARITY_DIVISOR
+
+
+@pytest.fixture
+def opencv():
+    # Só os thresholds importam para decide_match: sem galeria nem detector
+    trainer = object.__new__(OpenCVFaceTrainer)
+    trainer.distance_threshold = FaceModel.DISTANCE_THRESHOLD
+    trainer.similarity_divisor = SIMILARITY_DIVISOR
+    return trainer
+
+
+@pytest.fixture(scope="module")
+def reference_encodings():
+    """Encodings reais das duas pessoas dos *_model.pkl do repositório"""
+    root = os.path.join(os.path.dirname(__file__), os.pardir)
+    return {
+        person_id: np.stack([np.asarray(e).ravel() for e in read_model_file(os.path.join(root, f"{person_id}_model.pkl"))["encodings"]])
+        for person_id in ("00000000000000001", "02520051000006006")
+    }
+
+
+def gallery_of(persons):
+    gallery = Gallery(load=False)
+    for person_id, encodings in persons.items():
+        gallery.update_person(person_id, list(encodings), [{"person_id": person_id}] * len(encodings))
+    return gallery
+
+
+@pytest.fixture
+def mediapipe():
+    from faceid.mediapipe_trainer import MediaPipeFaceTrainer
+    return object.__new__(MediaPipeFaceTrainer)
+
+
+def test_opencv_empty_gallery(opencv):
+    assert opencv.decide_match("alice", {}) == (False, 0.0)
+
+
+def test_opencv_single_person_uses_threshold_only(opencv):
+    is_match, similarity = opencv.decide_match("alice", {"alice": 5000})
+    assert is_match
+    assert similarity == pytest.approx(1 - 5000 / SIMILARITY_DIVISOR)
+
+    assert not opencv.decide_match("alice", {"alice": 7000})[0]
+
+
+def test_opencv_requires_margin_over_second_best(opencv):
+    assert opencv.decide_match("alice", {"alice": 3000, "bob": 5000})[0]
+    # Margem de 20%, abaixo dos 30% exigidos
+    assert not opencv.decide_match("alice", {"alice": 4000, "bob": 5000})[0]
+
+
+def test_opencv_best_match_must_be_the_claimed_person(opencv):
+    is_match, similarity = opencv.decide_match("alice", {"alice": 5000, "bob": 2000})
+    assert not is_match
+    assert similarity == pytest.approx(1 - 2000 / SIMILARITY_DIVISOR)
+
+
+def test_opencv_rejects_impostors_of_the_reference_models(opencv, reference_encodings):
+    for person_id, other_id in (reference_encodings, reversed(list(reference_encodings))):
+        # Só a pessoa alegada na galeria: vale apenas o threshold
+        gallery = gallery_of({person_id: reference_encodings[person_id]})
+        for encoding in reference_encodings[other_id]:
+            assert not opencv.decide_match(person_id, gallery.min_distances(encoding))[0]
+
+
+def test_opencv_accepts_genuine_probes_of_the_reference_models(opencv, reference_encodings):
+    for person_id, encodings in reference_encodings.items():
+        for i, encoding in enumerate(encodings):
+            # Cada foto contra as outras fotos da pessoa e a outra pessoa inteira
+            persons = dict(reference_encodings)
+            persons[person_id] = np.delete(encodings, i, axis=0)
+            distances_by_person = gallery_of(persons).min_distances(encoding)
+
+            assert opencv.decide_match(person_id, distances_by_person)[0]
+            other_id = next(p for p in persons if p != person_id)
+            assert not opencv.decide_match(other_id, distances_by_person)[0]
+
+
+def test_mediapipe_threshold_is_scaled(mediapipe):
+    threshold = MediaPipeFaceModel.DISTANCE_THRESHOLD * 0.8
+
+    assert mediapipe.decide_match("alice", {"alice": threshold - 0.01})[0]
+    assert not mediapipe.decide_match("alice", {"alice": threshold + 0.01})[0]
+
+
+def test_mediapipe_requires_margin(mediapipe):
+    assert mediapipe.decide_match("alice", {"alice": 0.1, "bob": 0.4})[0]
+    assert not mediapipe.decide_match("alice", {"alice": 0.3, "bob": 0.35})[0]
+    assert not mediapipe.decide_match("alice", {"alice": 0.4, "bob": 0.1})[0]
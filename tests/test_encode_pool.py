@@ -0,0 +1,29 @@
+import os
+import signal
+import pytest
+from faceid.encode_pool import EncodePool, EncodePoolRestarting
+from faceid.image_utils import encode_jpeg
+from faceid.synthetic import synthetic_faces
+
+
+@pytest.fixture
+def pool():
+    pool = EncodePool(workers=1, queue_size=2, timeout=30)
+    yield pool
+    pool.close()
+
+
+def test_dead_process_restarts_the_pool(pool):
+    image_data = encode_jpeg(next(iter(synthetic_faces(1, 1, seed=5).values()))[0])
+    pool.process(image_data)
+
+    for process in list(pool._executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+    # A requisição que encontra o pool quebrado recebe 503; as seguintes usam o pool novo
+    with pytest.raises(EncodePoolRestarting):
+        pool.process(image_data)
+
+    assert pool.process(image_data) is not None
+    assert pool.stats()["restarts"] == 1
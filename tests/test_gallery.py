@@ -0,0 +1,68 @@
+import threading
+import numpy as np
+from faceid.gallery import ANN_REBUILD_GROWTH, Gallery
+
+DIM = 32
+
+
+def random_persons(rng, prefix, count, rows=4):
+    return {f"{prefix}{i}": (list(rng.normal(size=(rows, DIM)).astype(np.float32)), None) for i in range(count)}
+
+
+def test_ann_is_built_and_retrained_as_the_gallery_grows(tmp_path):
+    rng = np.random.default_rng(0)
+    gallery = Gallery(str(tmp_path), encoding_dim=DIM)
+    gallery.enable_ann(min_rows=200, n_lists=8, n_subvectors=4)
+
+    gallery.update_persons(random_persons(rng, "a", 40))
+    assert gallery.ann is None
+
+    # Atingiu o mínimo: o índice nasce no próprio update, sem reiniciar o processo
+    gallery.update_persons(random_persons(rng, "b", 20))
+    first = gallery.ann
+    assert first is not None
+    assert len(first) == gallery.get_face_count()
+
+    # Crescimento pequeno só sincroniza as pessoas novas no índice existente
+    gallery.update_persons(random_persons(rng, "c", 10))
+    assert gallery.ann is first
+    assert len(first) == gallery.get_face_count()
+
+    gallery.update_persons(random_persons(rng, "d", ANN_REBUILD_GROWTH * 60))
+    assert gallery.ann is not first
+    assert len(gallery.ann) == gallery.get_face_count()
+
+    probe = gallery.get_encodings("d7")[0]
+    assert gallery.search(probe, k=1)[0][0] == "d7"
+
+
+def test_ann_search_during_updates_reads_consistent_lists(tmp_path):
+    rng = np.random.default_rng(1)
+    gallery = Gallery(str(tmp_path), encoding_dim=DIM)
+    gallery.update_persons(random_persons(rng, "a", 60))
+    gallery.build_ann(n_lists=4, n_subvectors=4, nprobe=4)
+
+    probes = [gallery.get_encodings(f"a{i}")[0] for i in range(10)]
+    errors = []
+    done = threading.Event()
+
+    def search():
+        while not done.is_set():
+            for probe in probes:
+                try:
+                    # Códigos e labels de versões diferentes de uma lista quebram a busca (IndexError)
+                    assert all(p.startswith("a") for p in gallery.ann.search(probe, n_candidates=1000))
+                except Exception as e:
+                    errors.append(e)
+
+    reader = threading.Thread(target=search)
+    reader.start()
+    try:
+        # Retreinos trocam os encodings de uma pessoa (e o tamanho das listas) sem parar as buscas
+        for i in range(300):
+            gallery.update_person(f"a{i % 60}", list(rng.normal(size=(1 + i % 7, DIM)).astype(np.float32)))
+    finally:
+        done.set()
+        reader.join()
+
+    assert errors == []
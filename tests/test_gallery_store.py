@@ -0,0 +1,175 @@
+import os
+import numpy as np
+from faceid import gallery_store
+from faceid.gallery_store import GalleryStore
+
+DIM = 8
+
+
+def rows(value, count=2):
+    return [np.full(DIM, value, dtype=np.uint8) for _ in range(count)]
+
+
+def test_put_and_reopen(tmp_path):
+    path = str(tmp_path / "gallery.bin")
+    store = GalleryStore(path, DIM)
+    store.put_person("alice", rows(1), [{"image_file": "a1.jpg"}, {"image_file": "a2.jpg"}])
+    store.put_person("bob", rows(2, 3))
+
+    reopened = GalleryStore(path, DIM)
+    encodings, metadata = reopened.get_person("alice")
+
+    assert sorted(reopened.person_ids()) == ["alice", "bob"]
+    np.testing.assert_array_equal(encodings, np.stack(rows(1)))
+    assert metadata == [{"image_file": "a1.jpg"}, {"image_file": "a2.jpg"}]
+    assert len(reopened.get_person("bob")[0]) == 3
+
+
+def test_compact_drops_dead_rows_and_keeps_live_ones(tmp_path):
+    path = str(tmp_path / "gallery.bin")
+    store = GalleryStore(path, DIM)
+    store.put_person("alice", rows(1, 4))
+    store.put_person("bob", rows(2, 4))
+    store.put_person("alice", rows(3, 3))
+
+    assert store.dead_rows() == 4
+
+    store.compact()
+
+    assert store.dead_rows() == 0
+    assert len(store.matrix) == 7
+
+    reopened = GalleryStore(path, DIM)
+    np.testing.assert_array_equal(reopened.get_person("alice")[0], np.stack(rows(3, 3)))
+    np.testing.assert_array_equal(reopened.get_person("bob")[0], np.stack(rows(2, 4)))
+
+
+def test_other_instance_sees_changes_after_refresh(tmp_path):
+    path = str(tmp_path / "gallery.bin")
+    writer = GalleryStore(path, DIM)
+    reader = GalleryStore(path, DIM)
+
+    writer.put_person("alice", rows(1))
+    assert reader.refresh()
+    assert reader.has_person("alice")
+
+    writer.remove_person("alice")
+    assert reader.refresh()
+    assert not reader.has_person("alice")
+
+
+def test_repeated_retrains_keep_the_file_bounded(tmp_path):
+    path = str(tmp_path / "gallery.bin")
+    store = GalleryStore(path, DIM)
+    store.put_person("alice", rows(1, 5))
+    store.put_person("bob", rows(2, 5))
+
+    for i in range(50):
+        store.put_person("alice", rows(i, 5))
+
+        index, matrix = store.state()
+        data_size = os.path.getsize(os.path.join(str(tmp_path), index["data_file"]))
+        # Nunca mais que o dobro das linhas vivas (mais o bloco recém-anexado)
+        assert len(matrix) <= 2 * 10 + 5
+        assert data_size == len(matrix) * DIM
+
+    reopened = GalleryStore(path, DIM)
+    np.testing.assert_array_equal(reopened.get_person("alice")[0], np.stack(rows(49, 5)))
+    np.testing.assert_array_equal(reopened.get_person("bob")[0], np.stack(rows(2, 5)))
+    # Os arquivos de dados antigos são removidos a cada compactação
+    assert len([f for f in os.listdir(str(tmp_path)) if not f.endswith((".json", ".lock")) and ".journal." not in f]) == 1
+
+
+def test_store_with_another_dim_is_rebuilt(tmp_path):
+    path = str(tmp_path / "gallery.bin")
+    GalleryStore(path, DIM).put_person("alice", rows(1))
+
+    store = GalleryStore(path, DIM * 2, np.float32)
+
+    assert store.person_ids() == []
+    store.put_person("bob", [np.ones(DIM * 2, dtype=np.float32)])
+    assert GalleryStore(path, DIM * 2, np.float32).person_ids() == ["bob"]
+
+
+def test_writes_append_to_the_journal_instead_of_rewriting_the_index(tmp_path):
+    path = str(tmp_path / "gallery.bin")
+    writer = GalleryStore(path, DIM)
+    writer.put_person("alice", rows(1))
+    reader = GalleryStore(path, DIM)
+    base = os.stat(writer.index_path)
+
+    for i in range(20):
+        writer.put_person(f"p{i}", rows(i), [{"image_file": f"{i}.jpg"}] * 2)
+
+    # O índice base continua o mesmo arquivo: só o journal cresceu
+    assert os.stat(writer.index_path).st_ino == base.st_ino
+    assert reader.refresh()
+    assert len(reader.person_ids()) == 21
+    assert reader.get_person("p7")[1] == [{"image_file": "7.jpg"}] * 2
+    assert reader.generation == writer.generation
+
+
+def test_journal_is_folded_into_a_new_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(gallery_store, "JOURNAL_CHECKPOINT_BYTES", 512)
+    path = str(tmp_path / "gallery.bin")
+    store = GalleryStore(path, DIM)
+
+    for i in range(30):
+        store.put_person(f"p{i}", rows(i))
+
+    index, _ = store.state()
+    journals = [f for f in os.listdir(str(tmp_path)) if ".journal." in f]
+    # Um único journal (o do base atual), menor que o limite
+    assert journals in ([], [index["journal"]])
+    assert sum(os.path.getsize(str(tmp_path / f)) for f in journals) < 512 + 200
+    assert sorted(GalleryStore(path, DIM).person_ids()) == sorted(f"p{i}" for i in range(30))
+
+
+def test_interrupted_journal_write_is_ignored_and_discarded(tmp_path):
+    path = str(tmp_path / "gallery.bin")
+    store = GalleryStore(path, DIM)
+    store.put_person("alice", rows(1))
+    store.put_person("bob", rows(2))
+
+    index, _ = store.state()
+    with open(str(tmp_path / index["journal"]), "ab") as f:
+        f.write(b'{"rows":99,"persons":{"carol"')
+
+    reader = GalleryStore(path, DIM)
+    assert sorted(reader.person_ids()) == ["alice", "bob"]
+
+    reader.put_person("dave", rows(4))
+    assert sorted(GalleryStore(path, DIM).person_ids()) == ["alice", "bob", "dave"]
+
+
+def test_refresh_gives_up_while_the_index_keeps_changing(tmp_path, monkeypatch):
+    path = str(tmp_path / "gallery.bin")
+    GalleryStore(path, DIM).put_person("alice", rows(1))
+    store = GalleryStore(path, DIM)
+    GalleryStore(path, DIM).put_person("bob", rows(2))
+
+    def vanished(*args):
+        raise FileNotFoundError("journal replaced")
+
+    monkeypatch.setattr(store, "_read_journal", vanished)
+    monkeypatch.setattr(store, "_stat_base", lambda: object())
+
+    # Mantém a versão atual em vez de repetir para sempre
+    assert not store.refresh()
+    assert store.person_ids() == ["alice"]
+
+
+def test_store_loaded_model_saves_only_to_the_given_path(tmp_path, monkeypatch):
+    from faceid.model import FaceModel
+    monkeypatch.chdir(tmp_path)
+    store = GalleryStore(str(tmp_path / "gallery.bin"), DIM)
+    store.put_person("alice", rows(1))
+
+    # Sem caminho do registry o modelo é só leitura: nada vai para o diretório de trabalho
+    assert not FaceModel.from_store(store, "alice").save_model()
+    assert not os.path.exists("alice_model.pkl")
+
+    model_path = str(tmp_path / "opencv" / "alice_model.pkl")
+    os.makedirs(os.path.dirname(model_path))
+    assert FaceModel.from_store(store, "alice", model_path).save_model()
+    assert FaceModel(model_path).get_face_count() == 2
@@ -0,0 +1,18 @@
+from faceid.image_cache import AnalyzedImage, ImageCache
+from faceid.image_utils import DEFAULT_PADDING
+
+
+def test_key_depends_on_bytes_and_padding():
+    key = ImageCache.key(b"image", DEFAULT_PADDING)
+
+    assert key == ImageCache.key(b"image", DEFAULT_PADDING)
+    assert key != ImageCache.key(b"image", 20)
+    assert key != ImageCache.key(b"other", DEFAULT_PADDING)
+
+
+def test_crops_with_different_padding_do_not_share_an_entry():
+    cache = ImageCache()
+    cache.put(ImageCache.key(b"image", DEFAULT_PADDING), AnalyzedImage(None, (0, 0, 10, 10), b"crop"))
+
+    assert cache.get(ImageCache.key(b"image", 20)) is None
+    assert cache.get(ImageCache.key(b"image", DEFAULT_PADDING)).crop_jpeg == b"crop"
@@ -0,0 +1,61 @@
+import pickle
+import numpy as np
+import pytest
+from faceid.model_format import (
+    MAGIC, ModelFormatError, deserialize_model, is_binary_model, read_model_file, serialize_model, write_model_file,
+)
+
+
+def test_round_trip_keeps_encodings_metadata_and_dtype(tmp_path):
+    encodings = [np.arange(6, dtype=np.uint8), np.arange(6, 12, dtype=np.uint8)]
+    metadata = [{"image_file": "a.jpg", "size": 10}, {"image_file": "b.jpg"}]
+    path = str(tmp_path / "p_model.pkl")
+
+    write_model_file(path, encodings, metadata, model_type="opencv")
+    data = read_model_file(path)
+
+    assert is_binary_model(path)
+    assert data["format_version"] == 1
+    assert data["model_type"] == "opencv"
+    assert data["encodings"].dtype == np.uint8
+    np.testing.assert_array_equal(data["encodings"], np.stack(encodings))
+    # Chaves ausentes continuam ausentes (não viram None)
+    assert data["metadata"] == metadata
+
+
+def test_mixed_lengths_are_returned_without_padding():
+    encodings = [np.ones(160, dtype=np.float32), np.full(384, 0.5, dtype=np.float32)]
+    data = deserialize_model(serialize_model(encodings, [{}, {}], model_type="mediapipe"))
+
+    assert isinstance(data["encodings"], list)
+    assert [len(e) for e in data["encodings"]] == [160, 384]
+    np.testing.assert_array_equal(data["encodings"][1], encodings[1])
+
+
+def test_empty_model_round_trip():
+    data = deserialize_model(serialize_model([], []))
+    assert len(data["encodings"]) == 0
+    assert data["metadata"] == []
+
+
+def test_legacy_pickle_is_still_read(tmp_path):
+    path = tmp_path / "legacy_model.pkl"
+    encodings = [np.arange(4, dtype=np.uint8)]
+    with open(path, "wb") as f:
+        pickle.dump({"encodings": encodings, "metadata": [{"image_file": "x.jpg"}]}, f)
+
+    data = read_model_file(str(path))
+
+    assert not is_binary_model(str(path))
+    assert data["format_version"] == 0
+    assert data["model_type"] is None
+    np.testing.assert_array_equal(data["encodings"][0], encodings[0])
+    assert data["metadata"] == [{"image_file": "x.jpg"}]
+
+
+def test_truncated_file_is_rejected():
+    buffer = serialize_model([np.zeros(8, dtype=np.uint8)], [{}])
+    assert buffer.startswith(MAGIC)
+
+    with pytest.raises(ModelFormatError):
+        deserialize_model(buffer[:-12])
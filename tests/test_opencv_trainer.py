@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+
+from faceid.image_utils import decode_image_bytes, encode_jpeg_base64
+from faceid.synthetic import synthetic_faces
+
+
+@pytest.fixture(scope="module")
+def enrolled(tmp_path_factory):
+    """Três pessoas sintéticas cadastradas pelo mesmo caminho do /register"""
+    root = tmp_path_factory.mktemp("opencv")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("FACEID_MODELS_DIR", str(root / "models"))
+        mp.setenv("FACEID_IMAGE_CACHE_SIZE", "0")
+        mp.delenv("FACEID_GALLERY_STORE", raising=False)
+        mp.delenv("FACEID_MATCHER", raising=False)
+        mp.chdir(root)
+
+        from faceid.opencv_trainer import OpenCVFaceTrainer
+        trainer = OpenCVFaceTrainer()
+
+        faces = synthetic_faces(3, 4, seed=5, accept=lambda image: trainer.detect_face(image) is not None)
+        for person_id, images in faces.items():
+            saved = trainer.save_base64_images(person_id, [encode_jpeg_base64(image) for image in images[:3]], str(root / "dataset"))
+            assert len(saved) == 3
+            assert trainer.train_person(person_id, str(root / "dataset"))
+
+        yield trainer, faces, str(root / "dataset")
+
+
+def test_verify_encodes_the_same_crop_as_training(enrolled):
+    trainer, faces, _ = enrolled
+
+    for person_id, images in faces.items():
+        encoding = trainer.encode_base64_image(encode_jpeg_base64(images[0]), person_id)
+        distance = trainer.gallery.min_distances(encoding, include=(person_id,))[person_id]
+        # A imagem cadastrada vira o mesmo crop JPEG do dataset: mesmo encoding,
+        # a menos de arredondamentos do decoder (distância típica entre fotos: milhares)
+        assert distance < 10
+
+
+def test_training_crop_is_used_directly(enrolled):
+    trainer, faces, _ = enrolled
+    person_id, images = next(iter(faces.items()))
+
+    detection = trainer.detect_face(images[0])
+    crop = decode_image_bytes(detection.crop_jpeg)
+
+    assert np.array_equal(trainer.extract_face_encoding(images[0]), trainer.extract_face_encoding(crop))
+
+
+def test_unchanged_person_is_not_saved_again(enrolled, monkeypatch):
+    from faceid.gallery import Gallery
+    from faceid.model import FaceModel
+    from faceid.opencv_trainer import OpenCVFaceTrainer
+    _, faces, dataset_path = enrolled
+
+    saves = []
+    monkeypatch.setattr(FaceModel, "save_model", lambda model: saves.append(model.model_path) or True)
+
+    # Como nos processos do retrain_models.py: galeria própria, vazia
+    trainer = OpenCVFaceTrainer(gallery=Gallery(load=False))
+    for person_id in faces:
+        assert trainer.train_person(person_id, dataset_path)
+        trainer.gallery.remove_person(person_id)
+
+    assert saves == []
+
+
+def test_image_without_face_is_not_decoded_again_until_it_changes(enrolled, monkeypatch):
+    trainer, faces, dataset_path = enrolled
+    person_path = os.path.join(dataset_path, "noface")
+    os.makedirs(person_path)
+    cv2.imwrite(os.path.join(person_path, "face.jpg"), cv2.cvtColor(next(iter(faces.values()))[0], cv2.COLOR_RGB2BGR))
+    blank_path = os.path.join(person_path, "blank.jpg")
+    cv2.imwrite(blank_path, np.full((240, 240, 3), 128, dtype=np.uint8))
+
+    assert trainer.train_person("noface", dataset_path)
+
+    encoded = []
+    extract_face_encoding = trainer.extract_face_encoding
+    monkeypatch.setattr(trainer, "extract_face_encoding", lambda image: encoded.append(image) or extract_face_encoding(image))
+
+    # Mesma assinatura: a imagem sem rosto não é lida nem passa pelo detector de novo
+    assert trainer.train_person("noface", dataset_path)
+    assert encoded == []
+
+    os.utime(blank_path, ns=(0, os.stat(blank_path).st_mtime_ns + 1))
+    assert trainer.train_person("noface", dataset_path)
+    assert len(encoded) == 1
+
+
+def test_concurrent_batches_share_one_executor(enrolled, monkeypatch):
+    from faceid import opencv_trainer
+    from faceid.gallery import Gallery
+
+    created = []
+
+    class SlowExecutor(opencv_trainer.ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            # Alarga a janela entre o teste de None e a atribuição
+            time.sleep(0.05)
+            created.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(opencv_trainer, "ThreadPoolExecutor", SlowExecutor)
+    trainer = opencv_trainer.OpenCVFaceTrainer(gallery=Gallery(load=False))
+
+    threads = [threading.Thread(target=trainer._get_batch_executor) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    created[0].shutdown()
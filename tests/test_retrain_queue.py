@@ -0,0 +1,54 @@
+import threading
+from faceid.retrain_queue import RetrainQueue
+
+
+class BlockingTrainer:
+    """train_fn que segura o primeiro retreino até o teste liberar"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, person_id):
+        self.calls.append(person_id)
+        self.started.set()
+        self.release.wait(5)
+        return person_id != "broken"
+
+
+def test_repeated_requests_are_coalesced_while_queued():
+    trainer = BlockingTrainer()
+    retrain = RetrainQueue(trainer)
+
+    assert retrain.submit("alice") == RetrainQueue.QUEUED
+    assert trainer.started.wait(5)
+
+    # alice já saiu da fila e está treinando: um novo pedido volta a entrar
+    assert retrain.submit("alice") == RetrainQueue.QUEUED
+    assert retrain.submit("alice") == RetrainQueue.COALESCED
+    assert retrain.submit("bob") == RetrainQueue.QUEUED
+    assert retrain.submit("bob") == RetrainQueue.COALESCED
+
+    trainer.release.set()
+    retrain.join()
+
+    assert trainer.calls == ["alice", "alice", "bob"]
+    assert retrain.stats() == {"pending": 0, "completed": 3, "failed": 0, "coalesced": 2, "rejected": 0}
+
+
+def test_full_queue_rejects_and_failures_are_counted():
+    trainer = BlockingTrainer()
+    retrain = RetrainQueue(trainer, maxsize=1)
+
+    retrain.submit("first")
+    assert trainer.started.wait(5)
+
+    assert retrain.submit("broken") == RetrainQueue.QUEUED
+    assert retrain.submit("carol") == RetrainQueue.REJECTED
+
+    trainer.release.set()
+    retrain.join()
+
+    stats = retrain.stats()
+    assert (stats["completed"], stats["failed"], stats["rejected"]) == (1, 1, 1)
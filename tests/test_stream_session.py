@@ -0,0 +1,89 @@
+import pytest
+
+pytest.importorskip("mediapipe")
+
+from faceid.image_utils import decode_base64_image, encode_jpeg, encode_jpeg_base64
+from faceid.stream_session import InvalidFrame, StreamSession, StreamSessionManager
+from faceid.synthetic import synthetic_faces, write_synthetic_dataset
+
+
+@pytest.fixture(scope="module")
+def trained(tmp_path_factory):
+    root = tmp_path_factory.mktemp("stream")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("FACEID_MODELS_DIR", str(root / "models"))
+        mp.chdir(root)
+
+        from faceid.mediapipe_trainer import MediaPipeFaceTrainer
+        trainer = MediaPipeFaceTrainer(pool_size=1)
+
+        faces = synthetic_faces(3, 4, seed=3, accept=lambda image: trainer.detect_face(image) is not None)
+        write_synthetic_dataset(str(root / "dataset"), {p: images[:3] for p, images in faces.items()})
+        for person_id in faces:
+            assert trainer.train_person(person_id, str(root / "dataset"))
+
+        yield trainer, faces
+
+
+def test_stream_and_single_shot_give_the_same_distances(trained, monkeypatch):
+    trainer, faces = trained
+    person_id = next(iter(faces))
+    image_base64 = encode_jpeg_base64(faces[person_id][3])
+
+    seen = []
+    distances_by_person = trainer.distances_by_person
+    monkeypatch.setattr(trainer, "distances_by_person", lambda e: seen.append(distances_by_person(e)) or seen[-1])
+
+    trainer.verify_face(person_id, image_base64)
+    session = StreamSession("test", person_id, trainer.create_tracking_mesh())
+    try:
+        summary = session.process_frame(trainer, decode_base64_image(image_base64))
+    finally:
+        session.close()
+
+    assert summary["face_frames"] == 1
+    single_shot, stream = seen
+    assert stream.keys() == single_shot.keys()
+    for other, distance in single_shot.items():
+        assert stream[other] == pytest.approx(distance, rel=1e-5)
+
+
+def test_tracked_box_follows_the_face(trained):
+    trainer, faces = trained
+    person_id = next(iter(faces))
+    image_rgb = faces[person_id][3]
+
+    session = StreamSession("test", person_id, trainer.create_tracking_mesh())
+    try:
+        session.process_frame(trainer, image_rgb)
+        x, y, w, h = session._box
+        # O primeiro frame reproduz a caixa do detector
+        assert (x, y, w, h) == trainer.detect_face(image_rgb).box
+
+        shifted = image_rgb.copy()
+        shifted[:, 20:] = image_rgb[:, :-20]
+        summary = session.process_frame(trainer, shifted)
+    finally:
+        session.close()
+
+    assert summary["face_frames"] == 2
+    assert abs(session._box[0] - (x + 20)) <= 6
+    assert abs(session._box[1] - y) <= 6
+
+
+def test_manager_takes_encoded_frames(trained):
+    trainer, faces = trained
+    person_id = next(iter(faces))
+    manager = StreamSessionManager(trainer, trainer.create_tracking_mesh)
+
+    # Bytes que não são imagem não abrem sessão
+    with pytest.raises(InvalidFrame):
+        manager.start(person_id, b"not an image")
+    assert manager.active_count() == 0
+
+    summary = manager.start(person_id, encode_jpeg(faces[person_id][3]))
+    try:
+        assert summary["face_frames"] == 1
+        assert manager.step(summary["session_id"], encode_jpeg(faces[person_id][2]))["frames"] == 2
+    finally:
+        manager.finish(summary["session_id"])
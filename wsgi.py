@@ -0,0 +1,15 @@
+"""
+Entry point WSGI para produção (gunicorn)
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Com preload_app, este módulo é importado uma única vez no master: cascade,
+galeria e demais modelos são carregados e aquecidos antes do fork e os
+workers compartilham essa memória copy-on-write.
+"""
+
+from api_opencv import app, warm_up
+
+warm_up()
+
+application = app